@@ -0,0 +1,69 @@
+import tkinter as tk
+
+FRAME_MS = 16  # ~60 Hz: más rápido que esto la pantalla no lo muestra
+
+
+class DragPreview:
+    """
+    Ventana con el icono que sigue al puntero al arrastrar un bloque desde la barra.
+    Se crea una sola vez y se muestra/oculta; los eventos <Motion> solo guardan la última
+    posición y la ventana se mueve como máximo una vez por cuadro (on_move se llama igual).
+    """
+
+    def __init__(self, root, icons, offset=(10, 10), frame_ms=FRAME_MS, on_move=None):
+        self.root = root
+        self.icons = icons
+        self.offset = offset
+        self.frame_ms = frame_ms
+        self.on_move = on_move
+        self.action = None
+        self.win = None
+        self.label = None
+        self._pointer = None
+        self._job = None
+
+    @property
+    def visible(self):
+        return self.action is not None
+
+    def _create(self):
+        self.win = tk.Toplevel(self.root)
+        self.win.overrideredirect(True)
+        self.win.withdraw()
+        self.label = tk.Label(self.win, bg="white")
+        self.label.pack()
+
+    def show(self, action, x_root, y_root):
+        if self.win is None:
+            self._create()
+        self.action = action
+        self.label.configure(image=self.icons.photo(action))
+        self.win.geometry(f"+{x_root}+{y_root}")
+        self.win.deiconify()
+        self.win.lift()
+
+    def move(self, x_root, y_root):
+        if not self.visible:
+            return
+        self._pointer = (x_root, y_root)
+        if self._job is None:
+            self._job = self.root.after(self.frame_ms, self._flush)
+
+    def _flush(self):
+        self._job = None
+        if not self.visible or self._pointer is None:
+            return
+        x, y = self._pointer
+        self._pointer = None
+        self.win.geometry(f"+{x + self.offset[0]}+{y + self.offset[1]}")
+        if self.on_move:
+            self.on_move(x, y)
+
+    def hide(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        self._pointer = None
+        self.action = None
+        if self.win is not None:
+            self.win.withdraw()
@@ -0,0 +1,462 @@
+"""
+Banco de pruebas sin robot físico.
+
+Un robot simulado detrás de un pseudo-terminal (FakeRobot) reemplaza al HC-05: SerialWriter abre el pty
+con serial.Serial como si fuera el puerto real. Para BLE, FakeBleakClient ocupa el lugar del BleakClient
+dentro de un BleLink. Ambos tienen latencia y pérdida configurables (la pérdida afecta a las tramas
+binarias sin ACK en HC y a las escrituras GATT en BLE).
+
+Mide:
+    hc / ble        comandos por segundo y latencia por etapa (metricas.LatencyStats). En HC van de a uno
+                    (un movimiento nuevo reemplaza al pendiente); en BLE se encolan todos y el enlace
+                    los escribe en orden, como cuando el planificador se adelanta a la radio
+    planificador    error de cada paso respecto de su plazo (el mismo Engine que usa _execute_blocks)
+    primer_comando  tiempo desde Ejecutar (compilar la secuencia y disparar el primer paso) hasta que
+                    el primer byte llega al robot, con 10, 100 y 1000 bloques
+    lienzo          latencia de soltar y de arrastrar un bloque en control.py con 10, 100 y 1000 bloques
+                    (necesita tkinter, customtkinter y pantalla; si no, se omite)
+
+Los resultados se escriben en JSON por líneas (una cabecera y un registro por prueba) para comparar versiones:
+    python src/benchmark.py [--salida bench_output.txt] [--latencia-ms 0,5,20] [--perdida 0,0.05] [--rapido]
+    python src/benchmark.py --comparar base.txt [nuevo.txt]
+"""
+import argparse, asyncio, heapq, json, os, platform, pty, queue, random, select
+import statistics, subprocess, sys, tempfile, threading, time, tty
+from protocolo import FRAME_SIZE, FRAME_SYNC, ACK, HELLO, Step, decode_frame
+from modelo import Block, Sequence, Engine, CONTROL_PARAMS
+from metricas import LatencyStats
+
+FORMAT = "interfaz-blue-bench"
+FORMAT_VERSION = 1
+BLOCK_COUNTS = (10, 100, 1000)
+KINDS = ("Adelante", "Izquierda", "Reversa", "Derecha", "Velocidad", "Esperar", "Detener")
+
+
+# ---------- ROBOT SIMULADO (HC por pty) ----------
+class FakeRobot:
+    """
+    Firmware simulado en un hilo, del lado maestro de un pty; `port` es la ruta que abre serial.Serial.
+    Texto: cuenta cada letra de comando. Binario: contesta el saludo y el cambio de baudios y confirma
+    cada trama con ACK después de `latency_ms` (o no la confirma, con probabilidad `loss`).
+    """
+
+    def __init__(self, latency_ms=0.0, loss=0.0, binary=False, seed=1):
+        self.latency_s = latency_ms / 1000
+        self.loss = loss
+        self.binary = binary
+        self.random = random.Random(seed)
+        self.master, self._slave = pty.openpty()
+        tty.setraw(self._slave)  # sin eco ni edición de línea: bytes tal cual
+        self.port = os.ttyname(self._slave)
+        self.commands = 0
+        self.dropped = 0
+        self.first_at = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="fake-robot", daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        self.commands = self.dropped = 0
+        self.first_at = None
+
+    def _run(self):
+        buf = bytearray()
+        while not self._closed:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if self.first_at is None:
+                self.first_at = time.perf_counter()
+            buf += data
+            self._consume(buf)
+
+    def _consume(self, buf):
+        while buf:
+            if self.binary and buf[0] & 0xF0 == FRAME_SYNC:
+                if len(buf) < FRAME_SIZE:
+                    return
+                frame = decode_frame(bytes(buf[:FRAME_SIZE]))
+                del buf[:FRAME_SIZE]
+                if frame is None:
+                    continue
+                if self.random.random() < self.loss:
+                    self.dropped += 1
+                    continue
+                self.commands += 1
+                if self.latency_s:
+                    time.sleep(self.latency_s)
+                os.write(self.master, bytes([ACK, frame[3]]))
+                continue
+            end = buf.find(b"\n")
+            if buf.startswith(HELLO) or buf.startswith(b"BAUD"):
+                if end < 0:
+                    return
+                line = bytes(buf[:end])
+                del buf[:end + 1]
+                if self.binary:
+                    os.write(self.master, b"BIN 115200\n" if line + b"\n" == HELLO else b"OK\n")
+                continue
+            # texto: la letra del comando, con o sin velocidad y salto de línea
+            byte = buf.pop(0)
+            if chr(byte) in "FBLRS":
+                self.commands += 1
+
+    def close(self):
+        self._closed = True
+        self._thread.join(timeout=1)
+        for fd in (self.master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+# ---------- CLIENTE BLE SIMULADO ----------
+class FakeBleakClient:
+    """Lo que BleLink usa de BleakClient; write_gatt_char tarda `latency_ms` y falla (o se pierde) con `loss`."""
+
+    def __init__(self, latency_ms=0.0, loss=0.0, seed=1):
+        self.latency_s = latency_ms / 1000
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.address = "00:00:00:00:BE:EF"
+        self.is_connected = True
+        self.writes = 0
+        self.dropped = 0
+
+    async def write_gatt_char(self, char, data, response=True):
+        # sin respuesta no se espera al robot: solo el tiempo de poner el paquete en el aire
+        await asyncio.sleep(self.latency_s if response else self.latency_s / 4)
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            if response:
+                raise OSError("escritura GATT perdida (simulada)")
+            return
+        self.writes += 1
+
+    async def disconnect(self):
+        self.is_connected = False
+
+
+# ---------- after() SIN Tk ----------
+class MiniLoop:
+    """after(ms, fn, *args) con un heap de plazos; run() los atiende en este hilo como lo haría mainloop()."""
+
+    def __init__(self):
+        self.heap = []
+        self._n = 0
+
+    def after(self, ms, fn, *args):
+        self._n += 1
+        heapq.heappush(self.heap, (time.monotonic() + ms / 1000, self._n, fn, args))
+        return self._n
+
+    def run(self, until, timeout=60.0):
+        limit = time.monotonic() + timeout
+        while self.heap and not until() and time.monotonic() < limit:
+            t, _, fn, args = heapq.heappop(self.heap)
+            delay = t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            fn(*args)
+
+
+# ---------- UTILIDADES ----------
+def percentiles(values):
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(values)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "max_ms": ordered[-1]}
+
+
+def stage_results(stats, transport):
+    return {f"{stage}_{name}": round(value, 3)
+            for t, stage, _, p50, p95, p99, _max in stats.summary() if t == transport
+            for name, value in (("p50_ms", p50), ("p95_ms", p95), ("p99_ms", p99))}
+
+
+def wait_for(cond, timeout):
+    limit = time.perf_counter() + timeout
+    while not cond():
+        if time.perf_counter() > limit:
+            return False
+        time.sleep(0.0005)
+    return True
+
+
+def make_sequence(n):
+    blocks = [Block(KINDS[i % len(KINDS)], None, CONTROL_PARAMS) for i in range(n)]
+    return Sequence("Banco", blocks, initial_speed=5)
+
+
+# ---------- PRUEBAS ----------
+def bench_hc(n, latency_ms, loss, binary):
+    from enlace_serial import SerialWriter
+    robot = FakeRobot(latency_ms, loss, binary)
+    events = queue.Queue()
+    stats = LatencyStats()
+    writer = SerialWriter(robot.port, events, binary=binary, newline=False,
+                          ack_timeout=max(0.25, 4 * latency_ms / 1000))
+    try:
+        if binary and not wait_for(lambda: not events.empty(), 5):  # ("protocol", ...) tras el saludo
+            raise RuntimeError("el robot simulado no respondió al saludo")
+        t0 = time.perf_counter()
+        for i in range(n):
+            # de a uno: un comando de movimiento nuevo reemplazaría al que aún espera en la cola
+            writer.send_command("F", 255, 100, trace=stats.begin("HC", "F"))
+            if not wait_for(lambda: len(stats.traces) > i, 10):
+                break
+        elapsed = time.perf_counter() - t0
+        if not binary:
+            wait_for(lambda: robot.commands >= n, 2)
+        done = len(stats.traces)
+        results = {"comandos": done, "cmds_s": round(done / elapsed, 1), "entregados": round(robot.commands / n, 3)}
+        results.update(stage_results(stats, "HC"))
+        return results
+    finally:
+        writer.close()
+        time.sleep(0.05)
+        robot.close()
+
+
+def bench_ble(n, latency_ms, loss, without_response):
+    from enlace_ble import LoopThread, BleLink
+    loop = LoopThread()
+    events = queue.Queue()
+    stats = LatencyStats()
+    client = FakeBleakClient(latency_ms, loss)
+    link = BleLink(loop, events)
+    # conexión ya hecha: el banco mide el camino de escritura, no el descubrimiento de servicios
+    link.client, link.write_char, link.without_response = client, "fake-char", without_response
+    try:
+        t0 = time.perf_counter()
+        futures = [link.send_command("F", 255, 100, trace=stats.begin("BLE", "F")) for _ in range(n)]
+        for f in futures:
+            try:
+                f.result(timeout=30)
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - t0
+        results = {"comandos": n, "cmds_s": round(n / elapsed, 1), "entregados": round(client.writes / n, 3)}
+        results.update(stage_results(stats, "BLE"))
+        return results
+    finally:
+        loop.stop()
+
+
+class NullTransport:
+    def __init__(self):
+        self.sent = 0
+
+    def send_command(self, cmd, speed=None, duration_ms=0):
+        self.sent += 1
+
+
+def bench_scheduler(steps, step_ms, transport):
+    loop = MiniLoop()
+    robot = writer = None
+    if transport == "HC":
+        from enlace_serial import SerialWriter
+        robot = FakeRobot()
+        writer = SerialWriter(robot.port, queue.Queue(), newline=False)
+        target = writer
+    else:
+        target = NullTransport()
+    try:
+        engine = Engine(target, loop.after)
+        plan = [Step("FBLR"[i % 4], 255, step_ms, None) for i in range(steps)]
+        scheduler = engine.run_steps(plan)
+        loop.run(lambda: not engine.running, timeout=steps * step_ms / 1000 + 10)
+        lateness = scheduler.lateness_ms
+        results = {"pasos": steps, "paso_ms": step_ms}
+        results.update({f"desfase_{k}": round(v, 3) for k, v in percentiles(lateness).items()})
+        results["total_error_ms"] = round((scheduler.runtime_ms or 0) - scheduler.programmed_ms, 3)
+        return results
+    finally:
+        if writer is not None:
+            writer.close()
+            time.sleep(0.05)
+            robot.close()
+
+
+def bench_first_command(blocks, trials=5):
+    from enlace_serial import SerialWriter
+    robot = FakeRobot()
+    writer = SerialWriter(robot.port, queue.Queue(), newline=False)
+    loop = MiniLoop()
+    engine = Engine(writer, loop.after)
+    times = []
+    try:
+        for _ in range(trials):
+            robot.reset()
+            t0 = time.perf_counter()
+            engine.run(make_sequence(blocks))  # lo mismo que hace _run_sequence tras leer el lienzo
+            if wait_for(lambda: robot.first_at is not None, 5):
+                times.append((robot.first_at - t0) * 1000)
+            engine.cancel()
+            time.sleep(0.02)
+        return {"bloques": blocks, "primer_comando_ms": round(statistics.median(times), 3) if times else None}
+    finally:
+        writer.close()
+        time.sleep(0.05)
+        robot.close()
+
+
+def bench_canvas(blocks, light, moves=50):
+    # diario, dispositivos conocidos y demás en un directorio aparte: el banco no toca los datos del usuario
+    os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="interfaz-blue-bench-")
+    import control
+    app = control.DragDropApp(light_blocks=light)
+    try:
+        app.update()
+        last = max(1, min(20, blocks))
+        for i in range(blocks - last):
+            app._add_block(KINDS[i % len(KINDS)], 60 + (i % 12) * 90, 60 + (i // 12) * 90)
+        app.update()
+        drops = []
+        for i in range(blocks - last, blocks):
+            t0 = time.perf_counter()
+            app._add_block(KINDS[i % len(KINDS)], 60 + (i % 12) * 90, 60 + (i // 12) * 90)
+            app.update_idletasks()
+            blk = list(app.blocks.values())[-1]
+            app._drop_block(blk)
+            app.update_idletasks()
+            drops.append((time.perf_counter() - t0) * 1000)
+        app.update()
+        blk = list(app.blocks.values())[-1]
+        drags = []
+        for i in range(moves):
+            t0 = time.perf_counter()
+            app._move_block(blk, 3 if i % 2 else -3, 0, reorder=False)
+            app.update_idletasks()
+            drags.append((time.perf_counter() - t0) * 1000)
+        results = {"bloques": blocks, "ligero": light}
+        results.update({f"soltar_{k}": round(v, 3) for k, v in percentiles(drops).items()})
+        results.update({f"arrastrar_{k}": round(v, 3) for k, v in percentiles(drags).items()})
+        return results
+    finally:
+        app._on_close()
+
+
+# ---------- EJECUCIÓN Y SALIDA ----------
+def header():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"formato": FORMAT, "version": FORMAT_VERSION, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit, "python": platform.python_version(), "plataforma": platform.platform()}
+
+
+def run_all(args):
+    latencies = [float(x) for x in args.latencia_ms.split(",")]
+    losses = [float(x) for x in args.perdida.split(",")]
+    n = 50 if args.rapido else args.n
+    plan = []
+    for latency in latencies:
+        for loss in losses:
+            for binary in (False, True):
+                if loss and not binary:
+                    continue  # en texto no hay ACK: la pérdida no se ve desde el host
+                plan.append(("hc", {"latencia_ms": latency, "perdida": loss, "binario": binary},
+                             lambda l=latency, p=loss, b=binary: bench_hc(n, l, p, b)))
+            for without_response in (False, True):
+                plan.append(("ble", {"latencia_ms": latency, "perdida": loss, "sin_respuesta": without_response},
+                             lambda l=latency, p=loss, w=without_response: bench_ble(n, l, p, w)))
+    steps = 50 if args.rapido else 200
+    for transport in ("nulo", "HC"):
+        plan.append(("planificador", {"transporte": transport, "pasos": steps, "paso_ms": 10},
+                     lambda t=transport: bench_scheduler(steps, 10, t)))
+    for blocks in BLOCK_COUNTS:
+        plan.append(("primer_comando", {"bloques": blocks}, lambda b=blocks: bench_first_command(b)))
+    for light in (False, True):
+        for blocks in BLOCK_COUNTS:
+            plan.append(("lienzo", {"bloques": blocks, "ligero": light},
+                         lambda b=blocks, l=light: bench_canvas(b, l)))
+
+    records = []
+    for name, params, fn in plan:
+        if args.solo and name not in args.solo.split(","):
+            continue
+        try:
+            results = fn()
+        except ImportError as e:
+            results = {"omitido": f"falta {e.name}"}
+        except Exception as e:
+            results = {"error": f"{type(e).__name__}: {e}"}
+        records.append({"prueba": name, "parametros": params, "resultados": results})
+        print(f"{name:<15}{json.dumps(params, ensure_ascii=False):<60}{json.dumps(results, ensure_ascii=False)}")
+    with open(args.salida, "w", encoding="utf-8") as f:
+        for rec in [header()] + records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    print(f"Resultados en {args.salida}")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        head = json.loads(f.readline())
+        if head.get("formato") != FORMAT:
+            raise ValueError(f"{path} no es una salida del banco de pruebas")
+        return head, {(r["prueba"], json.dumps(r["parametros"], sort_keys=True)): r["resultados"]
+                      for r in map(json.loads, filter(str.strip, f))}
+
+
+def higher_is_better(metric):
+    return metric.endswith("_s") or metric == "entregados"
+
+
+def compare(base_path, new_path, threshold=0.10):
+    """Compara cada métrica numérica; marca con ⚠ lo que empeoró más de `threshold`."""
+    base_head, base = load(base_path)
+    new_head, new = load(new_path)
+    print(f"base {base_head.get('commit')} ({base_head.get('fecha')}) -> nuevo {new_head.get('commit')} "
+          f"({new_head.get('fecha')})")
+    regressions = 0
+    for key, results in new.items():
+        old = base.get(key)
+        if old is None:
+            continue
+        for metric, value in results.items():
+            before = old.get(metric)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not isinstance(before, (int, float)):
+                continue
+            if before == 0:
+                continue
+            change = (value - before) / abs(before)
+            worse = -change if higher_is_better(metric) else change
+            mark = "⚠" if worse > threshold else " "
+            regressions += mark == "⚠"
+            print(f"{mark} {key[0]:<15}{key[1]:<60}{metric:<22}{before:>10.3f} -> {value:>10.3f} ({change:+.0%})")
+    print(f"{regressions} métricas empeoraron más de {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas con robot simulado (pty y BLE falso)")
+    parser.add_argument("--salida", default="bench_output.txt")
+    parser.add_argument("--latencia-ms", default="0,5,20", help="latencias del enlace simulado, separadas por comas")
+    parser.add_argument("--perdida", default="0,0.05", help="probabilidades de pérdida, separadas por comas")
+    parser.add_argument("--n", type=int, default=300, help="comandos por prueba de enlace")
+    parser.add_argument("--rapido", action="store_true", help="menos comandos y pasos")
+    parser.add_argument("--solo", help="pruebas a correr: hc,ble,planificador,primer_comando,lienzo")
+    parser.add_argument("--comparar", nargs="+", metavar="ARCHIVO",
+                        help="base.txt [nuevo.txt]: compara con la salida anterior (nuevo por defecto: --salida)")
+    args = parser.parse_args(argv)
+    if args.comparar:
+        new_path = args.comparar[1] if len(args.comparar) > 1 else args.salida
+        return 1 if compare(args.comparar[0], new_path) else 0
+    run_all(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
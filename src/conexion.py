@@ -1,14 +1,14 @@
 import customtkinter as ctk
-from PIL import Image, ImageTk, ImageDraw
-import os, asyncio, threading, serial, serial.tools.list_ports, tkinter as tk
-from bleak import BleakScanner
+import queue, serial, tkinter as tk
+from protocolo import BAUD_DEFAULT
+from enlace_ble import LoopThread
+from descubrimiento import DeviceDiscovery
+from iconos import IconSet
+from arrastre import DragPreview
 
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
-ROOT_DIR = os.path.dirname(__file__)
-IMAGES_DIR = os.path.join(ROOT_DIR, "imagenes")
-
 
 class DragDropApp(ctk.CTk):
     def __init__(self):
@@ -21,44 +21,16 @@ class DragDropApp(ctk.CTk):
         self.bt_connected = False
         self.serial_port = None
         self.selected_device = None
-        self.icons = {}
-        self.icons_pil = {}
+        self.link_events = queue.Queue()
+        self.ble_loop = LoopThread()
+        self.discovery = DeviceDiscovery(self.ble_loop, self.link_events, ble_named_only=True)
+        self.device_rows = {}
 
-        self._load_icons()
+        self.icons = IconSet()  # atlas en caché; PhotoImage compartida por icono
+        self.preview = DragPreview(self, self.icons)  # una sola ventana, movida a lo sumo una vez por cuadro
         self._build_ui()
-
-    # ---------- ICONOS ----------
-    def _load_icon_safe(self, fname, size=(55, 55)):
-        p = os.path.join(IMAGES_DIR, fname)
-        try:
-            pil = Image.open(p).convert("RGBA")
-            pil.thumbnail(size, Image.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=pil, dark_image=pil, size=size)
-            return ctk_img, pil
-        except Exception:
-            ph = Image.new("RGBA", size, (220, 220, 220, 255))
-            draw = ImageDraw.Draw(ph)
-            draw.rectangle((5, 5, size[0]-5, size[1]-5), outline=(180, 180, 180))
-            draw.text((8, 8), fname.split(".")[0][:6], fill=(80, 80, 80))
-            return ctk.CTkImage(light_image=ph, dark_image=ph, size=size), ph
-
-    def _load_icons(self):
-        mapping = {
-            "Velocidad": "velocidad.png",
-            "Adelante": "adelante.png",
-            "Izquierda": "izquierda.png",
-            "Derecha": "derecha.png",
-            "Reversa": "reversa.png",
-            "Detener": "detener.png",
-            "Esperar": "esperar.png",
-            "Bluetooth": "bluetooth.png",
-            "Ejecutar": "ejecutar.png",
-            "Limpiar": "limpiar.png"
-        }
-        for k, f in mapping.items():
-            ctk_img, pil_img = self._load_icon_safe(f)
-            self.icons[k] = ctk_img
-            self.icons_pil[k] = pil_img
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(50, self._poll_link_events)
 
     # ---------- UI ----------
     def _build_ui(self):
@@ -109,23 +81,15 @@ class DragDropApp(ctk.CTk):
     # ---------- DRAG & DROP ----------
     def _start_drag(self, event, action):
         self.drag_action = action
-        self.preview_win = tk.Toplevel(self)
-        self.preview_win.overrideredirect(True)
-        pil = self.icons_pil[action]
-        imgtk = ImageTk.PhotoImage(pil)
-        lbl = tk.Label(self.preview_win, image=imgtk, bg="white")
-        lbl.image = imgtk
-        lbl.pack()
-        self.preview_win.geometry(f"+{event.x_root}+{event.y_root}")
+        self.preview.show(action, event.x_root, event.y_root)
         self.bind_all("<Motion>", self._on_motion)
         self.bind_all("<ButtonRelease-1>", self._on_release)
 
     def _on_motion(self, e):
-        if self.preview_win:
-            self.preview_win.geometry(f"+{e.x_root+10}+{e.y_root+10}")
+        self.preview.move(e.x_root, e.y_root)
 
     def _on_release(self, e):
-        if not self.preview_win:
+        if not self.preview.visible:
             return
         x, y = e.x_root, e.y_root
         sx, sy = self.seq_area.winfo_rootx(), self.seq_area.winfo_rooty()
@@ -133,8 +97,7 @@ class DragDropApp(ctk.CTk):
         if sx <= x <= sx + sw and sy <= y <= sy + sh:
             relx, rely = x - sx, y - sy
             self._place_block(self.drag_action, relx, rely)
-        self.preview_win.destroy()
-        self.preview_win = None
+        self.preview.hide()
         self.unbind_all("<Motion>")
         self.unbind_all("<ButtonRelease-1>")
 
@@ -197,47 +160,45 @@ class DragDropApp(ctk.CTk):
     def scan_devices(self):
         for w in self.frame_devices.winfo_children():
             w.destroy()
-        threading.Thread(target=self._scan_thread, daemon=True).start()
+        self.device_rows.clear()
+        # BLE y HC se escanean a la vez; cada dispositivo llega por link_events
+        if self.discovery.start(ble_timeout=5.0):
+            self.btn_scan.configure(state="disabled")
+            self.lbl_bt.configure(text="Buscando BLE y HC-05/06...", text_color="blue")
 
-    def _scan_thread(self):
+    def _poll_link_events(self):
         try:
-            devices = []
-
-            # 1️⃣ Escaneo BLE
-            self.lbl_bt.configure(text="Buscando BLE...", text_color="blue")
-            ble_devices = asyncio.run(BleakScanner.discover(timeout=5.0))
-            for d in ble_devices:
-                if d.name:
-                    devices.append(("BLE", d.name, d.address))
-
-            # 2️⃣ Escaneo HC (puertos COM)
-            self.lbl_bt.configure(text="Buscando HC-05/06...", text_color="blue")
-            ports = serial.tools.list_ports.comports()
-            for p in ports:
-                if "HC" in p.description or "Bluetooth" in p.description:
-                    devices.append(("HC", p.description, p.device))
-
-            if not devices:
-                self.lbl_bt.configure(text="⚠ No se encontraron dispositivos", text_color="orange")
-                return
-
-            for typ, name, addr in devices:
-                fr = ctk.CTkFrame(self.frame_devices, fg_color="#caf0f8", corner_radius=6)
-                fr.pack(fill="x", padx=4, pady=3)
-                btn = ctk.CTkButton(fr, text=f"[{typ}] {name} ({addr})", fg_color="#00b4d8",
-                                    hover_color="#0096c7",
-                                    command=lambda t=typ, a=addr: self._connect_device(t, a))
-                btn.pack(fill="x", padx=5, pady=3)
-
-            self.lbl_bt.configure(text="Selecciona un dispositivo para conectar", text_color="green")
-
-        except Exception as e:
-            self.lbl_bt.configure(text=f"Error: {e}", text_color="red")
+            while True:
+                kind, info = self.link_events.get_nowait()
+                if kind == "device":
+                    self._add_device_row(*info)
+                elif kind == "scan_done":
+                    self.btn_scan.configure(state="normal")
+                    if not info:
+                        self.lbl_bt.configure(text="⚠ No se encontraron dispositivos", text_color="orange")
+                    else:
+                        self.lbl_bt.configure(text="Selecciona un dispositivo para conectar", text_color="green")
+        except queue.Empty:
+            pass
+        self.after(50, self._poll_link_events)
+
+    def _add_device_row(self, typ, addr, name, dev):
+        txt = f"[{typ}] {name} ({addr})"
+        if addr in self.device_rows:
+            self.device_rows[addr].configure(text=txt)
+            return
+        fr = ctk.CTkFrame(self.frame_devices, fg_color="#caf0f8", corner_radius=6)
+        fr.pack(fill="x", padx=4, pady=3)
+        btn = ctk.CTkButton(fr, text=txt, fg_color="#00b4d8",
+                            hover_color="#0096c7",
+                            command=lambda t=typ, a=addr: self._connect_device(t, a))
+        btn.pack(fill="x", padx=5, pady=3)
+        self.device_rows[addr] = btn
 
     def _connect_device(self, dev_type, address):
         try:
             if dev_type == "HC":
-                self.serial_port = serial.Serial(address, 9600, timeout=1)
+                self.serial_port = serial.Serial(address, BAUD_DEFAULT, timeout=1)
                 self.bt_connected = True
                 self.lbl_bt.configure(text=f"✅ Conectado a {address}", text_color="green")
             else:
@@ -245,6 +206,10 @@ class DragDropApp(ctk.CTk):
         except Exception as e:
             self.lbl_bt.configure(text=f"Error: {e}", text_color="red")
 
+    def _on_close(self):
+        self.ble_loop.stop()
+        self.destroy()
+
     # ---------- EJECUTAR ----------
     def _run_sequence(self):
         self.status_label.configure(text="Ejecutando secuencia...", text_color="blue")
@@ -1,74 +1,99 @@
 import customtkinter as ctk
-from PIL import Image, ImageTk, ImageDraw
-import os, asyncio, tkinter as tk, traceback
-from bleak import BleakScanner, BleakClient
-import serial, serial.tools.list_ports
+import os, sys, queue, tkinter as tk, traceback
+from tkinter import filedialog, messagebox
+from enlace_ble import LoopThread, BleLink
+from enlace_serial import SerialWriter
+from descubrimiento import DeviceDiscovery, PortWatcher
+from protocolo import START_CMD, compile_program, program_duration_ms
+from modelo import Block, Sequence, Engine, CONTROL_PARAMS
+from indice_espacial import GridIndex, OrderedBlocks
+from vista_bloques import WidgetBlockView, CanvasBlockView, new_block_id
+from iconos import IconSet
+from arrastre import DragPreview
+from dispositivos import KnownDevices
+from reconexion import LinkSupervisor
+from telemetria import TelemetryBuffer
+from panel_telemetria import TelemetryPanel
+from metricas import LatencyStats
+from vista_previa import show_preview
+from trayectoria import Trajectory, PathOverlay
+from persistencia import EXTENSION, Journal, save_program, iter_program, load_chunked
 
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
-ROOT_DIR = os.path.dirname(__file__)
-IMAGES_DIR = os.path.join(ROOT_DIR, "imagenes")
+PALETTE = ["Velocidad", "Adelante", "Izquierda", "Derecha", "Reversa", "Detener", "Esperar",
+           "Repetir", "Fin", "Subrutina", "Llamar"]
 
 
 class DragDropApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, light_blocks=False):
         super().__init__()
         self.title("Control Bluetooth (BLE + HC) - LEGO Style")
         self.geometry("1200x800")
         self.configure(bg="#f8f9fa")
 
         # Estados y variables
-        self.blocks = []
+        self.blocks = {}  # id -> bloque
+        # modo ligero: bloques como ítems del lienzo, materializados solo si están en la zona visible
+        self.light_blocks = light_blocks
+        self.materialized = set()
+        self.editing = None
+        self.grid = GridIndex()  # rectángulos de los bloques, para alinear sin pedir bbox de todos
+        self.order = OrderedBlocks()  # orden de ejecución, actualizado al colocar/mover/borrar
+        # diario de autoguardado: cada edición añade una línea; se reproduce si la app no se cerró bien
+        self.journal = Journal("control", self._records)
+        self.loading = False
         self.bt_connected = False
-        self.bt_client = None
-        self.bt_write_char = None  # cached write characteristic for BLE
         self.serial_port = None
         self.selected_device = None
         self.devices = []
         self.drag_action = None
-        self.preview_win = None
-        self.icons, self.icons_pil = {}, {}
-        self._load_icons()
+        self.engine = Engine(self, self.after)
+        self.lit_step = None  # paso resaltado en la ejecución en curso
+        # un único event loop asyncio (en su propio hilo) es dueño del BleakClient
+        self.link_events = queue.Queue()
+        self.ble_loop = LoopThread()
+        # lo que manda el robot (batería, distancia, encoders) lo guardan los enlaces en un anillo fijo
+        self.telemetry = TelemetryBuffer()
+        self.stats = LatencyStats()  # latencia de cada comando por transporte (panel BT y CSV)
+        self.ble = BleLink(self.ble_loop, self.link_events, telemetry=self.telemetry)
+        # BLE se escanea al pulsar Buscar; los puertos HC los vigila un hilo y llegan solos
+        self.discovery = DeviceDiscovery(self.ble_loop, self.link_events, serial_ports=False)
+        self.port_watcher = PortWatcher(self.link_events)
+        self.device_rows = {}  # dirección -> (tipo, botón)
+        self.known = KnownDevices()  # últimos dispositivos: reconectar sin escanear ni recorrer servicios
+        self.reconnecting = None
+        # si el enlace se cae a mitad de una secuencia: pausa, reconexión con espera creciente y reanudación
+        self.link_target = None  # (tipo, dirección) del enlace activo
+        self.hc_description = None  # descripción del puerto HC que se está abriendo (para recordarlo)
+        self.supervisor = LinkSupervisor(self.after, self.engine, self._reconnect_link,
+                                         on_status=lambda text, color: self.lbl_bt.configure(text=text,
+                                                                                            text_color=color))
+        self.lbl_scan = None
+        # recorrido estimado: se recalcula desde el primer paso que cambió, una vez por ciclo idle de Tk
+        self.trajectory = Trajectory()
+        self.show_path = True
+        self._path_pending = False
+        self.icons = IconSet()  # atlas en caché; PhotoImage compartida por icono
+        self.preview = DragPreview(self, self.icons)  # una sola ventana, movida a lo sumo una vez por cuadro
         self._build_ui()
-
-    # ---------- ICONOS ----------
-    def _load_icon_safe(self, fname, size=(55, 55)):
-        p = os.path.join(IMAGES_DIR, fname)
-        try:
-            pil = Image.open(p).convert("RGBA")
-            pil.thumbnail(size, Image.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=pil, dark_image=pil, size=size)
-            return ctk_img, pil
-        except Exception:
-            ph = Image.new("RGBA", size, (220, 220, 220, 255))
-            draw = ImageDraw.Draw(ph)
-            draw.rectangle((5, 5, size[0]-5, size[1]-5), outline=(180, 180, 180))
-            draw.text((8, 8), fname.split(".")[0][:6], fill=(80, 80, 80))
-            return ctk.CTkImage(light_image=ph, dark_image=ph, size=size), ph
-
-    def _load_icons(self):
-        mapping = {
-            "Velocidad": "velocidad.png",
-            "Adelante": "adelante.png",
-            "Izquierda": "izquierda.png",
-            "Derecha": "derecha.png",
-            "Reversa": "reversa.png",
-            "Detener": "detener.png",
-            "Esperar": "esperar.png",
-            "Bluetooth": "bluetooth.png",
-            "Ejecutar": "ejecutar.png",
-            "Limpiar": "limpiar.png"
-        }
-        for k, f in mapping.items():
-            ctk_img, pil_img = self._load_icon_safe(f)
-            self.icons[k] = ctk_img
-            self.icons_pil[k] = pil_img
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(50, self._poll_link_events)
+        self.after(200, self._offer_recovery)
+        self.port_watcher.start()
+        self.after(300, self._reconnect_last)
 
     # ---------- UI ----------
     def _build_ui(self):
         self.seq_area = tk.Canvas(self, bg="#dee2e6", highlightthickness=0)
         self.seq_area.pack(fill="both", expand=True, padx=15, pady=(60, 0))
+        self.path = PathOverlay(self.seq_area)
+        if self.light_blocks:
+            self.seq_area.bind("<Configure>", self._refresh_viewport)
+            self.seq_area.bind("<MouseWheel>", self._scroll_canvas)
+            self.seq_area.bind("<Button-4>", self._scroll_canvas)
+            self.seq_area.bind("<Button-5>", self._scroll_canvas)
         self.seq_area.create_text(
             600, 100,
             text="🧩 Arrastra los bloques aquí para crear tu secuencia",
@@ -84,8 +109,28 @@ class DragDropApp(ctk.CTk):
                                        fg_color="#6c757d", hover_color="#495057", command=self.clear_all)
         self.btn_clear.place(relx=0.03, rely=0.05, anchor="nw")
 
+        self.btn_upload = ctk.CTkButton(self, text="⬆", width=45, height=45, font=("Arial Rounded MT Bold", 20),
+                                        fg_color="#0077b6", hover_color="#005f8f", command=self._upload_sequence)
+        self.btn_upload.place(relx=0.13, rely=0.05, anchor="nw")
+
+        self.btn_preview = ctk.CTkButton(self, text="👁", width=45, height=45, font=("Arial Rounded MT Bold", 20),
+                                         fg_color="#7209b7", hover_color="#560bad", command=self._preview_sequence)
+        self.btn_preview.place(relx=0.28, rely=0.05, anchor="nw")
+
+        self.btn_path = ctk.CTkButton(self, text="🗺", width=45, height=45, font=("Arial Rounded MT Bold", 20),
+                                      fg_color="#f77f00", hover_color="#e36414", command=self._toggle_path)
+        self.btn_path.place(relx=0.33, rely=0.05, anchor="nw")
+
+        self.btn_save = ctk.CTkButton(self, text="💾", width=45, height=45, font=("Arial Rounded MT Bold", 20),
+                                      fg_color="#6c757d", hover_color="#495057", command=self.save_program)
+        self.btn_save.place(relx=0.18, rely=0.05, anchor="nw")
+
+        self.btn_open = ctk.CTkButton(self, text="📂", width=45, height=45, font=("Arial Rounded MT Bold", 20),
+                                      fg_color="#6c757d", hover_color="#495057", command=self.open_program)
+        self.btn_open.place(relx=0.23, rely=0.05, anchor="nw")
+
         self.status_label = ctk.CTkLabel(self, text="Listo", text_color="gray", bg_color="#f8f9fa")
-        self.status_label.place(relx=0.18, rely=0.05)
+        self.status_label.place(relx=0.38, rely=0.05)
 
         # Panel inferior con bloques
         bottom = ctk.CTkFrame(self, height=120, fg_color="#ffd60a")
@@ -95,7 +140,7 @@ class DragDropApp(ctk.CTk):
         bar = ctk.CTkFrame(bottom, fg_color="transparent")
         bar.pack(pady=6)
 
-        for action in ["Velocidad", "Adelante", "Izquierda", "Derecha", "Reversa", "Detener", "Esperar"]:
+        for action in PALETTE:
             btn = ctk.CTkButton(bar, image=self.icons[action], text="", width=75, height=75,
                                 fg_color="#ffffff", hover_color="#e9ecef", corner_radius=12)
             btn.pack(side="left", padx=10)
@@ -113,23 +158,15 @@ class DragDropApp(ctk.CTk):
     # ---------- DRAG & DROP ----------
     def _start_drag(self, event, action):
         self.drag_action = action
-        self.preview_win = tk.Toplevel(self)
-        self.preview_win.overrideredirect(True)
-        pil = self.icons_pil[action]
-        imgtk = ImageTk.PhotoImage(pil)
-        lbl = tk.Label(self.preview_win, image=imgtk, bg="white")
-        lbl.image = imgtk
-        lbl.pack()
-        self.preview_win.geometry(f"+{event.x_root}+{event.y_root}")
+        self.preview.show(action, event.x_root, event.y_root)
         self.bind_all("<Motion>", self._on_motion)
         self.bind_all("<ButtonRelease-1>", self._on_release)
 
     def _on_motion(self, e):
-        if self.preview_win:
-            self.preview_win.geometry(f"+{e.x_root+10}+{e.y_root+10}")
+        self.preview.move(e.x_root, e.y_root)
 
     def _on_release(self, e):
-        if not self.preview_win:
+        if not self.preview.visible:
             return
         x, y = e.x_root, e.y_root
         sx, sy = self.seq_area.winfo_rootx(), self.seq_area.winfo_rooty()
@@ -137,171 +174,345 @@ class DragDropApp(ctk.CTk):
         if sx <= x <= sx + sw and sy <= y <= sy + sh:
             relx, rely = x - sx, y - sy
             self._place_block(self.drag_action, relx, rely)
-        self.preview_win.destroy()
-        self.preview_win = None
+        self.preview.hide()
         self.unbind_all("<Motion>")
         self.unbind_all("<ButtonRelease-1>")
 
     # ---------- BLOQUES ----------
     def _place_block(self, action, x, y):
-        frame = ctk.CTkFrame(self.seq_area, fg_color="#ffffff", corner_radius=10, border_width=2, border_color="#adb5bd")
-        lbl = ctk.CTkLabel(frame, image=self.icons[action], text="")
-        lbl.pack(side="left", padx=3)
-
-        entry = None
-        # --- Cambios solicitados: segundos entre 1 y 10, giros en 45/90/180/360 ---
-        if action == "Velocidad":
-            # escala 1..9 (como pediste antes) - interfaz muestra 1..9
-            entry = ctk.CTkComboBox(frame, values=[str(i) for i in range(1, 10)], width=60)
-            entry.set("5")
-            entry.pack(side="left", padx=2)
-        elif action in ["Adelante", "Reversa", "Esperar"]:
-            # segundos 1..10
-            entry = ctk.CTkComboBox(frame, values=[str(i) for i in range(1, 11)], width=60)
-            entry.set("1")
-            entry.pack(side="left", padx=2)
-        elif action in ["Izquierda", "Derecha"]:
-            # grados limitados a 45,90,180,360
-            entry = ctk.CTkComboBox(frame, values=["45", "90", "180", "360"], width=80)
-            entry.set("90")
-            entry.pack(side="left", padx=2)
-
-        btn_del = ctk.CTkButton(frame, text="✖", width=20, fg_color="#c62828", hover_color="#a71d2a",
-                                command=lambda f=frame: self._delete_block(f))
-        btn_del.pack(side="right", padx=2)
-
-        idw = self.seq_area.create_window(x, y, window=frame)
-        frame.bind("<B1-Motion>", lambda ev, fid=idw: self._drag_block(ev, fid))
-        frame.bind("<ButtonRelease-1>", lambda ev, fid=idw: self._align_blocks())
-
-        self.blocks.append({"id": idw, "frame": frame, "type": action, "param": entry})
-
-    def _drag_block(self, event, window_id):
+        return self._add_block(action, self.seq_area.canvasx(x), self.seq_area.canvasy(y))
+
+    def _add_block(self, action, x, y, value=None):
+        """Crea un bloque centrado en (x, y) del lienzo; `value` viene de un archivo o del diario."""
+        blk = {"id": new_block_id(), "type": action}
+        view_cls = CanvasBlockView if self.light_blocks else WidgetBlockView
+        view = view_cls(self, blk, x, y)
+        blk["render"] = view
+        # el modelo guarda el valor tipado; el widget solo lo actualiza al cambiar
+        blk["model"] = Block(action, view.initial_value() if value is None else value, CONTROL_PARAMS, view=blk)
+        if value is not None:
+            view.show_value(blk["model"].value)
+        view.bind_model(blk["model"])
+        self.blocks[blk["id"]] = blk
+        if view.light:
+            self._index_block(blk)
+            if not self.loading:
+                self._refresh_viewport()
+        else:
+            # el tamaño real del frame se conoce tras el primer layout: un único bbox entonces
+            self.after_idle(lambda: self._index_block(blk))
+
+    def _bind_param(self, entry, model):
+        entry.configure(command=lambda value: self._set_param(model, value))
+        entry.bind("<KeyRelease>", lambda ev: (model.set_value(entry.get()), self._schedule_path()))
+        entry.bind("<FocusOut>", lambda ev: self._set_param(model, entry.get()))
+
+    def _set_param(self, model, raw):
+        model.set_value(raw)
+        self._journal_block(model.view)
+        self._schedule_path()
+
+    def _index_block(self, blk):
+        rect = blk["render"].rect()
+        if rect and blk["id"] in self.blocks:
+            self.grid.insert(blk["id"], rect)
+            self.order.upsert(blk["id"], rect, blk)
+            self._journal_block(blk)
+            self._schedule_path()
+
+    def _drag_block(self, event, blk):
         dx, dy = event.x, event.y
         # move the window so the mouse stays near the top-left of the block while dragging
-        self.seq_area.move(window_id, dx - 40, dy - 40)
-
-    def _align_blocks(self):
-        positions = [self.seq_area.bbox(b["id"]) for b in self.blocks]
-        for i, b in enumerate(self.blocks):
-            if not positions[i]:
+        # el orden de ejecución se actualiza al soltar, no en cada evento de movimiento
+        self._move_block(blk, dx - 40, dy - 40, reorder=False)
+
+    def _move_block(self, blk, dx, dy, reorder=True):
+        blk["render"].move(dx, dy)
+        key = blk["id"]
+        if key in self.grid:
+            self.grid.move(key, dx, dy)
+            if reorder:
+                self.order.upsert(key, self.grid.rect(key))
+                self._journal_block(blk)
+                self._schedule_path()
+
+    def _drop_block(self, blk):
+        if blk["id"] in self.grid:
+            self.order.upsert(blk["id"], self.grid.rect(blk["id"]))
+        self._align_blocks(blk["id"])
+        self._journal_block(blk)
+        self._schedule_path()
+        if self.light_blocks:
+            self._refresh_viewport()
+
+    def _align_blocks(self, key):
+        """Alinea en la misma fila solo al bloque soltado y a sus vecinos (consulta en el índice espacial)."""
+        rect = self.grid.rect(key)
+        if not rect:
+            return
+        # si están cerca verticalmente y muy cerca horizontalmente, alinearlos en la misma fila
+        for other in self.grid.query(rect, margin=60):
+            if other == key:
                 continue
-            x1, y1, x2, y2 = positions[i]
-            for j, b2 in enumerate(self.blocks):
-                if i == j or not positions[j]:
-                    continue
-                x1b, y1b, x2b, y2b = positions[j]
-                # si están cerca verticalmente y muy cerca horizontalmente, alinearlos en la misma fila
-                if abs(y1 - y1b) < 40 and abs(x2 - x1b) < 60:
-                    self.seq_area.move(b2["id"], x2 - x1b + 10, y1 - y1b)
-
-    def _delete_block(self, frame):
-        for b in list(self.blocks):
-            if b["frame"] == frame:
-                try:
-                    self.seq_area.delete(b["id"])
-                    b["frame"].destroy()
-                except:
-                    pass
-                self.blocks.remove(b)
+            x1, y1, x2, y2 = self.grid.rect(other)
+            mx1, my1, mx2, my2 = self.grid.rect(key)
+            if abs(y1 - my1) < 40 and abs(x2 - mx1) < 60:
+                # el bloque soltado queda a la derecha del vecino
+                self._move_block(self.blocks[key], x2 - mx1 + 10, y1 - my1)
                 break
+        mx1, my1, mx2, my2 = self.grid.rect(key)
+        for other in self.grid.query((mx1, my1, mx2, my2), margin=60):
+            if other == key:
+                continue
+            x1, y1, x2, y2 = self.grid.rect(other)
+            if abs(my1 - y1) < 40 and abs(mx2 - x1) < 60:
+                # el vecino queda a la derecha del bloque soltado
+                self._move_block(self.blocks[other], mx2 - x1 + 10, my1 - y1)
+
+    def _delete_block(self, blk):
+        if self.blocks.pop(blk["id"], None) is None:
+            return
+        if self.editing is blk["render"]:
+            self.editing = None
+        try:
+            blk["render"].destroy()
+        except:
+            pass
+        self.grid.remove(blk["id"])
+        self.order.remove(blk["id"])
+        self.materialized.discard(blk["id"])
+        if not self.loading:
+            self.journal.delete(blk["id"])
+        self._schedule_path()
+
+    # ---------- GUARDAR / ABRIR ----------
+    def _block_record(self, blk):
+        x1, y1, x2, y2 = self.grid.rect(blk["id"])
+        return {"t": "bloque", "id": blk["id"], "tipo": blk["type"], "valor": blk["model"].value,
+                "x": (x1 + x2) / 2, "y": (y1 + y2) / 2}
+
+    def _records(self):
+        return [self._block_record(b) for b in self.order]
+
+    def _journal_block(self, blk):
+        if not self.loading and blk["id"] in self.grid:
+            self.journal.put(self._block_record(blk))
+
+    def save_program(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=EXTENSION,
+                                            filetypes=[("Programa", "*" + EXTENSION)])
+        if not path:
+            return
+        try:
+            save_program(path, "control", self._records())
+        except OSError as e:
+            self.status_label.configure(text=f"Error al guardar: {e}", text_color="red")
+            return
+        self.status_label.configure(text=f"💾 Guardado: {os.path.basename(path)}", text_color="gray")
+
+    def open_program(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("Programa", "*" + EXTENSION)])
+        if not path:
+            return
+        try:
+            records = iter_program(path, "control")
+        except (OSError, ValueError) as e:
+            # sin tocar el programa actual ni el diario
+            self.status_label.configure(text=f"Error al abrir {os.path.basename(path)}: {e}", text_color="red")
+            return
+        self._load_records(records, os.path.basename(path))
+
+    def _load_records(self, records, label, failed=None):
+        """Construye el lienzo por tandas (persistencia.load_chunked) sin congelar la ventana."""
+        if self.loading:
+            return
+        self.loading = True  # sin diario mientras tanto: el anterior sigue intacto hasta terminar
+        # failed: error de una carga anterior; `records` es entonces el programa previo, sacado del diario
+        self.clear_all()
+        self.status_label.configure(text=f"📂 Abriendo {label}...", text_color="blue")
+
+        def apply(rec):
+            if rec.get("t") == "bloque" and rec.get("tipo") in PALETTE:
+                self._add_block(rec["tipo"], rec["x"], rec["y"], rec.get("valor"))
+
+        # los bloques clásicos se indexan en after_idle: terminar después de esos
+        load_chunked(self.after, records, apply,
+                     lambda count, error: self.after_idle(lambda: self._load_finished(label, count, error, failed)))
+
+    def _load_finished(self, label, count, error, failed=None):
+        self.loading = False
+        self._refresh_viewport()
+        self._schedule_path()
+        if error is not None and failed is None:
+            # archivo corrupto a mitad: el diario no se tocó durante la carga y tiene el programa anterior
+            self._load_records(self.journal.replay(), label, failed=error)
+            return
+        if failed is not None or error is not None:
+            # restaurando (o el propio diario falló): el diario se queda como estaba, sin compactar
+            note = " (se recuperó el programa anterior)" if error is None else ""
+            self.status_label.configure(text=f"Error al abrir {label}: {failed or error}{note}", text_color="red")
+            return
+        self.journal.compact()
+        self.status_label.configure(text=f"📂 {label}: {count} bloques", text_color="gray")
+
+    def _offer_recovery(self):
+        records = self.journal.replay()
+        if records and messagebox.askyesno(
+                "Recuperar programa",
+                f"La sesión anterior no se cerró bien y tiene {len(records)} bloques sin guardar. ¿Recuperarlos?",
+                parent=self):
+            self._load_records(records, "autoguardado")
+        else:
+            self.journal.discard()
+
+    # ---------- MODO LIGERO ----------
+    def _close_editor(self):
+        if self.editing is not None:
+            self.editing.close_editor()
+
+    def _scroll_canvas(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.seq_area.yview_scroll(-1, "units")
+        else:
+            self.seq_area.yview_scroll(1, "units")
+        self._refresh_viewport()
+        self._draw_path()  # el recuadro sigue a la zona visible; el recorrido no cambió
+
+    def _refresh_viewport(self, event=None):
+        """Materializa los bloques que intersectan la zona visible (consulta al índice) y libera el resto."""
+        if not self.light_blocks:
+            return
+        c = self.seq_area
+        x1, y1 = c.canvasx(0), c.canvasy(0)
+        view = (x1, y1, x1 + c.winfo_width(), y1 + c.winfo_height())
+        visible = self.grid.query(view, margin=100)
+        for key in self.materialized - visible:
+            self.blocks[key]["render"].dematerialize()
+        for key in visible - self.materialized:
+            self.blocks[key]["render"].materialize()
+        self.materialized = visible
+        bottom = self.grid.bounds()[3]
+        c.configure(scrollregion=(0, 0, view[2], max(view[3], bottom) + 400))
 
     # ---------- EJECUCIÓN ----------
+    def _sequence(self):
+        # el orden se mantiene incrementalmente (OrderedBlocks): sin consultas de geometría al ejecutar.
+        # Por defecto velocidad 5 (escala 1–9); un bloque "Velocidad" puede aparecer en cualquier parte.
+        return Sequence("Programa", [b["model"] for b in self.order], initial_speed=5)
+
     def _run_sequence(self):
         if not self.blocks:
             self.status_label.configure(text="No hay bloques para ejecutar", text_color="orange")
             return
+        try:
+            steps = self._sequence().optimized()
+        except ValueError as e:
+            self.status_label.configure(text=f"Error: {e}", text_color="red")
+            return
+        self._execute_blocks(steps)
 
-        sorted_blocks = sorted(self.blocks, key=lambda b: (self.seq_area.bbox(b["id"])[1], self.seq_area.bbox(b["id"])[0]))
-        # por defecto velocidad 5 (escala 1–9)
-        vel = 5
-        # si el primer bloque es velocidad, se respetará en el orden natural; de todas formas el bloque "Velocidad"
-        # ahora puede aparecer en cualquier parte — _execute_blocks lo detecta y actualiza la velocidad en tiempo de ejecución.
-        self._execute_blocks(sorted_blocks, 0, vel)
-
-    def _execute_blocks(self, blocks, index, vel):
-        if index >= len(blocks):
-            self.status_label.configure(text="✅ Secuencia completada", text_color="gray")
-            self._send_bt("S")
+    def _preview_sequence(self):
+        """Ejecución en seco con reloj virtual: comandos e instantes exactos sin esperar ni tocar el robot."""
+        if not self.blocks:
+            self.status_label.configure(text="No hay bloques para ejecutar", text_color="orange")
             return
+        try:
+            summary = show_preview(self, "Programa", self._sequence())
+        except ValueError as e:
+            self.status_label.configure(text=f"Error: {e}", text_color="red")
+            return
+        self.status_label.configure(text=summary, text_color="gray")
+
+    # ---------- RECORRIDO ESTIMADO ----------
+    def _toggle_path(self):
+        self.show_path = not self.show_path
+        if self.show_path:
+            self._schedule_path()
+        else:
+            self.path.hide()
 
-        blk = blocks[index]
-        action = blk["type"]
-        entry = blk["param"]
+    def _schedule_path(self):
+        """Junta los cambios de un mismo ciclo (tecla, soltar, alinear vecinos...) en un solo recálculo."""
+        if self.show_path and not self.loading and not self._path_pending:
+            self._path_pending = True
+            self.after_idle(self._update_path)
 
-        # Si encontramos un bloque Velocidad en cualquier parte, actualizamos la velocidad y avanzamos
-        if action == "Velocidad":
-            try:
-                vel = int(entry.get())
-                if vel < 1: vel = 1
-                if vel > 9: vel = 9
-            except:
-                vel = vel
-            blk["frame"].configure(border_color="#ffb703", border_width=3)
-            # mostrar destacado breve y continuar
-            self.after(400, lambda: (
-                blk["frame"].configure(border_color="#adb5bd", border_width=2),
-                self._execute_blocks(blocks, index + 1, vel)
-            ))
+    def _update_path(self):
+        self._path_pending = False
+        try:
+            self.trajectory.update(self._sequence().steps())
+        except ValueError:
+            self.path.hide()  # Repetir/Fin a medio poner: sin recorrido hasta que case
             return
+        self._draw_path()
 
-        # obtener valor: segundos o grados (según el tipo)
-        val = None
-        if entry:
-            try:
-                val = float(entry.get())
-            except:
-                val = None
-
-        total = len(blocks)
-        self.status_label.configure(text=f"▶ Ejecutando {index+1}/{total}: {action}", text_color="blue")
-        frame = blk["frame"]
-        frame.configure(border_color="#0077b6", border_width=3)
-
-        # Escalar velocidad (1–9 → 28–255) como pediste para enviar al Arduino
-        vel_real = int((vel - 1) / 8 * 227 + 28)
-
-        cmd = {"Adelante": "F", "Reversa": "B", "Izquierda": "L", "Derecha": "R", "Detener": "S"}.get(action, "S")
-        # enviar comando con velocidad real
-        self._send_bt(f"{cmd}{vel_real}")
-
-        # calcular delay respetando las restricciones:
-        # - Esperar/Adelante/Reversa: segundos entre 1 y 10 (selector)
-        # - Izquierda/Derecha: grados (45,90,180,360) -> usamos la fórmula original: (deg / 90) * 1000 ms
-        delay = 700
-        if action == "Esperar":
-            # val debe venir entre 1 y 10 (combo)
-            try:
-                v = int(val) if val is not None else 1
-                if v < 1: v = 1
-                if v > 10: v = 10
-                delay = int(v * 1000)
-            except:
-                delay = 1000
-        elif action in ["Adelante", "Reversa"]:
-            try:
-                v = int(val) if val is not None else 1
-                if v < 1: v = 1
-                if v > 10: v = 10
-                delay = int(v * 1000)
-            except:
-                delay = 1000
-        elif action in ["Izquierda", "Derecha"]:
-            try:
-                deg = int(val) if val is not None else 90
-                if deg not in (45, 90, 180, 360):
-                    deg = 90
-                delay = int((deg / 90) * 1000)
-            except:
-                delay = 1000
+    def _draw_path(self):
+        if not self.show_path or not self.blocks:
+            self.path.hide()
+            return
+        self.path.show(self.trajectory)
+
+    def _upload_sequence(self):
+        """Modo subir y ejecutar: el programa completo viaja en una sola transferencia y luego un único arranque."""
+        if not self.blocks:
+            self.status_label.configure(text="No hay bloques para ejecutar", text_color="orange")
+            return
+        if not self.bt_connected:
+            self.status_label.configure(text="⚠ Conecta un robot primero", text_color="orange")
+            return
+        try:
+            steps = self._sequence().upload_steps()
+            program = compile_program(steps)
+        except ValueError as e:
+            self.status_label.configure(text=f"Error: {e}", text_color="red")
+            return
+        # el arranque solo si el programa entró en la cola: con la cola llena send() lo descarta
+        if not (self._send_bytes(program) and self._send_bytes(START_CMD)):
+            self.status_label.configure(text="⚠ No se pudo enviar el programa (enlace ocupado), reintenta",
+                                        text_color="red")
+            return
+        secs = program_duration_ms(steps) / 1000
+        self.status_label.configure(text=f"⬆ Programa enviado: {len(steps)} pasos, {len(program)} bytes, {secs:.1f}s",
+                                    text_color="blue")
+
+    def _execute_blocks(self, steps):
+        """El motor envía cada paso en su plazo absoluto; aquí solo se resalta el bloque en la UI."""
+        if self.engine.running:
+            self._unhighlight(self.engine.scheduler.step)
+        self.lit_step = None
+        self.engine.run_steps(steps, self._execute_step, self._sequence_done)
+
+    def _execute_step(self, index, step):
+        if self.lit_step is not None:
+            # restaurar borde del bloque anterior (con Repetir puede ser el mismo bloque otra vez)
+            self._unhighlight(self.lit_step)
+        self.lit_step = step
+        if step.block.kind == "Velocidad":
+            # paso de velocidad: mostrar destacado breve y continuar
+            self._highlight(step, "#ffb703")
         else:
-            delay = 700
+            # los pasos sin comando de un movimiento unido por el optimizador resaltan su propio bloque
+            total = self.engine.scheduler.total
+            progress = f"{index+1}/{total}" if total else f"{index+1}"
+            self.status_label.configure(text=f"▶ Ejecutando {progress}: {step.block.kind}", text_color="blue")
+            self._highlight(step, "#0077b6")
+
+    def _highlight(self, step, color):
+        try:
+            step.block.view["render"].highlight(color)
+        except Exception:
+            pass  # el bloque pudo borrarse durante la ejecución
+
+    def _unhighlight(self, step):
+        try:
+            step.block.view["render"].unhighlight()
+        except Exception:
+            pass  # el bloque pudo borrarse durante la ejecución
 
-        # continuar al siguiente bloque después del delay (restaurar borde primero)
-        self.after(delay, lambda: (
-            frame.configure(border_color="#adb5bd", border_width=2),
-            self._execute_blocks(blocks, index + 1, vel)
-        ))
+    def _sequence_done(self, scheduler):
+        if scheduler.step is not None:
+            self._unhighlight(scheduler.step)
+        self.status_label.configure(text=f"✅ Secuencia completada ({scheduler.summary()})", text_color="gray")
 
     # ---------- BLUETOOTH ----------
     def _build_bt_panel(self):
@@ -314,9 +525,20 @@ class DragDropApp(ctk.CTk):
         self.frame_ports.pack(fill="both", padx=10, pady=6)
         self.lbl_bt = ctk.CTkLabel(self.bt_panel, text="No conectado", text_color="red")
         self.lbl_bt.pack(pady=4)
+        self.lbl_link = ctk.CTkLabel(self.bt_panel, text="", text_color="gray")
+        self.lbl_link.pack()
+        self.var_binary = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self.bt_panel, text="Protocolo binario (HC)", variable=self.var_binary).pack(pady=4)
         self.btn_disconnect = ctk.CTkButton(self.bt_panel, text="Desconectar", fg_color="#c62828",
                                             hover_color="#a71d2a", command=self.disconnect_bt, state="disabled")
         self.btn_disconnect.pack(pady=4)
+        self.lbl_latency = ctk.CTkLabel(self.bt_panel, text="", font=("Courier", 11), justify="left")
+        self.lbl_latency.pack(padx=6)
+        ctk.CTkButton(self.bt_panel, text="📊 Exportar latencias CSV", fg_color="#6c757d", hover_color="#495057",
+                      command=self.export_latency).pack(pady=4)
+        self.after(1000, self._refresh_latency)
+        self.telemetry_panel = TelemetryPanel(self.bt_panel, self.telemetry)
+        self.telemetry_panel.pack(fill="x", pady=4)
 
     def _toggle_bt_panel(self):
         if self.bt_panel.winfo_ismapped():
@@ -325,170 +547,279 @@ class DragDropApp(ctk.CTk):
             self.bt_panel.place(relx=0.985, rely=0.13, anchor="ne")
 
     def scan_devices(self):
-        # limpia y muestra mensaje
-        for w in self.frame_ports.winfo_children():
-            w.destroy()
-        ctk.CTkLabel(self.frame_ports, text="Buscando dispositivos BLE / HC ...", text_color="gray").pack()
-        self.update()
-        # usa asyncio.run para evitar tener que reestructurar el app
-        asyncio.run(self._scan_ble_and_hc())
-
-    async def _scan_ble_and_hc(self):
-        for w in self.frame_ports.winfo_children():
-            w.destroy()
-
-        # BLE scan (Bleak)
-        try:
-            ble_devices = await BleakScanner.discover(timeout=5.0)
-        except Exception as e:
-            ble_devices = []
-            print("Error escaneando BLE:", e)
-
-        # puerto serie (HC-0x / HC-05 / HC-06) enumeración
-        try:
-            hc_ports = list(serial.tools.list_ports.comports())
-        except Exception:
-            hc_ports = []
-
-        all_devices = []
-
-        # agregar BLE (filtrando por nombre si existe) — mostramos cualquier BLE con nombre o sin él
-        for d in ble_devices:
-            # incluir si tiene nombre o su metadata sugiere HC/BLE
-            all_devices.append(("BLE", d))
-
-        # agregar HC serie si su descripción contiene 'HC' o 'LMB' (algunos adaptadores muestran LMB)
-        for p in hc_ports:
-            desc = (p.description or "").upper()
-            name = (p.name or "")
-            if "HC" in desc or "HC" in (p.device or "") or "LMB" in desc or "BLUETOOTH" in desc:
-                all_devices.append(("HC", p))
-
-        if not all_devices:
-            ctk.CTkLabel(self.frame_ports, text="No se encontraron dispositivos").pack()
+        # quita solo las filas BLE y muestra mensaje; el escaneo BLE corre fuera del hilo de Tk
+        # y cada dispositivo llega por link_events. Las filas HC las mantiene el PortWatcher.
+        for address, (typ, btn) in list(self.device_rows.items()):
+            if typ != "HC" and not self.known.get(address):
+                self._remove_device_row(address)
+        self._set_scan_label("Buscando dispositivos BLE / HC ...")
+        self.port_watcher.rescan()
+        if self.discovery.start(ble_timeout=5.0):
+            self.btn_scan.configure(state="disabled")
+
+    def _set_scan_label(self, text):
+        if self.lbl_scan is not None:
+            self.lbl_scan.destroy()
+            self.lbl_scan = None
+        if text:
+            self.lbl_scan = ctk.CTkLabel(self.frame_ports, text=text, text_color="gray")
+            self.lbl_scan.pack()
+
+    def _add_device_row(self, typ, address, name, dev):
+        """Agrega (o actualiza, si ya existe) la fila de un dispositivo, indexada por dirección."""
+        display_name = name or str(address)
+        txt = f"[{typ}] {display_name}"
+        if address in self.device_rows:
+            self.device_rows[address][1].configure(text=txt)
             return
-
-        # mostrar lista
-        for typ, dev in all_devices:
-            fr = ctk.CTkFrame(self.frame_ports, fg_color="#caf0f8", corner_radius=6)
-            fr.pack(fill="x", padx=4, pady=3)
-            display_name = getattr(dev, "name", None) or getattr(dev, "description", None) or str(getattr(dev, "device", dev))
-            txt = f"[{typ}] {display_name}"
-            btn = ctk.CTkButton(fr, text=txt, fg_color="#00b4d8",
-                                hover_color="#0096c7", command=lambda t=typ, d=dev: self._connect_device(t, d))
-            btn.pack(fill="x", padx=5, pady=3)
+        self._set_scan_label(None)
+        fr = ctk.CTkFrame(self.frame_ports, fg_color="#caf0f8", corner_radius=6)
+        fr.pack(fill="x", padx=4, pady=3)
+        btn = ctk.CTkButton(fr, text=txt, fg_color="#00b4d8",
+                            hover_color="#0096c7", command=lambda t=typ, d=dev: self._connect_device(t, d))
+        btn.pack(fill="x", padx=5, pady=3)
+        self.device_rows[address] = (typ, btn)
+
+    def _remove_device_row(self, address):
+        """Quita solo la fila de ese dispositivo (el resto de la lista no se reconstruye)."""
+        row = self.device_rows.pop(address, None)
+        if row is not None:
+            row[1].master.destroy()
+        if not self.device_rows and not self.discovery.scanning:
+            self._set_scan_label("No se encontraron dispositivos")
+
+    def _scan_finished(self, count):
+        self.btn_scan.configure(state="normal")
+        self._set_scan_label(None if self.device_rows else "No se encontraron dispositivos")
+
+    def _reconnect_last(self):
+        """Muestra los dispositivos conocidos y reconecta directo al último usado."""
+        for d in self.known:
+            self._add_device_row(d["transport"], d["address"], "★ " + (d["name"] or d["address"]), d["address"])
+        last = self.known.last()
+        if last is None or self.bt_connected:
+            return
+        self.reconnecting = last["address"]
+        self._connect_device(last["transport"], last["address"])
 
     def _connect_device(self, typ, dev):
-        # conectar a HC (serial) o BLE (Gatt)
+        # conectar a HC (serial) o BLE (Gatt); `dev` es el objeto del escaneo o una dirección guardada
+        self.telemetry.clear()  # otro robot: la telemetría anterior ya no es suya
         if typ == "HC":
+            port = getattr(dev, "device", dev)
             try:
-                self.serial_port = serial.Serial(dev.device, 9600, timeout=1)
-                self.lbl_bt.configure(text=f"Conectado a {dev.device}", text_color="green")
-                self.bt_connected = True
-                self.btn_disconnect.configure(state="normal")
-                # limpiar cualquier cliente BLE previo
-                self.bt_client = None
-                self.bt_write_char = None
+                # el hilo SerialWriter es dueño del puerto y lo abre él; el resultado llega por link_events
+                if self.serial_port:
+                    self.serial_port.close()
+                self.serial_port = SerialWriter(port, self.link_events, binary=self.var_binary.get(),
+                                                telemetry=self.telemetry)
+                self.hc_description = getattr(dev, "description", None)
+                self.link_target = ("HC", port)
+                self.lbl_bt.configure(text=f"Conectando a {port}...", text_color="blue")
             except Exception as e:
                 self.lbl_bt.configure(text=f"Error: {e}", text_color="red")
+                self._reconnect_failed()
         else:
-            # BLE device object from BleakScanner
-            try:
-                # crear BleakClient y conectar (sin bloquear UI gracias a asyncio.run)
-                self.bt_client = BleakClient(dev)
-                asyncio.run(self.bt_client.connect(timeout=10.0))
-                # buscar una característica escribible (caché)
-                self.bt_write_char = asyncio.run(self._find_write_characteristic(self.bt_client))
-                self.bt_connected = True
-                name = getattr(dev, "name", "BLE")
-                self.lbl_bt.configure(text=f"Conectado a {name}", text_color="green")
-                self.btn_disconnect.configure(state="normal")
-                # cerrar serial si estaba abierta
-                if self.serial_port:
-                    try:
-                        self.serial_port.close()
+            # BLEDevice del escaneo o dirección guardada: la conexión corre en el loop BLE,
+            # el resultado llega por link_events (ver _poll_link_events)
+            address = getattr(dev, "address", dev)
+            known = self.known.get(address)
+            name = getattr(dev, "name", None) or (known and known["name"]) or "BLE"
+            self.lbl_bt.configure(text=f"Conectando a {name}...", text_color="blue")
+            self.ble.connect(dev, timeout=10.0, write_char=known and known["write_char"])
+
+    def _reconnect_link(self):
+        """Un intento del LinkSupervisor: mismo dispositivo, sin escanear."""
+        typ, address = self.link_target
+        if typ == "HC":
+            if self.serial_port:
+                self.serial_port.close()
+            # link_ok() cuando el hilo publique "connected"
+            self.serial_port = SerialWriter(address, self.link_events, binary=self.var_binary.get(),
+                                            telemetry=self.telemetry)
+        else:
+            known = self.known.get(address)
+            self.ble.connect(address, timeout=5.0, write_char=known and known["write_char"])
+
+    def _reconnect_failed(self):
+        """El dispositivo guardado no respondió: se vuelve al escaneo de siempre."""
+        if self.reconnecting is None:
+            return
+        self.reconnecting = None
+        self.scan_devices()
+
+    def _poll_link_events(self):
+        """Procesa en el hilo de Tk los resultados publicados por el loop BLE y el escaneo."""
+        try:
+            while True:
+                kind, info = self.link_events.get_nowait()
+                if kind == "device":
+                    self._add_device_row(*info)
+                elif kind == "device_lost":
+                    self._remove_device_row(info)
+                    if self.link_target == ("HC", info):
+                        self.supervisor.link_lost(f"{info} ya no está disponible")
+                elif kind == "scan_done":
+                    self._scan_finished(info)
+                elif kind == "connected":
+                    self.bt_connected = True
+                    self.reconnecting = None
+                    self.lbl_bt.configure(text=f"Conectado a {info}", text_color="green")
+                    self.telemetry_panel.show(self.telemetry, info)
+                    self.btn_disconnect.configure(state="normal")
+                    profile = self.ble.profile
+                    if self.serial_port and info == self.serial_port.port:
+                        self.known.remember(info, "HC", self.hc_description)
+                        # limpiar cualquier cliente BLE previo
+                        if self.ble.is_connected:
+                            self.ble.disconnect()
+                    elif profile:
+                        self.link_target = ("BLE", profile["address"])
+                        self.known.remember(profile["address"], "BLE", info, profile["write_char"],
+                                            profile["without_response"])
+                    self.supervisor.link_ok()
+                elif kind == "link_lost":
+                    if self.link_target and info[1] == self.link_target[1]:
+                        self.supervisor.link_lost(info[0])
+                    # cerrar serial si estaba abierta
+                    if self.serial_port:
+                        try:
+                            self.serial_port.close()
+                        except:
+                            pass
                         self.serial_port = None
-                    except:
-                        pass
-            except Exception as e:
-                self.lbl_bt.configure(text=f"Error BLE: {e}", text_color="red")
-                self.bt_client = None
-                self.bt_write_char = None
+                elif kind == "serial_write":
+                    self.supervisor.link_confirmed()
+                    self.lbl_link.configure(text=f"Escritura: {info['latency_ms']:.1f} ms "
+                                                 f"(en cola {info['queued_ms']:.1f} ms)")
+                elif kind == "write":
+                    self.supervisor.link_confirmed()  # escritura BLE completada
+                elif kind == "protocol":
+                    self.lbl_link.configure(text=f"Protocolo {info['mode']} a {info['baud']} baudios")
+                elif kind == "ack":
+                    self.supervisor.link_confirmed()
+                    self.lbl_link.configure(text=f"ACK #{info['seq']}: {info['rtt_ms']:.1f} ms"
+                                                 + (f" ({info['retries']} reintentos)" if info["retries"] else ""))
+                elif kind == "backpressure":
+                    self.lbl_link.configure(text=f"⚠ Enlace saturado ({info} comandos en cola)")
+                elif kind == "error":
+                    op, exc = info
+                    if op == "connected" and self.serial_port and not self.serial_port.is_open:
+                        self.serial_port = None  # el hilo no pudo abrir el puerto y ya terminó
+                    if op == "connected" and self.supervisor.recovering:
+                        self.supervisor.attempt_failed()
+                    elif op == "connected":
+                        self.lbl_bt.configure(text=f"Error: {exc}", text_color="red")
+                        self._reconnect_failed()
+                    elif op == "serial_write":
+                        self.lbl_bt.configure(text=f"Error serie: {exc}", text_color="red")
+                    elif op == "ack":
+                        self.lbl_link.configure(text=f"⚠ {exc}")
+                    else:
+                        print(f"Error BLE ({op}):", exc)
+        except queue.Empty:
+            pass
+        self.after(50, self._poll_link_events)
 
-    async def _find_write_characteristic(self, client: BleakClient):
+    def send_command(self, cmd, speed=None, duration_ms=0):
         """
-        Busca la primera characteristic con permiso write o write_without_response.
-        Devuelve UUID o None.
+        Transport del motor: envía un comando al dispositivo conectado (serial HC o BLE GATT). El enlace lo codifica:
+        texto "F255\\n" o, si se negoció, trama binaria con CRC y ACK.
         """
+        if not self.bt_connected:
+            return
         try:
-            services = await client.get_services()
-            for service in services:
-                for char in service.characteristics:
-                    props = char.properties or []
-                    # buscar propiedades de escritura
-                    if "write" in props or "write-without-response" in props:
-                        return char.uuid
+            if self.serial_port:
+                # puerto serie clásico HC-05/06 (no bloquea; un movimiento nuevo reemplaza al pendiente)
+                self.serial_port.send_command(cmd, speed, duration_ms,
+                                              trace=self.stats.begin("HC", cmd, self.engine.lateness_ms))
+            elif self.ble.is_connected:
+                # BLE: se encola en el loop persistente, no bloquea la UI
+                self.ble.send_command(cmd, speed, duration_ms,
+                                      trace=self.stats.begin("BLE", cmd, self.engine.lateness_ms))
         except Exception as e:
-            print("Error listing services:", e)
-        return None
+            print("Error enviando:", e)
 
-    def _send_bt(self, msg):
-        """Envía msg + '\\n' al dispositivo conectado (serial HC o BLE GATT si tiene característica escribible)."""
+    def _send_bytes(self, data):
+        """
+        Envía bytes crudos (p. ej. un programa compilado) por el enlace activo.
+        False si no salen: sin enlace o descartados por contrapresión (los errores BLE llegan como evento).
+        """
         if not self.bt_connected:
-            return
+            return False
         try:
             if self.serial_port:
-                # puerto serie clásico HC-05/06
-                self.serial_port.write((msg + "\n").encode())
-            elif self.bt_client and self.bt_client.is_connected:
-                # BLE: intentar usar característica cacheada
-                if self.bt_write_char:
-                    try:
-                        asyncio.run(self.bt_client.write_gatt_char(self.bt_write_char, (msg + "\n").encode()))
-                    except Exception as e:
-                        print("Error escribiendo BLE (cached char):", e)
-                        # no hacemos más reintentos aquí
-                else:
-                    # intentar identificar una characteristic escribible en tiempo real
-                    try:
-                        char = asyncio.run(self._find_write_characteristic(self.bt_client))
-                        if char:
-                            self.bt_write_char = char
-                            asyncio.run(self.bt_client.write_gatt_char(char, (msg + "\n").encode()))
-                        else:
-                            print("No se encontró characteristic escribible en el dispositivo BLE.")
-                    except Exception as e:
-                        print("Error escribiendo BLE:", e)
+                return self.serial_port.send(data)
+            if self.ble.is_connected:
+                self.ble.write(data, chunk_size=20)
+                return True
         except Exception as e:
             print("Error enviando:", e)
+        return False
+
+    def _refresh_latency(self):
+        """p50/p95/p99 por transporte y etapa; una vez por segundo y solo con el panel a la vista."""
+        if self.bt_panel.winfo_ismapped():
+            self.lbl_latency.configure(text=self.stats.summary_text())
+        self.after(1000, self._refresh_latency)
+
+    def export_latency(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            samples = self.stats.export_csv(path)
+        except OSError as e:
+            self.lbl_link.configure(text=f"Error al exportar: {e}")
+            return
+        self.lbl_link.configure(text=f"📊 {os.path.basename(path)} y {os.path.basename(samples)}")
 
     def disconnect_bt(self):
+        self.supervisor.stop()
+        self.engine.cancel()  # envía "S" si el robot seguía en marcha, antes de cerrar el enlace
+        self.link_target = None
         try:
             if self.serial_port:
-                self.serial_port.close()
+                self.serial_port.close(drain=True)
                 self.serial_port = None
-            if self.bt_client and self.bt_client.is_connected:
-                asyncio.run(self.bt_client.disconnect())
-                self.bt_client = None
-                self.bt_write_char = None
+            if self.ble.is_connected:
+                self.ble.disconnect()
         except:
             pass
         self.lbl_bt.configure(text="Desconectado", text_color="red")
         self.bt_connected = False
         self.btn_disconnect.configure(state="disabled")
 
+    def _on_close(self):
+        if self.ble.is_connected:
+            try:
+                self.ble.disconnect().result(timeout=2)
+            except Exception:
+                pass
+        self.ble_loop.stop()
+        self.port_watcher.stop()
+        self.journal.discard()
+        self.destroy()
+
     # ---------- LIMPIAR ----------
     def clear_all(self):
-        for b in self.blocks:
+        self._close_editor()
+        self.engine.cancel()
+        for b in self.blocks.values():
             try:
-                self.seq_area.delete(b["id"])
-                b["frame"].destroy()
+                b["render"].destroy()
             except:
                 pass
         self.blocks.clear()
+        self.materialized.clear()
+        self.grid.clear()
+        self.order.clear()
+        self._schedule_path()
+        if not self.loading:
+            self.journal.clear()
         self.status_label.configure(text="Todo limpio", text_color="gray")
 
 
 if __name__ == "__main__":
-    app = DragDropApp()
+    app = DragDropApp(light_blocks="--ligero" in sys.argv)
     app.mainloop()
@@ -0,0 +1,141 @@
+import asyncio, threading
+import serial.tools.list_ports
+from bleak import BleakScanner
+
+
+def is_bt_serial_port(p):
+    """Puertos serie que parecen módulos HC-0x (algunos adaptadores muestran LMB o BLUETOOTH)."""
+    desc = (p.description or "").upper()
+    return "HC" in desc or "HC" in (p.device or "") or "LMB" in desc or "BLUETOOTH" in desc
+
+
+class DeviceDiscovery:
+    """
+    Escaneo BLE (callbacks de anuncios) y enumeración de puertos serie en paralelo.
+    Cada dispositivo nuevo se publica en `events` apenas aparece, deduplicado por dirección:
+      ("device", (tipo, direccion, nombre, objeto))  -> nuevo o con nombre recién conocido
+      ("scan_done", cantidad)                        -> terminaron ambas fuentes
+    Con serial_ports=False solo escanea BLE (los puertos los sigue un PortWatcher).
+    """
+
+    def __init__(self, loop_thread, events, port_filter=is_bt_serial_port, ble_named_only=False,
+                 serial_ports=True):
+        self.loop_thread = loop_thread
+        self.events = events
+        self.port_filter = port_filter
+        self.ble_named_only = ble_named_only
+        self.serial_ports = serial_ports
+        self.scanning = False
+        self._lock = threading.Lock()
+        self._names = {}
+        self._pending = 0
+
+    def start(self, ble_timeout=5.0):
+        if self.scanning:
+            return False
+        self.scanning = True
+        with self._lock:
+            self._names.clear()
+            self._pending = 2 if self.serial_ports else 1
+        fut = self.loop_thread.submit(self._scan_ble(ble_timeout))
+        fut.add_done_callback(lambda f: self._source_done("BLE", f.exception() if not f.cancelled() else None))
+        if self.serial_ports:
+            threading.Thread(target=self._scan_ports, name="scan-serial", daemon=True).start()
+        return True
+
+    async def _scan_ble(self, timeout):
+        def on_advertisement(device, adv):
+            name = device.name or getattr(adv, "local_name", None)
+            if self.ble_named_only and not name:
+                return
+            self._publish("BLE", device.address, name, device)
+
+        scanner = BleakScanner(detection_callback=on_advertisement)
+        await scanner.start()
+        try:
+            await asyncio.sleep(timeout)
+        finally:
+            await scanner.stop()
+
+    def _scan_ports(self):
+        err = None
+        try:
+            for p in serial.tools.list_ports.comports():
+                if self.port_filter is None or self.port_filter(p):
+                    self._publish("HC", p.device, p.description, p)
+        except Exception as e:
+            err = e
+        self._source_done("HC", err)
+
+    def _publish(self, typ, address, name, obj):
+        with self._lock:
+            if address in self._names:
+                # ya publicado: solo se vuelve a emitir si ahora conocemos el nombre
+                if self._names[address] or not name:
+                    return
+            self._names[address] = name
+        self.events.put(("device", (typ, address, name, obj)))
+
+    def _source_done(self, source, err):
+        if err is not None:
+            print(f"Error escaneando {source}:", err)
+        with self._lock:
+            self._pending -= 1
+            finished = self._pending == 0
+            count = len(self._names)
+        if finished:
+            self.scanning = False
+            self.events.put(("scan_done", count))
+
+
+class PortWatcher:
+    """
+    Hilo que vigila los puertos serie: un HC-05/06 que se empareja o se quita aparece/desaparece
+    como puerto COM/rfcomm. Cada `interval` s compara con la pasada anterior y publica solo las diferencias:
+      ("device", ("HC", puerto, descripcion, objeto))  -> puerto nuevo que pasa el filtro
+      ("device_lost", puerto)                          -> puerto publicado que ya no está
+    El filtro se evalúa una sola vez por puerto nuevo; su resultado se recuerda mientras siga conectado.
+    """
+
+    def __init__(self, events, port_filter=is_bt_serial_port, interval=1.0):
+        self.events = events
+        self.port_filter = port_filter
+        self.interval = interval
+        self._accepted = {}  # puerto -> pasó el filtro
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="port-watcher", daemon=True)
+            self._thread.start()
+
+    def rescan(self):
+        """Adelanta la próxima pasada (botón Buscar)."""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                print("Error vigilando puertos serie:", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        current = {p.device: p for p in serial.tools.list_ports.comports()}
+        for port in self._accepted.keys() - current.keys():
+            if self._accepted.pop(port):
+                self.events.put(("device_lost", port))
+        for port in current.keys() - self._accepted.keys():
+            p = current[port]
+            ok = self.port_filter is None or self.port_filter(p)
+            self._accepted[port] = ok
+            if ok:
+                self.events.put(("device", ("HC", port, p.description, p)))
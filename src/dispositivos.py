@@ -0,0 +1,53 @@
+import json, os, time
+from persistencia import DATA_DIR
+
+
+class KnownDevices:
+    """
+    Últimos dispositivos usados, guardados en disco para reconectar sin escanear:
+    {"address", "transport" ("BLE" | "HC"), "name", "write_char", "without_response", "last_used"}.
+    El primero de la lista es el más reciente.
+    """
+
+    def __init__(self, path=None, limit=5):
+        self.path = path or os.path.join(DATA_DIR, "dispositivos.json")
+        self.limit = limit
+        self.devices = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.devices = [d for d in data if isinstance(d, dict) and d.get("address")][:limit]
+        except (OSError, ValueError):
+            pass
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def last(self):
+        return self.devices[0] if self.devices else None
+
+    def get(self, address):
+        for d in self.devices:
+            if d["address"] == address:
+                return d
+        return None
+
+    def remember(self, address, transport, name=None, write_char=None, without_response=False):
+        entry = {"address": address, "transport": transport, "name": name, "write_char": write_char,
+                 "without_response": bool(without_response), "last_used": time.time()}
+        self.devices = [entry] + [d for d in self.devices if d["address"] != address][:self.limit - 1]
+        self._save()
+
+    def forget(self, address):
+        self.devices = [d for d in self.devices if d["address"] != address]
+        self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.devices, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # sin caché: la próxima vez se escanea como antes
@@ -0,0 +1,182 @@
+import asyncio, threading, time
+from bleak import BleakClient
+from protocolo import TextCodec
+from telemetria import TelemetryParser
+
+
+async def find_write_characteristic(client):
+    """
+    Busca la primera characteristic con permiso write o write_without_response.
+    Devuelve (UUID, admite write-without-response) o (None, False).
+    """
+    try:
+        for service in client.services:
+            for char in service.characteristics:
+                props = char.properties or []
+                if "write" in props or "write-without-response" in props:
+                    return char.uuid, "write-without-response" in props
+    except Exception as e:
+        print("Error listing services:", e)
+    return None, False
+
+
+def find_notify_characteristic(client):
+    """Primera characteristic con notify (por donde el robot manda la telemetría) o None."""
+    for service in client.services:
+        for char in service.characteristics:
+            if "notify" in (char.properties or []):
+                return char.uuid
+    return None
+
+
+class LoopThread:
+    """Event loop de asyncio de larga duración en un hilo propio (un solo loop para todo BLE)."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="ble-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Programa la corrutina en el loop sin bloquear; devuelve un concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+
+
+class BleLink:
+    """
+    Dueño del BleakClient. Todas las operaciones corren en el loop de LoopThread;
+    los resultados se publican en `events` como tuplas (tipo, datos) para que
+    el hilo de Tk los lea con after(). Si el dispositivo se desconecta solo se publica
+    ("link_lost", ("BLE", dirección)).
+    Con un TelemetryBuffer en `telemetry` se suscribe a las notificaciones del robot al conectar y guarda
+    las muestras en el anillo desde el propio loop (sin un evento por notificación).
+    """
+
+    def __init__(self, loop_thread, events, telemetry=None):
+        self.loop_thread = loop_thread
+        self.events = events
+        self.telemetry = telemetry
+        self._parser = TelemetryParser()
+        self.client = None
+        self.write_char = None
+        self.without_response = False
+        self.codec = TextCodec()
+        self._write_lock = None
+
+    @property
+    def is_connected(self):
+        return bool(self.client and self.client.is_connected)
+
+    @property
+    def profile(self):
+        """Datos para KnownDevices: reconectar luego directo a la dirección y characteristic."""
+        if not self.client:
+            return None
+        return {"address": self.client.address, "write_char": self.write_char,
+                "without_response": self.without_response}
+
+    def connect(self, device, timeout=10.0, write_char=None):
+        """`device` puede ser el BLEDevice del escaneo o una dirección guardada (sin escanear)."""
+        return self._submit("connected", self._connect(device, timeout, write_char))
+
+    def write(self, data, chunk_size=None, trace=None):
+        """
+        Encola una escritura; con chunk_size se parte en trozos (MTU BLE por defecto ~20 bytes).
+        Con una metricas.CommandTrace se marcan inicio y fin de la escritura (con respuesta, el fin incluye la del robot).
+        """
+        return self._submit("write", self._write(data, chunk_size, trace))
+
+    def send_command(self, cmd, speed=None, duration_ms=0, trace=None):
+        return self.write(self.codec.encode(cmd, speed, duration_ms), trace=trace)
+
+    def disconnect(self):
+        return self._submit("disconnected", self._disconnect())
+
+    async def _connect(self, device, timeout, write_char=None):
+        old, self.client = self.client, None
+        if old and old.is_connected:
+            await old.disconnect()
+        client = BleakClient(device, disconnected_callback=self._on_disconnected)
+        await client.connect(timeout=timeout)
+        self.client = client
+        # characteristic guardada: se comprueba que exista en vez de recorrer todos los servicios
+        char = client.services.get_characteristic(write_char) if write_char else None
+        if char is not None:
+            self.write_char = char.uuid
+            self.without_response = "write-without-response" in (char.properties or [])
+        else:
+            self.write_char, self.without_response = await find_write_characteristic(client)
+        if self.telemetry is not None:
+            await self._start_notify(client)
+        return getattr(device, "name", None) or getattr(client, "name", None) or "BLE"
+
+    async def _start_notify(self, client):
+        try:
+            uuid = find_notify_characteristic(client)
+            if uuid:
+                self._parser = TelemetryParser()
+                await client.start_notify(uuid, self._on_notify)
+        except Exception as e:
+            # sin telemetría el robot se sigue manejando igual
+            self.events.put(("error", ("notify", e)))
+
+    def _on_notify(self, sender, data):
+        for sample in self._parser.feed(bytes(data)):
+            self.telemetry.append(sample)
+
+    def _on_disconnected(self, client):
+        # también llega al desconectar a pedido: solo es pérdida si sigue siendo el cliente activo
+        if client is self.client:
+            self.events.put(("link_lost", ("BLE", client.address)))
+
+    async def _write(self, data, chunk_size=None, trace=None):
+        if not self.is_connected:
+            raise ConnectionError("BLE no conectado")
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            if not self.write_char:
+                # intentar identificar una characteristic escribible en tiempo real
+                self.write_char, self.without_response = await find_write_characteristic(self.client)
+                if not self.write_char:
+                    raise RuntimeError("No se encontró characteristic escribible en el dispositivo BLE.")
+            t0 = time.perf_counter()
+            step = chunk_size or len(data) or 1
+            for i in range(0, len(data), step):
+                # sin respuesta si la characteristic lo admite: no espera el ACK de cada escritura
+                await self.client.write_gatt_char(self.write_char, data[i:i + step],
+                                                  response=not self.without_response)
+            t1 = time.perf_counter()
+            if trace is not None:
+                trace.write_start, trace.write_end = t0, t1
+                trace.done()
+            return (t1 - t0) * 1000
+
+    async def _disconnect(self):
+        client, self.client, self.write_char, self.without_response = self.client, None, None, False
+        if client and client.is_connected:
+            await client.disconnect()
+
+    def _submit(self, kind, coro):
+        fut = self.loop_thread.submit(coro)
+
+        def done(f):
+            if f.cancelled():
+                return
+            exc = f.exception()
+            if exc is not None:
+                self.events.put(("error", (kind, exc)))
+            else:
+                self.events.put((kind, f.result()))
+
+        fut.add_done_callback(done)
+        return fut
@@ -0,0 +1,230 @@
+import collections, threading, time
+import serial
+from protocolo import (BAUD_DEFAULT, HELLO, ACK, TELEMETRY_SYNC, TextCodec, BinaryCodec,
+                       parse_hello, pick_baud)
+from telemetria import TelemetryParser
+
+
+class SerialWriter:
+    """
+    Hilo escritor dueño de serial.Serial (HC-05/06). El puerto se abre en el propio hilo (abrir un SPP
+    puede tardar segundos): publica ("connected", puerto) o ("error", ("connected", exc)), y lo encolado
+    antes se escribe al abrir. La UI solo encola con send(), que nunca bloquea:
+      - la cola es acotada: si está llena send() devuelve False y publica ("backpressure", tamaño);
+      - un comando de movimiento nuevo reemplaza a los de movimiento aún no enviados (quedaron obsoletos);
+      - cada escritura publica ("serial_write", {"latency_ms", "queued_ms"}) o ("error", ("serial_write", exc));
+      - si el puerto falla (HC-05 fuera de alcance, desemparejado) publica ("link_lost", ("HC", puerto))
+        y el hilo termina: para recuperar el enlace se abre un SerialWriter nuevo.
+
+    Con binary=True el hilo saluda al firmware; si anuncia tramas binarias sube el enlace a
+    57600/115200 y cada comando viaja como trama con CRC que el robot confirma con ACK
+    (("ack", {"seq", "rtt_ms", "retries"}) o ("error", ("ack", exc))). Si no responde, sigue en texto.
+
+    Con un TelemetryBuffer en `telemetry`, un segundo hilo lee lo que manda el robot (sin bloquear:
+    solo lo que ya está en el buffer del puerto) y guarda cada muestra en el anillo; no publica eventos.
+    Mientras se escribe una trama y se espera su ACK el lector no toca el puerto; lo que llegue en ese
+    tiempo y no sea el ACK pasa al mismo TelemetryParser.
+
+    send()/send_command() aceptan una metricas.CommandTrace: el hilo marca inicio y fin de la escritura
+    (y el ACK si lo hay) y la entrega con trace.done(). Un comando reemplazado o perdido no se mide.
+    """
+
+    def __init__(self, port, events, baudrate=BAUD_DEFAULT, timeout=1, maxsize=32,
+                 binary=False, newline=True, ack_timeout=0.25, retries=1, telemetry=None, read_interval=0.02):
+        self.ser = None
+        self._open_args = (baudrate, timeout)
+        self.port = port
+        self.events = events
+        self.maxsize = maxsize
+        self.codec = TextCodec(newline)
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.coalesced = 0
+        self.delivered = 0
+        self.lost = 0
+        self._want_binary = binary
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._drain = False
+        self.telemetry = telemetry
+        self.read_interval = read_interval
+        self._io_lock = threading.Lock()  # el lector no consume bytes entre la escritura y su ACK
+        self._parser = TelemetryParser()  # compartido: el lector y la espera del ACK le pasan lo que leen
+        self._thread = threading.Thread(target=self._run, name=f"serial-{port}", daemon=True)
+        self._thread.start()
+
+    @property
+    def is_open(self):
+        return not self._closed and self.ser is not None and self.ser.is_open
+
+    def send(self, data, motion=False, trace=None):
+        with self._cond:
+            if self._closed:
+                return False
+            if motion:
+                before = len(self._pending)
+                self._pending = collections.deque(item for item in self._pending if not item[1])
+                self.coalesced += before - len(self._pending)
+            if len(self._pending) >= self.maxsize:
+                self.events.put(("backpressure", len(self._pending)))
+                return False
+            self._pending.append((data, motion, time.perf_counter(), trace))
+            self._cond.notify()
+        return True
+
+    def send_command(self, cmd, speed=None, duration_ms=0, trace=None):
+        """Comando de movimiento; se codifica (texto o trama) en el hilo escritor según lo negociado."""
+        return self.send((cmd, speed, duration_ms), motion=True, trace=trace)
+
+    def _open(self):
+        baudrate, timeout = self._open_args
+        try:
+            ser = serial.Serial(self.port, baudrate, timeout=timeout, write_timeout=timeout)
+        except Exception as e:
+            with self._cond:
+                self._closed = True
+                self._pending.clear()
+            self.events.put(("error", ("connected", e)))
+            return False
+        if self._closed:
+            ser.close()  # close() llegó mientras se abría
+            return False
+        self.ser = ser
+        self.events.put(("connected", self.port))
+        return True
+
+    def _run(self):
+        if not self._open():
+            return
+        if self._want_binary:
+            self._negotiate()
+        if self.telemetry is not None:
+            # después del saludo, para que el lector no se quede con la respuesta del firmware
+            threading.Thread(target=self._read_loop, name=f"serial-rx-{self.port}", daemon=True).start()
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not (self._drain and self._pending):
+                    break
+                data, motion, queued_at, trace = self._pending.popleft()
+            if isinstance(data, tuple):
+                data = self.codec.encode(*data)
+            try:
+                with self._io_lock:
+                    t0 = time.perf_counter()
+                    self.ser.write(data)
+                    self.ser.flush()
+                    t1 = time.perf_counter()
+                    self.events.put(("serial_write", {"latency_ms": (t1 - t0) * 1000,
+                                                      "queued_ms": (t0 - queued_at) * 1000}))
+                    acked = self.codec.binary and motion and self._wait_ack(data, t0)
+                if trace is not None:
+                    trace.write_start, trace.write_end = t0, t1
+                    if acked:
+                        trace.ack = time.perf_counter()
+                    trace.done()
+            except (serial.SerialException, OSError) as e:
+                self.events.put(("error", ("serial_write", e)))
+                with self._cond:
+                    self._closed = True
+                    self._pending.clear()
+                self.events.put(("link_lost", ("HC", self.port)))
+                break
+            except Exception as e:
+                self.events.put(("error", ("serial_write", e)))
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+    # ---------- PROTOCOLO BINARIO ----------
+    def _negotiate(self):
+        try:
+            old_timeout = self.ser.timeout
+            self.ser.timeout = 0.5
+            self.ser.reset_input_buffer()
+            self.ser.write(HELLO)
+            self.ser.flush()
+            advertised = parse_hello(self.ser.readline())
+            if advertised is not None:
+                baud = pick_baud(advertised)
+                if baud and baud != self.ser.baudrate:
+                    self.ser.write(f"BAUD {baud}\n".encode())
+                    self.ser.flush()
+                    if self.ser.readline().strip() == b"OK":
+                        self.ser.baudrate = baud
+                self.codec = BinaryCodec()
+            self.ser.timeout = old_timeout
+        except Exception as e:
+            self.events.put(("error", ("handshake", e)))
+        mode = "binario" if self.codec.binary else "texto"
+        self.events.put(("protocol", {"mode": mode, "baud": self.ser.baudrate}))
+
+    def _wait_ack(self, frame, t0):
+        """Con _io_lock tomado desde la escritura: el lector de telemetría no puede quedarse con el ACK."""
+        seq = frame[4]
+        old_timeout = self.ser.timeout
+        self.ser.timeout = self.ack_timeout
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.ser.write(frame)
+                    self.ser.flush()
+                if self._read_ack(seq):
+                    self.delivered += 1
+                    self.events.put(("ack", {"seq": seq, "rtt_ms": (time.perf_counter() - t0) * 1000,
+                                             "retries": attempt}))
+                    return True
+            self.lost += 1
+            self.events.put(("error", ("ack", TimeoutError(f"Sin ACK para la trama {seq}"))))
+            return False
+        finally:
+            self.ser.timeout = old_timeout
+
+    def _read_ack(self, seq):
+        deadline = time.perf_counter() + self.ack_timeout
+        while time.perf_counter() < deadline:
+            b = self.ser.read(1)
+            if not b:
+                return False
+            # dentro de una trama de telemetría a medias un 0x06 es un dato, no un ACK
+            if b[0] == ACK and not self._parser.buf.startswith(bytes([TELEMETRY_SYNC])):
+                got = self.ser.read(1)
+                if got and got[0] == seq:
+                    return True
+            else:
+                self._telemetry(b)
+        return False
+
+    # ---------- TELEMETRÍA ----------
+    def _telemetry(self, data):
+        if self.telemetry is not None:
+            for sample in self._parser.feed(data):
+                self.telemetry.append(sample)
+
+    def _read_loop(self):
+        while not self._closed:
+            with self._io_lock:
+                try:
+                    waiting = self.ser.in_waiting
+                    data = self.ser.read(waiting) if waiting else b""
+                except Exception:
+                    break  # puerto cerrado o caído: la pérdida la informa el hilo escritor
+                if data:
+                    self._telemetry(data)
+            if not data:
+                time.sleep(self.read_interval)
+
+    def close(self, drain=False):
+        """
+        No bloquea: el hilo cierra el puerto cuando termina la escritura en curso.
+        Con drain=True antes escribe lo ya encolado (el "S" de un motor cancelado justo antes).
+        """
+        with self._cond:
+            self._closed = True
+            self._drain = drain
+            if not drain:
+                self._pending.clear()
+            self._cond.notify()
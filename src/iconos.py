@@ -0,0 +1,140 @@
+"""
+Iconos compartidos por main.py, control.py y conexion.py.
+Los PNG de imagenes/ se escalan una sola vez y se guardan juntos en un atlas en disco
+(clave: nombre, mtime y tamaño de cada fuente + tamaño pedido). En los arranques siguientes se abre
+solo el atlas; CTkImage y PhotoImage se crean al pedirlos y se reutilizan.
+"""
+import hashlib, json, os
+from concurrent.futures import ThreadPoolExecutor
+import customtkinter as ctk
+from PIL import Image, ImageDraw, ImageTk
+
+ROOT_DIR = os.path.dirname(__file__)
+IMAGES_DIR = os.path.join(ROOT_DIR, "imagenes")
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "interfaz-blue")
+
+ICON_FILES = {
+    "Velocidad": "velocidad.png",
+    "Contenedor": "contenedor.png",
+    "Adelante": "adelante.png",
+    "Izquierda": "izquierda.png",
+    "Derecha": "derecha.png",
+    "Reversa": "reversa.png",
+    "Detener": "detener.png",
+    "Esperar": "esperar.png",
+    "Repetir": "repetir.png",
+    "Fin": "fin.png",
+    "Subrutina": "subrutina.png",
+    "Llamar": "llamar.png",
+    "Bluetooth": "bluetooth.png",
+    "Ejecutar": "ejecutar.png",
+    "Limpiar": "limpiar.png",
+}
+
+
+def placeholder(fname, size):
+    ph = Image.new("RGBA", size, (220, 220, 220, 255))
+    draw = ImageDraw.Draw(ph)
+    draw.rectangle((5, 5, size[0]-5, size[1]-5), outline=(180, 180, 180))
+    draw.text((8, 8), fname.split(".")[0][:6], fill=(80, 80, 80))
+    return ph
+
+
+def load_scaled(path, size):
+    """Abre y escala un PNG como hacían las apps (thumbnail LANCZOS); None si no se puede leer."""
+    try:
+        pil = Image.open(path).convert("RGBA")
+        pil.thumbnail(size, Image.LANCZOS)
+        return pil
+    except Exception:
+        return None
+
+
+def _cache_key(files, size):
+    h = hashlib.sha1(repr(size).encode())
+    for name, fname in sorted(files.items()):
+        try:
+            st = os.stat(os.path.join(IMAGES_DIR, fname))
+            h.update(f"{name}:{fname}:{st.st_mtime_ns}:{st.st_size};".encode())
+        except OSError:
+            h.update(f"{name}:{fname}:-;".encode())
+    return h.hexdigest()[:16]
+
+
+class IconSet:
+    """
+    icons[nombre] -> CTkImage; icons.pil(nombre) -> PIL.Image; icons.photo(nombre) -> ImageTk.PhotoImage.
+    Cada objeto se crea una vez y se comparte (el arrastre y los bloques ligeros reutilizan la misma PhotoImage).
+    """
+
+    def __init__(self, size=(55, 55), files=ICON_FILES, cache_dir=CACHE_DIR):
+        self.size = size
+        self.files = files
+        self.cache_dir = cache_dir
+        self._pil = {}
+        self._ctk = {}
+        self._photo = {}
+        self._load()
+
+    # ---------- ATLAS ----------
+    def _atlas_paths(self):
+        key = _cache_key(self.files, self.size)
+        base = os.path.join(self.cache_dir, f"iconos-{self.size[0]}x{self.size[1]}-{key}")
+        return base + ".png", base + ".json"
+
+    def _load(self):
+        png, index = self._atlas_paths()
+        try:
+            with open(index, encoding="utf-8") as f:
+                boxes = json.load(f)
+            atlas = Image.open(png)
+            atlas.load()
+        except (OSError, ValueError):
+            self._build(png, index)
+            return
+        for name, box in boxes.items():
+            self._pil[name] = atlas.crop(tuple(box)) if box else placeholder(self.files[name], self.size)
+
+    def _build(self, png, index):
+        names = list(self.files)
+        paths = [os.path.join(IMAGES_DIR, self.files[n]) for n in names]
+        # PIL libera el GIL al decodificar y escalar: los PNG se procesan en paralelo
+        with ThreadPoolExecutor(max_workers=min(8, len(paths) or 1)) as pool:
+            images = list(pool.map(lambda p: load_scaled(p, self.size), paths))
+        w, h = self.size
+        atlas = Image.new("RGBA", (w * len(names), h), (0, 0, 0, 0))
+        boxes = {}
+        for i, (name, pil) in enumerate(zip(names, images)):
+            if pil is None:
+                self._pil[name] = placeholder(self.files[name], self.size)
+                boxes[name] = None  # sin fuente: marcador (si el archivo aparece cambia la clave del atlas)
+                continue
+            self._pil[name] = pil
+            box = (i * w, 0, i * w + pil.width, pil.height)
+            atlas.paste(pil, box[:2])
+            boxes[name] = box
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atlas.save(png)
+            with open(index, "w", encoding="utf-8") as f:
+                json.dump(boxes, f)
+        except OSError:
+            pass  # sin caché escribible: se escala en cada arranque, como antes
+
+    # ---------- ACCESO ----------
+    def pil(self, name):
+        return self._pil[name]
+
+    def __getitem__(self, name):
+        img = self._ctk.get(name)
+        if img is None:
+            pil = self._pil[name]
+            img = self._ctk[name] = ctk.CTkImage(light_image=pil, dark_image=pil, size=self.size)
+        return img
+
+    def photo(self, name):
+        """PhotoImage única por icono (necesita la ventana Tk ya creada)."""
+        img = self._photo.get(name)
+        if img is None:
+            img = self._photo[name] = ImageTk.PhotoImage(self._pil[name])
+        return img
@@ -0,0 +1,125 @@
+import bisect
+from collections import defaultdict
+
+
+class GridIndex:
+    """
+    Índice espacial (hash por celdas fijas) de los rectángulos de los bloques del lienzo.
+    Se mantiene al colocar, mover y borrar, así las consultas de vecinos no piden bbox a Tk
+    ni recorren todos los bloques.
+    """
+
+    def __init__(self, cell=120):
+        self.cell = cell
+        self._cells = defaultdict(set)
+        self._rects = {}
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    def _cells_for(self, rect):
+        x1, y1, x2, y2 = rect
+        c = self.cell
+        for cx in range(int(x1 // c), int(x2 // c) + 1):
+            for cy in range(int(y1 // c), int(y2 // c) + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        if key in self._rects:
+            self.remove(key)
+        self._rects[key] = tuple(rect)
+        for cell in self._cells_for(rect):
+            self._cells[cell].add(key)
+
+    def remove(self, key):
+        rect = self._rects.pop(key, None)
+        if rect is None:
+            return
+        for cell in self._cells_for(rect):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+
+    def move(self, key, dx, dy):
+        x1, y1, x2, y2 = self._rects[key]
+        self.insert(key, (x1 + dx, y1 + dy, x2 + dx, y2 + dy))
+
+    def rect(self, key):
+        return self._rects.get(key)
+
+    def bounds(self):
+        """Rectángulo que contiene a todos los bloques (0, 0, 0, 0 si no hay ninguno)."""
+        if not self._rects:
+            return (0, 0, 0, 0)
+        rects = self._rects.values()
+        return (min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[2] for r in rects), max(r[3] for r in rects))
+
+    def query(self, rect, margin=0):
+        """Claves cuyos rectángulos intersectan `rect` ampliado en `margin` píxeles."""
+        x1, y1, x2, y2 = rect[0] - margin, rect[1] - margin, rect[2] + margin, rect[3] + margin
+        found, seen = set(), set()
+        for cell in self._cells_for((x1, y1, x2, y2)):
+            for key in self._cells.get(cell, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                a1, b1, a2, b2 = self._rects[key]
+                if a1 <= x2 and x1 <= a2 and b1 <= y2 and y1 <= b2:
+                    found.add(key)
+        return found
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+
+
+class OrderedBlocks:
+    """
+    Orden de ejecución de los bloques (por fila y luego por columna, como al leer) mantenido
+    con bisect al colocar, mover y borrar: ejecutar no necesita consultar geometría ni ordenar.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._key_of = {}
+        self._items = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        items = self._items
+        return (items[k[3]] for k in self._keys)
+
+    def upsert(self, key, rect, item=None):
+        old = self._key_of.get(key)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, old)]
+            tie = old[2]
+        else:
+            tie = self._counter
+            self._counter += 1
+        if item is not None:
+            self._items[key] = item
+        # el desempate por orden de inserción conserva la estabilidad del sort original
+        new = (rect[1], rect[0], tie, key)
+        self._key_of[key] = new
+        bisect.insort(self._keys, new)
+
+    def remove(self, key):
+        old = self._key_of.pop(key, None)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, old)]
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._keys.clear()
+        self._key_of.clear()
+        self._items.clear()
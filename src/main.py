@@ -1,12 +1,25 @@
-import customtkinter as ctk 
-from PIL import Image, ImageTk
-import os, serial, serial.tools.list_ports, tkinter as tk
+import customtkinter as ctk
+import bisect, os, queue, tkinter as tk
+from tkinter import filedialog, messagebox
+from descubrimiento import DeviceDiscovery, PortWatcher
+from dispositivos import KnownDevices
+from robots import RobotPool
+from protocolo import START_CMD, compile_program, program_duration_ms
+from modelo import Block, Sequence, Engine, CONTAINER_PARAMS
+from iconos import IconSet
+from arrastre import DragPreview
+from panel_telemetria import TelemetryPanel
+from metricas import LatencyStats
+from vista_previa import show_preview
+from trayectoria import Trajectory, PathOverlay
+from persistencia import EXTENSION, Journal, save_program, iter_program, load_chunked
 
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
-ROOT_DIR = os.path.dirname(__file__)
-IMAGES_DIR = os.path.join(ROOT_DIR, "imagenes")
+PALETTE = ["Contenedor", "Adelante", "Izquierda", "Derecha", "Reversa", "Detener", "Esperar",
+           "Repetir", "Fin", "Subrutina", "Llamar"]
+ROBOT_AUTO = "🤖 Automático"
 
 
 class DragDropApp(ctk.CTk):
@@ -17,55 +30,51 @@ class DragDropApp(ctk.CTk):
         self.configure(bg="#f8f9fa")
 
         self.sequence = []
-        self.serial_port = None
-        self.bt_connected = False
         self.selected_port = None
         self.drag_action = None
-        self.preview_win = None
         self.drag_line = None
         self.dragging_container = None
+        self.drop_targets = []  # (rect en pantalla, contenedor), medido al empezar cada arrastre
+        self.drop_mids = {}
+        self.marker_at = None  # (contenedor, índice) donde está la marca de inserción
         self.containers = []
         self.blocks = []
-        self.icons = {}
-        self.icons_pil = {}
-        self._load_icons()
+        # un robot por puerto, cada uno con su motor y su reconexión: los contenedores atados a robots
+        # distintos se ejecutan en paralelo; este motor solo resalta los bloques cuando no hay robot
+        self.stats = LatencyStats()  # latencia de cada comando por transporte (panel BT y CSV)
+        self.pool = RobotPool(self.after, on_status=self._robot_status, serial_options={"newline": False},
+                              stats=self.stats)
+        self.engine = Engine(self, self.after)
+        self.robot_rows = {}
+        self.link_events = queue.Queue()
+        # la lista de puertos la mantiene un hilo que publica solo altas y bajas
+        self.port_watcher = PortWatcher(self.link_events, port_filter=None)
+        self.port_rows = {}  # dirección -> (tipo "HC"/"BLE", fila)
+        self.discovery = None  # escaneo BLE; se crea con la primera búsqueda (arranca el loop de asyncio)
+        self.lbl_no_ports = None
+        # último puerto usado: si aparece al arrancar se conecta sin buscarlo a mano
+        self.known = KnownDevices()
+        last = self.known.last()
+        self.auto_port = last["address"] if last and last["transport"] == "HC" else None
+        # diario de autoguardado: cada edición añade una línea; se reproduce si la app no se cerró bien
+        self.journal = Journal("main", self._records)
+        self.loading = False
+        # recorrido estimado del contenedor que se está editando; recálculo desde el paso que cambió
+        self.path_container = None
+        self._path_pending = False
+        self.icons = IconSet()  # atlas en caché; PhotoImage compartida por icono
+        self.preview = DragPreview(self, self.icons, on_move=self._drag_hover)  # una sola ventana, movida a lo sumo una vez por cuadro
         self._build_ui()
-
-    # ---------- ICONOS ----------
-    def _load_icon_safe(self, fname, size=(55, 55)):
-        p = os.path.join(IMAGES_DIR, fname)
-        try:
-            pil = Image.open(p).convert("RGBA")
-            pil.thumbnail(size, Image.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=pil, dark_image=pil, size=size)
-            return ctk_img, pil
-        except Exception:
-            from PIL import ImageDraw
-            ph = Image.new("RGBA", size, (220, 220, 220, 255))
-            draw = ImageDraw.Draw(ph)
-            draw.rectangle((5, 5, size[0]-5, size[1]-5), outline=(180, 180, 180))
-            return ctk.CTkImage(light_image=ph, dark_image=ph, size=size), ph
-
-    def _load_icons(self):
-        mapping = {
-            "Contenedor": "contenedor.png",
-            "Adelante": "adelante.png",
-            "Izquierda": "izquierda.png",
-            "Derecha": "derecha.png",
-            "Reversa": "reversa.png",
-            "Detener": "detener.png",
-            "Esperar": "esperar.png",
-            "Bluetooth": "bluetooth.png"
-        }
-        for k, f in mapping.items():
-            ctk_img, pil_img = self._load_icon_safe(f)
-            self.icons[k] = ctk_img
-            self.icons_pil[k] = pil_img
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(50, self._poll_link_events)
+        self.after(200, self._offer_recovery)
+        self.port_watcher.start()
 
     # ---------- UI ----------
     def _build_ui(self):
         self.seq_area = tk.Canvas(self, bg="#dee2e6", highlightthickness=0)
         self.seq_area.pack(fill="both", expand=True, padx=15, pady=(60, 0))
+        self.path = PathOverlay(self.seq_area)
         self.seq_area.create_text(600, 100, text="🧩 Arrastra los bloques o un contenedor aquí",
                                   fill="#6c757d", font=("Arial Rounded MT Bold", 15, "italic"))
 
@@ -73,8 +82,16 @@ class DragDropApp(ctk.CTk):
                                        text_color="white", command=self.clear_all)
         self.btn_clear.place(relx=0.03, rely=0.05, anchor="nw")
 
+        self.btn_save = ctk.CTkButton(self, text="💾 Guardar", width=90, fg_color="#6c757d", hover_color="#495057",
+                                      text_color="white", command=self.save_program)
+        self.btn_save.place(relx=0.16, rely=0.05, anchor="nw")
+
+        self.btn_open = ctk.CTkButton(self, text="📂 Abrir", width=90, fg_color="#6c757d", hover_color="#495057",
+                                      text_color="white", command=self.open_program)
+        self.btn_open.place(relx=0.24, rely=0.05, anchor="nw")
+
         self.status_label = ctk.CTkLabel(self, text="Listo", text_color="gray", bg_color="#f8f9fa")
-        self.status_label.place(relx=0.18, rely=0.05)
+        self.status_label.place(relx=0.32, rely=0.05)
 
         bottom = ctk.CTkFrame(self, height=120, fg_color="#ffd60a")
         bottom.pack(side="bottom", fill="x", padx=10, pady=10)
@@ -83,7 +100,7 @@ class DragDropApp(ctk.CTk):
         bar = ctk.CTkFrame(bottom, fg_color="transparent")
         bar.pack(pady=6)
 
-        for action in ["Contenedor", "Adelante", "Izquierda", "Derecha", "Reversa", "Detener", "Esperar"]:
+        for action in PALETTE:
             btn = ctk.CTkButton(bar, image=self.icons[action], text="", width=75, height=75,
                                 fg_color="#ffffff", hover_color="#e9ecef", corner_radius=12)
             btn.pack(side="left", padx=10)
@@ -101,35 +118,25 @@ class DragDropApp(ctk.CTk):
     # ---------- DRAG ----------
     def _start_drag(self, event, action):
         self.drag_action = action
-        self.preview_win = tk.Toplevel(self)
-        self.preview_win.overrideredirect(True)
-        pil = self.icons_pil[action]
-        imgtk = ImageTk.PhotoImage(pil)
-        lbl = tk.Label(self.preview_win, image=imgtk, bg="white")
-        lbl.image = imgtk
-        lbl.pack()
-        self.preview_win.geometry(f"+{event.x_root}+{event.y_root}")
+        self._cache_drop_targets()
+        self.preview.show(action, event.x_root, event.y_root)
         self.bind_all("<Motion>", self._on_motion)
         self.bind_all("<ButtonRelease-1>", self._on_release)
 
     def _on_motion(self, e):
-        if not self.preview_win:
-            return
-        self.preview_win.geometry(f"+{e.x_root+10}+{e.y_root+10}")
-        for c in self.containers:
-            bbox = self.seq_area.bbox(c["id"])
-            if bbox:
-                sx, sy, ex, ey = bbox
-                if sx < e.x_root - self.seq_area.winfo_rootx() < ex and sy < e.y_root - self.seq_area.winfo_rooty() < ey:
-                    inner = c["inner"]
-                    blocks = c["blocks"]
-                    x_inner = e.x_root - inner.winfo_rootx()
-                    self._show_inner_line(inner, blocks, x_inner)
-                    return
+        self.preview.move(e.x_root, e.y_root)
+
+    def _drag_hover(self, x_root, y_root):
+        """Marca de inserción bajo el puntero; DragPreview la llama una vez por cuadro."""
+        for (x1, y1, x2, y2), c in self.drop_targets:
+            if x1 < x_root < x2 and y1 < y_root < y2:
+                rootx, mids = self._block_mids(c)
+                self._show_inner_line(c, bisect.bisect_right(mids, x_root - rootx))
+                return
         self._clear_inner_line()
 
     def _on_release(self, e):
-        if not self.preview_win:
+        if not self.preview.visible:
             return
         x, y = e.x_root, e.y_root
         sx, sy = self.seq_area.winfo_rootx(), self.seq_area.winfo_rooty()
@@ -139,38 +146,63 @@ class DragDropApp(ctk.CTk):
             if self.drag_action == "Contenedor":
                 self._create_container(relx, rely)
             else:
+                self._drag_hover(x, y)  # la última posición pudo no llegar a dibujarse
                 self._place_block(self.drag_action, relx, rely)
         self._clear_inner_line()
-        self.preview_win.destroy()
-        self.preview_win = None
+        self.preview.hide()
         self.unbind_all("<Motion>")
         self.unbind_all("<ButtonRelease-1>")
 
     # ---------- LÍNEA DENTRO ----------
-    def _show_inner_line(self, inner, blocks, x_inner):
+    def _cache_drop_targets(self):
+        """Rectángulos de los contenedores en coordenadas de pantalla, tomados una vez por arrastre."""
+        ox, oy = self.seq_area.winfo_rootx(), self.seq_area.winfo_rooty()
+        self.drop_targets = []
+        for c in self.containers:
+            bbox = self.seq_area.bbox(c["id"])
+            if bbox:
+                sx, sy, ex, ey = bbox
+                self.drop_targets.append(((sx + ox, sy + oy, ex + ox, ey + oy), c))
+        self.drop_mids = {}
+        self.marker_at = None
+
+    def _block_mids(self, c):
+        """Centros x de los bloques del contenedor; se miden la primera vez que el puntero entra en él."""
+        cached = self.drop_mids.get(c["id"])
+        if cached is None:
+            mids = [b["frame"].winfo_x() + b["frame"].winfo_width() // 2 for b in c["blocks"]]
+            cached = self.drop_mids[c["id"]] = (c["inner"].winfo_rootx(), mids)
+        return cached
+
+    def _show_inner_line(self, c, index):
+        """Una marca por contenedor, creada una vez; solo se reempaqueta si cambia el contenedor o el índice."""
+        if self.marker_at is not None and self.marker_at[0] is c and self.marker_at[1] == index:
+            return
         self._clear_inner_line()
+        if c["marker"] is None:
+            c["marker"] = tk.Frame(c["inner"], bg="#7209b7", width=4, height=70)
+        blocks = c["blocks"]
         if not blocks:
-            self.inner_line = tk.Frame(inner, bg="#7209b7", width=4, height=70)
-            self.inner_line.pack(side="left", padx=5)
-            return
-        for i, blk in enumerate(blocks):
-            mid = blk["frame"].winfo_x() + blk["frame"].winfo_width() // 2
-            if x_inner < mid:
-                self.inner_line = tk.Frame(inner, bg="#7209b7", width=4, height=70)
-                self.inner_line.pack(side="left", before=blk["frame"], padx=2)
-                return
-        self.inner_line = tk.Frame(inner, bg="#7209b7", width=4, height=70)
-        self.inner_line.pack(side="left", padx=2)
+            c["marker"].pack(side="left", padx=5)
+        elif index < len(blocks):
+            c["marker"].pack(side="left", before=blocks[index]["frame"], padx=2)
+        else:
+            c["marker"].pack(side="left", padx=2)
+        self.marker_at = (c, index)
 
     def _clear_inner_line(self):
-        if hasattr(self, "inner_line") and self.inner_line.winfo_exists():
-            self.inner_line.destroy()
+        if self.marker_at is not None:
+            marker = self.marker_at[0]["marker"]
+            if marker.winfo_exists():
+                marker.pack_forget()
+            self.marker_at = None
 
     # ---------- CONTENEDORES ----------
-    def _create_container(self, x, y):
+    def _create_container(self, x, y, name=None):
         frame = ctk.CTkFrame(self.seq_area, border_color="#7209b7", border_width=3,
                              corner_radius=12, fg_color="#e0bbf5")
-        label = ctk.CTkLabel(frame, text=f"Secuencia {len(self.containers)+1}",
+        name = name or f"Secuencia {len(self.containers)+1}"
+        label = ctk.CTkLabel(frame, text=name,
                              font=("Arial Rounded MT Bold", 14), text_color="#240046")
         label.pack(pady=(4, 2))
         inner = ctk.CTkFrame(frame, fg_color="#ffffff", corner_radius=10)
@@ -183,13 +215,30 @@ class DragDropApp(ctk.CTk):
         run = ctk.CTkButton(fr_btn, text="▶ Ejecutar", fg_color="#38b000", hover_color="#2d8700",
                             command=lambda c=inner_container: self._run_container(c))
         run.pack(side="left", padx=4)
+        upload = ctk.CTkButton(fr_btn, text="⬆ Subir", fg_color="#0077b6", hover_color="#005f8f",
+                               command=lambda c=inner_container: self._upload_container(c))
+        upload.pack(side="left", padx=4)
         clear = ctk.CTkButton(fr_btn, text="🧹 Limpiar", fg_color="#6c757d", hover_color="#495057",
                               command=lambda c=inner_container: self._clear_container(c))
         clear.pack(side="left", padx=4)
+        preview = ctk.CTkButton(fr_btn, text="👁", width=32, fg_color="#7209b7", hover_color="#560bad",
+                                command=lambda c=inner_container: self._preview_container(c))
+        preview.pack(side="left", padx=4)
+        robot_menu = ctk.CTkOptionMenu(fr_btn, width=130, values=self._robot_choices(),
+                                       command=lambda v, c=inner_container: self._bind_robot(c, v))
+        robot_menu.set(ROBOT_AUTO)
+        robot_menu.pack(side="left", padx=4)
+        status = ctk.CTkLabel(frame, text="", text_color="gray")
+        status.pack(pady=(0, 4))
 
         id_container = self.seq_area.create_window(x, y, window=frame, anchor="center")
-        self.containers.append({"id": id_container, "frame": frame, "inner": inner_container, "blocks": []})
+        # "robot": dirección del robot atado (None: el primero conectado); "engine": motor que lo ejecuta ahora
+        self.containers.append({"id": id_container, "frame": frame, "inner": inner_container, "blocks": [],
+                                "name": name, "marker": None, "robot": None, "robot_menu": robot_menu,
+                                "status": status, "highlight": None, "engine": None, "trajectory": Trajectory()})
         self._make_container_draggable(self.containers[-1])
+        self._journal_container(self.containers[-1])
+        return self.containers[-1]
 
     def _make_container_draggable(self, container):
         frame = container["frame"]
@@ -204,9 +253,14 @@ class DragDropApp(ctk.CTk):
 
         frame.bind("<Button-1>", start_drag)
         frame.bind("<B1-Motion>", do_drag)
+        frame.bind("<ButtonRelease-1>", lambda ev: self._journal_container(container))
 
     # ---------- BLOQUES ----------
     def _place_block(self, action, x, y):
+        if self.marker_at is not None:
+            c, index = self.marker_at
+            self._add_block_to_container(c, action, index)
+            return
         for c in self.containers:
             bbox = self.seq_area.bbox(c["id"])
             if bbox:
@@ -214,16 +268,24 @@ class DragDropApp(ctk.CTk):
                 if sx < x < ex and sy < y < ey:
                     self._add_block_to_container(c, action)
                     return
+        self._add_free_block(action, x, y)
+
+    def _add_free_block(self, action, x, y):
         lbl = ctk.CTkLabel(self.seq_area, image=self.icons[action], text="")
-        self.seq_area.create_window(x, y, window=lbl)
+        lbl.window_id = self.seq_area.create_window(x, y, window=lbl)
+        lbl.action = action
         lbl.bind("<Button-3>", lambda e, b=lbl: self._delete_free_block(b))
         self.blocks.append(lbl)
+        self._journal_free_block(lbl)
 
-    def _add_block_to_container(self, container, action):
+    def _add_block_to_container(self, container, action, index=None, value=None):
         inner = container["inner"]
+        blocks = container["blocks"]
+        if index is None or index > len(blocks):
+            index = len(blocks)
         blk = ctk.CTkFrame(inner, border_color="#ced4da", border_width=1, corner_radius=8)
-        if hasattr(self, "inner_line") and self.inner_line.winfo_exists():
-            blk.pack(in_=inner, side="left", before=self.inner_line, padx=4, pady=4)
+        if index < len(blocks):
+            blk.pack(side="left", before=blocks[index]["frame"], padx=4, pady=4)
         else:
             blk.pack(side="left", padx=4, pady=4)
 
@@ -238,24 +300,48 @@ class DragDropApp(ctk.CTk):
         elif action in ["Izquierda", "Derecha"]:
             entry = ctk.CTkEntry(blk, width=40, placeholder_text="°")
             entry.pack(side="left", padx=2)
+        elif action == "Repetir":
+            entry = ctk.CTkEntry(blk, width=40, placeholder_text="×")
+            entry.pack(side="left", padx=2)
+        elif action in ["Subrutina", "Llamar"]:
+            entry = ctk.CTkEntry(blk, width=50, placeholder_text="A")
+            entry.pack(side="left", padx=2)
 
         del_btn = ctk.CTkButton(blk, text="✖", width=20, fg_color="#c62828",
                                 hover_color="#a71d2a", command=lambda b=blk: self._delete_block(container, b))
         del_btn.pack(side="right", padx=2)
 
-        container["blocks"].append({"type": action, "frame": blk, "param": entry})
+        record = {"type": action, "frame": blk, "param": entry}
+        # el modelo guarda el valor tipado; la entrada solo lo actualiza al editarse
+        record["model"] = Block(action, None, CONTAINER_PARAMS, view=record)
+        if entry:
+            if value is not None:
+                entry.insert(0, value if isinstance(value, str) else f"{value:g}")
+                record["model"].set_value(value)
+            entry.bind("<KeyRelease>", lambda ev, m=record["model"], e=entry: (m.set_value(e.get()),
+                                                                             self._schedule_path(container)))
+            entry.bind("<FocusOut>", lambda ev, m=record["model"], e=entry: (m.set_value(e.get()),
+                                                                           self._journal_container(container)))
+        # el modelo queda en el mismo orden que se ve en el contenedor
+        blocks.insert(index, record)
         self._clear_inner_line()
+        self._journal_container(container)
+        self._schedule_path(container)
 
     # ---------- ELIMINAR Y LIMPIAR ----------
     def _delete_free_block(self, block):
         self.seq_area.delete(self.seq_area.find_withtag("current"))
         if block in self.blocks:
             self.blocks.remove(block)
+            if not self.loading:
+                self.journal.delete(block.window_id)
         block.destroy()
 
     def _delete_block(self, container, block_frame):
         container["blocks"] = [b for b in container["blocks"] if b["frame"] != block_frame]
         block_frame.destroy()
+        self._journal_container(container)
+        self._schedule_path(container)
 
     def _clear_container(self, inner_container):
         for c in self.containers:
@@ -263,69 +349,294 @@ class DragDropApp(ctk.CTk):
                 for blk in c["blocks"]:
                     blk["frame"].destroy()
                 c["blocks"].clear()
+                self._journal_container(c)
+                self._schedule_path(c)
                 break
 
-    # ---------- EJECUTAR CONTENEDOR ----------
-    def _run_container(self, inner_container):
-        for c in self.containers:
-            if c["inner"] == inner_container:
-                self._execute_blocks(c["blocks"], 0)
-                break
+    # ---------- RECORRIDO ESTIMADO ----------
+    def _schedule_path(self, container):
+        """Junta los cambios de un mismo ciclo en un solo recálculo del contenedor editado."""
+        self.path_container = container
+        if not self.loading and not self._path_pending:
+            self._path_pending = True
+            self.after_idle(self._update_path)
+
+    def _update_path(self):
+        self._path_pending = False
+        c = self.path_container
+        if c is None or c not in self.containers or not c["blocks"]:
+            self.path.hide()
+            return
+        try:
+            c["trajectory"].update(self._sequence(c).steps())
+        except ValueError:
+            self.path.hide()  # Repetir/Fin a medio poner: sin recorrido hasta que case
+            return
+        self.path.show(c["trajectory"], c["name"])
+
+    # ---------- GUARDAR / ABRIR ----------
+    def _container_record(self, c):
+        x, y = self.seq_area.coords(c["id"])
+        blocks = [{"tipo": b["type"], "valor": b["model"].value if b["param"] and b["param"].get() else None}
+                  for b in c["blocks"]]
+        return {"t": "contenedor", "id": c["id"], "nombre": c["name"], "x": x, "y": y, "bloques": blocks,
+                "robot": c["robot"]}
+
+    def _free_block_record(self, lbl):
+        x, y = self.seq_area.coords(lbl.window_id)
+        return {"t": "bloque", "id": lbl.window_id, "tipo": lbl.action, "valor": None, "x": x, "y": y}
+
+    def _records(self):
+        return [self._container_record(c) for c in self.containers] + \
+               [self._free_block_record(b) for b in self.blocks]
+
+    def _journal_container(self, container):
+        if not self.loading:
+            self.journal.put(self._container_record(container))
+
+    def _journal_free_block(self, lbl):
+        if not self.loading:
+            self.journal.put(self._free_block_record(lbl))
+
+    def save_program(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=EXTENSION,
+                                            filetypes=[("Programa", "*" + EXTENSION)])
+        if not path:
+            return
+        try:
+            save_program(path, "main", self._records())
+        except OSError as e:
+            self.status_label.configure(text=f"Error al guardar: {e}", text_color="red")
+            return
+        self.status_label.configure(text=f"💾 Guardado: {os.path.basename(path)}", text_color="gray")
 
-    def _execute_blocks(self, blocks, index):
-        if index >= len(blocks):
-            self.status_label.configure(text="Listo ✅", text_color="gray")
-            if self.bt_connected:
-                self.serial_port.write(b"S\n")
+    def open_program(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("Programa", "*" + EXTENSION)])
+        if not path:
+            return
+        try:
+            records = iter_program(path, "main")
+        except (OSError, ValueError) as e:
+            # sin tocar el programa actual ni el diario
+            self.status_label.configure(text=f"Error al abrir {os.path.basename(path)}: {e}", text_color="red")
             return
+        self._load_records(records, os.path.basename(path))
 
-        blk = blocks[index]
-        action = blk["type"]
-        entry = blk.get("param")
-        param_value = 1
-        if entry:
-            try:
-                param_value = float(entry.get())
-            except:
-                param_value = 1
+    def _load_records(self, records, label, failed=None):
+        """Construye contenedores y bloques por tandas (persistencia.load_chunked) sin congelar la ventana."""
+        if self.loading:
+            return
+        self.loading = True  # sin diario mientras tanto: el anterior sigue intacto hasta terminar
+        # failed: error de una carga anterior; `records` es entonces el programa previo, sacado del diario
+        self.clear_all()
+        self.status_label.configure(text=f"📂 Abriendo {label}...", text_color="blue")
+
+        def apply(rec):
+            if rec.get("t") == "contenedor":
+                c = self._create_container(rec["x"], rec["y"], rec.get("nombre"))
+                if rec.get("robot"):
+                    self._bind_robot(c["inner"], rec["robot"])
+                for b in rec.get("bloques", []):
+                    if b.get("tipo") in PALETTE and b["tipo"] != "Contenedor":
+                        self._add_block_to_container(c, b["tipo"], value=b.get("valor"))
+            elif rec.get("t") == "bloque" and rec.get("tipo") in PALETTE:
+                self._add_free_block(rec["tipo"], rec["x"], rec["y"])
+
+        load_chunked(self.after, records, apply, lambda count, error: self._load_finished(label, count, error, failed))
+
+    def _load_finished(self, label, count, error, failed=None):
+        self.loading = False
+        if error is not None and failed is None:
+            # archivo corrupto a mitad: el diario no se tocó durante la carga y tiene el programa anterior
+            self._load_records(self.journal.replay(), label, failed=error)
+            return
+        if failed is not None or error is not None:
+            # restaurando (o el propio diario falló): el diario se queda como estaba, sin compactar
+            note = " (se recuperó el programa anterior)" if error is None else ""
+            self.status_label.configure(text=f"Error al abrir {label}: {failed or error}{note}", text_color="red")
+            return
+        self.journal.compact()
+        self.status_label.configure(text=f"📂 {label}: {count} elementos", text_color="gray")
+
+    def _offer_recovery(self):
+        records = self.journal.replay()
+        if records and messagebox.askyesno(
+                "Recuperar programa",
+                f"La sesión anterior no se cerró bien y tiene {len(records)} elementos sin guardar. ¿Recuperarlos?",
+                parent=self):
+            self._load_records(records, "autoguardado")
+        else:
+            self.journal.discard()
 
-        # Resaltar bloque actual
-        highlight = tk.Frame(blk["frame"], bg="#ff6d00", highlightthickness=3)
-        highlight.place(relx=0, rely=0, relwidth=1, relheight=1)
+    # ---------- EJECUTAR CONTENEDOR ----------
+    def _sequence(self, container):
+        """Modelo de la secuencia: cada bloque va seguido de una parada de 200 ms antes de la siguiente acción."""
+        return Sequence(container["name"], [b["model"] for b in container["blocks"]],
+                        initial_speed=None, stop_gap_ms=200)
 
-        display_text = f"{action}"
-        if action in ["Esperar", "Adelante", "Reversa"]:
-            display_text += f" - {param_value}s"
-        elif action in ["Izquierda", "Derecha"]:
-            display_text += f" - {param_value}°"
+    def _run_container(self, inner_container):
+        for c in self.containers:
+            if c["inner"] == inner_container:
+                robot = self._robot_for(c)
+                if c["robot"] and robot is None:
+                    c["status"].configure(text=f"⚠ {c['robot']} no está conectado", text_color="orange")
+                    return
+                self._execute_blocks(c, robot.engine if robot else self.engine, self._sequence(c))
+                break
 
-        self.status_label.configure(text=f"Ejecutando: {display_text}", text_color="blue")
+    def _preview_container(self, inner_container):
+        """Ejecución en seco con reloj virtual: comandos e instantes exactos sin esperar ni tocar el robot."""
+        for c in self.containers:
+            if c["inner"] == inner_container:
+                try:
+                    summary = show_preview(self, c["name"], self._sequence(c))
+                except ValueError as e:
+                    c["status"].configure(text=f"Error: {e}", text_color="red")
+                    return
+                c["status"].configure(text=summary, text_color="gray")
+                break
 
-        # Enviar comando al Arduino
-        if self.bt_connected:
-            cmd = {"Adelante": "F", "Reversa": "B", "Izquierda": "L", "Derecha": "R", "Detener": "S"}.get(action, "S")
-            self.serial_port.write(cmd.encode())
+    def _upload_container(self, inner_container):
+        """Subir y ejecutar: compila el contenedor en un programa, lo envía en una sola transferencia y lo arranca."""
+        for c in self.containers:
+            if c["inner"] == inner_container:
+                robot = self._robot_for(c)
+                if robot is None:
+                    c["status"].configure(text="⚠ Conecta un robot primero", text_color="orange")
+                    return
+                try:
+                    steps = self._sequence(c).upload_steps()
+                    program = compile_program(steps)
+                except ValueError as e:
+                    c["status"].configure(text=f"Error: {e}", text_color="red")
+                    return
+                # el arranque solo si el programa entró en la cola: con la cola llena send() lo descarta
+                if not (robot.send(program) and robot.send(START_CMD)):
+                    c["status"].configure(text=f"⚠ No se pudo enviar el programa a {robot.name} (enlace ocupado)",
+                                          text_color="red")
+                    return
+                secs = program_duration_ms(steps) / 1000
+                c["status"].configure(text=f"⬆ Programa enviado a {robot.name}: {len(steps)} pasos, "
+                                           f"{secs:.1f}s", text_color="blue")
+                break
 
-        # ---- FLUIDEZ MEJORADA ----
-        if action == "Esperar":
-            delay = int(param_value * 1000)
-        elif action in ["Adelante", "Reversa"]:
-            delay = int(param_value * 1000)
-        elif action in ["Izquierda", "Derecha"]:
-            delay = int((param_value / 90) * 1000)
-        else:
-            delay = 700
+    def _execute_blocks(self, container, engine, sequence):
+        """
+        El motor dispara cada paso en su plazo absoluto de time.monotonic();
+        aquí solo se resalta el bloque actual del contenedor.
+        Cada robot tiene su motor: si otro contenedor usaba este mismo, queda interrumpido.
+        Repetir y Llamar no se expanden: el motor pide los pasos al intérprete de uno en uno,
+        ya optimizados (sin la parada entre dos movimientos iguales, paradas seguidas unidas).
+        """
+        try:
+            steps = sequence.optimized()
+        except ValueError as e:
+            container["status"].configure(text=f"Error: {e}", text_color="red")
+            return
+        for other in self.containers:
+            if other["engine"] is engine and other is not container:
+                self._clear_highlight(other)
+                other["status"].configure(text="Interrumpido", text_color="gray")
+                other["engine"] = None
+        self._clear_highlight(container)
+        container["engine"] = engine
+        engine.run_steps(steps, lambda index, step: self._execute_step(container, index, step),
+                         lambda scheduler: self._sequence_done(container, scheduler))
+
+    def _execute_step(self, container, index, step):
+        self._clear_highlight(container)
+        if step.block is None:
+            # parada entre bloques (ya enviada por el motor)
+            return
 
-        # pasa al siguiente bloque sin interrupciones
-        self.after(delay, lambda: self._finish_block(highlight, blocks, index))
+        blk = step.block
+        if not blk.view["frame"].winfo_exists():
+            return  # bloque borrado durante la ejecución: el motor sigue, solo no hay qué resaltar
+        # Resaltar bloque actual
+        container["highlight"] = tk.Frame(blk.view["frame"], bg="#ff6d00", highlightthickness=3)
+        container["highlight"].place(relx=0, rely=0, relwidth=1, relheight=1)
+
+        display_text = f"{blk.kind}"
+        if blk.spec:
+            display_text += f" - {blk.value}{blk.spec.unit}"
+        container["status"].configure(text=f"Ejecutando: {display_text}", text_color="blue")
+
+    def _clear_highlight(self, container):
+        highlight = container["highlight"]
+        if highlight is not None:
+            if highlight.winfo_exists():
+                highlight.destroy()
+            container["highlight"] = None
+
+    def _sequence_done(self, container, scheduler):
+        self._clear_highlight(container)
+        container["engine"] = None
+        container["status"].configure(text=f"Listo ✅ ({scheduler.summary()})", text_color="gray")
+
+    def send_command(self, cmd, speed=None, duration_ms=0):
+        """Transport del motor sin robot: los pasos solo se resaltan."""
+
+    # ---------- ROBOTS ----------
+    def _robot_choices(self):
+        return [ROBOT_AUTO] + [r.address for r in self.pool.connected()]
+
+    def _robot_for(self, container):
+        """El robot atado al contenedor, o el primero conectado si el contenedor no tiene uno."""
+        if container["robot"]:
+            robot = self.pool.get(container["robot"])
+            return robot if robot and robot.connected else None
+        connected = self.pool.connected()
+        return connected[0] if connected else None
+
+    def _bind_robot(self, inner_container, value):
+        for c in self.containers:
+            if c["inner"] == inner_container:
+                c["robot"] = None if value == ROBOT_AUTO else value
+                c["robot_menu"].set(value)
+                self._journal_container(c)
+                break
 
-    def _finish_block(self, highlight, blocks, index):
-        highlight.destroy()
-        # detener movimiento antes de siguiente acción
-        if self.bt_connected:
-            self.serial_port.write(b"S")
-        # ejecutar el siguiente bloque con transición fluida
-        self.after(200, lambda: self._execute_blocks(blocks, index + 1))
+    def _refresh_robot_menus(self):
+        choices = self._robot_choices()
+        for c in self.containers:
+            # el robot atado sigue en la lista aunque esté desconectado, para no perder la asignación
+            extra = [c["robot"]] if c["robot"] and c["robot"] not in choices else []
+            c["robot_menu"].configure(values=choices + extra)
+
+    def _robot_status(self, robot, text, color):
+        """Estado de un robot (lo llama el pool, también desde su LinkSupervisor) en su fila del panel."""
+        row = self.robot_rows.get(robot.address)
+        if row is None:
+            fr = ctk.CTkFrame(self.frame_robots, fg_color="#caf0f8", corner_radius=6)
+            fr.pack(fill="x", padx=4, pady=2)
+            ctk.CTkButton(fr, text="✖", width=24, fg_color="#c62828", hover_color="#a71d2a",
+                          command=lambda a=robot.address: self._disconnect_robot(a)).pack(side="right", padx=3)
+            lbl = ctk.CTkLabel(fr, text="", anchor="w", wraplength=180, cursor="hand2")
+            lbl.pack(side="left", fill="x", expand=True, padx=5)
+            lbl.bind("<Button-1>", lambda e, r=robot: self.telemetry_panel.show(r.telemetry, r.name))
+            row = self.robot_rows[robot.address] = (fr, lbl)
+            self.btn_disconnect.configure(state="normal")
+            if self.telemetry_panel.buffer is None:
+                self.telemetry_panel.show(robot.telemetry, robot.name)
+        row[1].configure(text=f"{robot.name}: {text}", text_color=color)
+
+    def _disconnect_robot(self, address):
+        robot = self.pool.get(address)
+        if robot is not None:
+            for c in self.containers:
+                if c["engine"] is robot.engine:
+                    self._clear_highlight(c)
+                    c["status"].configure(text="Robot desconectado", text_color="red")
+                    c["engine"] = None
+        if robot is not None and self.telemetry_panel.buffer is robot.telemetry:
+            self.telemetry_panel.show(None)
+        self.pool.disconnect(address)
+        fr, _ = self.robot_rows.pop(address, (None, None))
+        if fr is not None:
+            fr.destroy()
+        if not self.robot_rows:
+            self.btn_disconnect.configure(state="disabled")
+        self._refresh_robot_menus()
 
     # ---------- BLUETOOTH ----------
     def _build_bt_panel(self):
@@ -338,12 +649,27 @@ class DragDropApp(ctk.CTk):
         self.frame_ports.pack(fill="both", padx=10, pady=6)
         self.lbl_bt = ctk.CTkLabel(self.bt_panel, text="No conectado", text_color="red")
         self.lbl_bt.pack(pady=4)
+        ctk.CTkLabel(self.bt_panel, text="Robots conectados:", text_color="#0077b6").pack()
+        self.frame_robots = ctk.CTkFrame(self.bt_panel, fg_color="transparent")
+        self.frame_robots.pack(fill="x", padx=10, pady=2)
+        self.lbl_link = ctk.CTkLabel(self.bt_panel, text="", text_color="gray")
+        self.lbl_link.pack()
+        self.var_binary = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self.bt_panel, text="Protocolo binario", variable=self.var_binary).pack(pady=4)
         self.btn_connect = ctk.CTkButton(self.bt_panel, text="Conectar", fg_color="#0077b6",
-                                         hover_color="#0096c7", command=self._connect_selected)
+                                         hover_color="#0096c7", command=self._connect_selected)  # añade un robot más
         self.btn_connect.pack(pady=4)
-        self.btn_disconnect = ctk.CTkButton(self.bt_panel, text="Desconectar", fg_color="#c62828",
+        self.btn_disconnect = ctk.CTkButton(self.bt_panel, text="Desconectar todos", fg_color="#c62828",
                                             hover_color="#a71d2a", command=self.disconnect_bt, state="disabled")
         self.btn_disconnect.pack(pady=4)
+        self.lbl_latency = ctk.CTkLabel(self.bt_panel, text="", font=("Courier", 11), justify="left")
+        self.lbl_latency.pack(padx=6)
+        ctk.CTkButton(self.bt_panel, text="📊 Exportar latencias CSV", fg_color="#6c757d", hover_color="#495057",
+                      command=self.export_latency).pack(pady=4)
+        self.after(1000, self._refresh_latency)
+        # telemetría del robot elegido en la lista (clic en su nombre)
+        self.telemetry_panel = TelemetryPanel(self.bt_panel)
+        self.telemetry_panel.pack(fill="x", pady=4)
 
     def _toggle_bt_panel(self):
         if self.bt_panel.winfo_ismapped():
@@ -352,18 +678,40 @@ class DragDropApp(ctk.CTk):
             self.bt_panel.place(relx=0.985, rely=0.13, anchor="ne")
 
     def scan_ports(self):
-        for w in self.frame_ports.winfo_children():
-            w.destroy()
-        ports = list(serial.tools.list_ports.comports())
-        if not ports:
-            ctk.CTkLabel(self.frame_ports, text="No se encontraron dispositivos").pack(pady=5)
+        self.port_watcher.rescan()
+        if self.discovery is None:
+            self.discovery = DeviceDiscovery(self.pool.ble_loop(), self.link_events, ble_named_only=True,
+                                             serial_ports=False)
+        if self.discovery.start(ble_timeout=5.0):
+            self.btn_scan.configure(state="disabled", text="🔍 Buscando BLE...")
+        self._show_no_ports()
+
+    def _show_no_ports(self):
+        if not self.port_rows and self.lbl_no_ports is None:
+            self.lbl_no_ports = ctk.CTkLabel(self.frame_ports, text="No se encontraron dispositivos")
+            self.lbl_no_ports.pack(pady=5)
+
+    def _add_port_row(self, typ, port, description):
+        if port in self.port_rows:
             return
-        for p in ports:
-            fr = ctk.CTkFrame(self.frame_ports, fg_color="#caf0f8", corner_radius=6)
-            fr.pack(fill="x", padx=4, pady=3)
-            btn = ctk.CTkButton(fr, text=f"{p.description} ({p.device})", fg_color="#00b4d8",
-                                hover_color="#0096c7", command=lambda port=p.device: self._select_port(port))
-            btn.pack(fill="x", padx=5, pady=3)
+        if self.lbl_no_ports is not None:
+            self.lbl_no_ports.destroy()
+            self.lbl_no_ports = None
+        fr = ctk.CTkFrame(self.frame_ports, fg_color="#caf0f8", corner_radius=6)
+        fr.pack(fill="x", padx=4, pady=3)
+        btn = ctk.CTkButton(fr, text=f"[{typ}] {description or 'Desconocido'} ({port})", fg_color="#00b4d8",
+                            hover_color="#0096c7", command=lambda p=port: self._select_port(p))
+        btn.pack(fill="x", padx=5, pady=3)
+        self.port_rows[port] = (typ, fr)
+
+    def _remove_port_row(self, port):
+        typ, fr = self.port_rows.pop(port, (None, None))
+        if fr is not None:
+            fr.destroy()
+        if port == self.selected_port:
+            self.selected_port = None
+            self.lbl_bt.configure(text="No conectado", text_color="red")
+        self._show_no_ports()
 
     def _select_port(self, port):
         self.selected_port = port
@@ -373,34 +721,132 @@ class DragDropApp(ctk.CTk):
         if not self.selected_port:
             self.lbl_bt.configure(text="⚠ Selecciona un puerto", text_color="orange")
             return
-        self._connect_serial(self.selected_port)
+        typ, fr = self.port_rows.get(self.selected_port, ("HC", None))
+        self._connect_robot(self.selected_port, typ)
 
-    def _connect_serial(self, port):
+    def _connect_robot(self, port, typ="HC"):
+        robot = self.pool.get(port)
+        if robot is not None and robot.connected:
+            self.lbl_bt.configure(text=f"{port} ya está conectado", text_color="#0077b6")
+            return
         try:
-            self.serial_port = serial.Serial(port, 9600, timeout=1)
-            self.lbl_bt.configure(text=f"Conectado: {port}", text_color="green")
-            self.btn_disconnect.configure(state="normal")
-            self.bt_connected = True
+            if typ == "BLE":
+                # todos los robots BLE comparten el loop del pool; la characteristic recordada evita buscarla
+                known = self.known.get(port) or {}
+                self.pool.connect(port, "BLE", name=known.get("name"), write_char=known.get("write_char"))
+            else:
+                # el hilo SerialWriter de cada robot es dueño de su puerto; la UI solo encola comandos
+                # este firmware recibe solo la letra del comando (sin velocidad ni salto de línea)
+                self.pool.connect(port, "HC", binary=self.var_binary.get())
+            # el enlace se abre en su hilo/loop: el resultado llega como "connected" o error (_poll_link_events)
+            self.lbl_bt.configure(text=f"Conectando a {port}...", text_color="blue")
         except Exception as e:
             self.lbl_bt.configure(text=f"Error: {e}", text_color="red")
+        self._refresh_robot_menus()
+
+    def _poll_link_events(self):
+        """Puertos (PortWatcher) y, de cada robot, latencia, saturación y errores de su hilo escritor."""
+        try:
+            while True:
+                kind, info = self.link_events.get_nowait()
+                if kind == "device":
+                    typ, port, description, p = info
+                    self._add_port_row(typ, port, description)
+                    if port == self.auto_port and self.pool.get(port) is None:
+                        self.auto_port = None
+                        self._select_port(port)
+                        self._connect_robot(port)
+                elif kind == "scan_done":
+                    self.btn_scan.configure(state="normal", text="🔍 Buscar dispositivos")
+                    self._show_no_ports()
+                elif kind == "device_lost":
+                    self._remove_port_row(info)
+                    robot = self.pool.get(info)
+                    if robot is not None and robot.connected:
+                        robot.link_lost(f"{info} ya no está disponible")
+                        self._refresh_robot_menus()
+        except queue.Empty:
+            pass
+        # conexión y reconexión ya las trató cada Robot; aquí solo se muestran
+        for robot, kind, info in self.pool.poll():
+            if kind == "connected":
+                self.lbl_bt.configure(text=f"Conectado: {robot.name}", text_color="green")
+                profile = robot.link.profile if robot.transport == "BLE" else None
+                if profile:
+                    self.known.remember(robot.address, "BLE", robot.name, profile["write_char"],
+                                        profile["without_response"])
+                else:
+                    self.known.remember(robot.address, robot.transport)
+                self._refresh_robot_menus()
+            elif kind in ("link_lost", "gave_up"):
+                # sin enlace el robot deja de ofrecerse y de recibir envíos (Robot.connected ya es False)
+                self._refresh_robot_menus()
+                if kind == "gave_up":
+                    self.lbl_bt.configure(text=f"Sin enlace: {robot.name}", text_color="red")
+            elif kind == "serial_write":
+                self.lbl_link.configure(text=f"{robot.name} escritura: {info['latency_ms']:.1f} ms "
+                                             f"(en cola {info['queued_ms']:.1f} ms)")
+            elif kind == "protocol":
+                self.lbl_link.configure(text=f"{robot.name}: protocolo {info['mode']} a {info['baud']} baudios")
+            elif kind == "ack":
+                self.lbl_link.configure(text=f"{robot.name} ACK #{info['seq']}: {info['rtt_ms']:.1f} ms")
+            elif kind == "backpressure":
+                self.lbl_link.configure(text=f"⚠ {robot.name} saturado ({info} comandos en cola)")
+            elif kind == "error":
+                op, exc = info
+                if op == "ack":
+                    self.lbl_link.configure(text=f"⚠ {robot.name}: {exc}")
+                elif op == "connected":
+                    if not robot.supervisor.recovering:
+                        self.lbl_bt.configure(text=f"Error: {exc}", text_color="red")
+                else:
+                    self.pool.set_status(robot, f"Error: {exc}", "red")
+        self.after(50, self._poll_link_events)
+
+    def _refresh_latency(self):
+        """p50/p95/p99 por transporte y etapa; una vez por segundo y solo con el panel a la vista."""
+        if self.bt_panel.winfo_ismapped():
+            self.lbl_latency.configure(text=self.stats.summary_text())
+        self.after(1000, self._refresh_latency)
+
+    def export_latency(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            samples = self.stats.export_csv(path)
+        except OSError as e:
+            self.lbl_link.configure(text=f"Error al exportar: {e}")
+            return
+        self.lbl_link.configure(text=f"📊 {os.path.basename(path)} y {os.path.basename(samples)}")
 
     def disconnect_bt(self):
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
+        for address in list(self.robot_rows):
+            self._disconnect_robot(address)
         self.lbl_bt.configure(text="Desconectado", text_color="red")
-        self.btn_disconnect.configure(state="disabled")
-        self.bt_connected = False
 
     # ---------- LIMPIAR ----------
     def clear_all(self):
         for c in self.containers:
+            if c["engine"] is not None:
+                c["engine"].cancel()
             self.seq_area.delete(c["id"])
         for b in self.blocks:
             b.destroy()
         self.containers.clear()
         self.blocks.clear()
+        self.path_container = None
+        self.path.hide()
+        if not self.loading:
+            self.journal.clear()
         self.status_label.configure(text="Todo limpio", text_color="gray")
 
+    def _on_close(self):
+        self.port_watcher.stop()
+        self.pool.close_all()
+        self.journal.discard()
+        self.destroy()
+
 
 if __name__ == "__main__":
     app = DragDropApp()
@@ -0,0 +1,158 @@
+"""
+Latencia de cada comando a lo largo del camino de envío, por transporte ("HC", "BLE").
+
+Etapas (ms):
+    tk         plazo del paso en el planificador -> comando encolado (retraso de Tk/after)
+    cola       encolado -> empieza la escritura (enlace saturado, escrituras anteriores)
+    escritura  empieza -> termina la escritura (SPP lento, characteristic BLE con respuesta)
+    ack        fin de la escritura -> ACK del robot (solo protocolo binario HC)
+    total      plazo (o encolado, fuera de una secuencia) -> ACK o fin de la escritura
+
+Cada etapa se acumula en un histograma logarítmico de tamaño fijo (p50/p95/p99 sin guardar todas
+las muestras); las últimas `keep` trazas completas se guardan para exportarlas a CSV.
+"""
+import collections, csv, math, os, threading, time
+
+STAGES = ("tk", "cola", "escritura", "ack", "total")
+
+
+class Histogram:
+    """Cubetas logarítmicas de `lo` a `hi` ms (`per_decade` por década): error relativo ~12% con 20."""
+
+    def __init__(self, lo=0.01, hi=60000.0, per_decade=20):
+        self.lo = lo
+        self.per_decade = per_decade
+        self.size = int(math.ceil(math.log10(hi / lo) * per_decade)) + 1
+        self.counts = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, ms):
+        if ms <= self.lo:
+            return 0
+        return min(self.size - 1, int(math.log10(ms / self.lo) * self.per_decade))
+
+    def _upper(self, bucket):
+        return self.lo * 10 ** ((bucket + 1) / self.per_decade)
+
+    def add(self, ms):
+        self.counts[self._bucket(ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Límite superior de la cubeta donde cae el percentil `p` (0-100); 0 sin muestras."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self._upper(bucket), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class CommandTrace:
+    """Marcas de tiempo (time.perf_counter) de un comando; el enlace las completa y llama a done()."""
+    __slots__ = ("stats", "transport", "cmd", "tk_ms", "enqueued", "write_start", "write_end", "ack")
+
+    def __init__(self, stats, transport, cmd, tk_ms=None):
+        self.stats = stats
+        self.transport = transport
+        self.cmd = cmd
+        self.tk_ms = tk_ms
+        self.enqueued = time.perf_counter()
+        self.write_start = self.write_end = self.ack = None
+
+    def stages(self):
+        def ms(a, b):
+            return (b - a) * 1000 if a is not None and b is not None else None
+
+        end = self.ack or self.write_end
+        total = ms(self.enqueued, end)
+        if total is not None and self.tk_ms is not None:
+            total += self.tk_ms
+        return {"tk": self.tk_ms, "cola": ms(self.enqueued, self.write_start),
+                "escritura": ms(self.write_start, self.write_end), "ack": ms(self.write_end, self.ack),
+                "total": total}
+
+    def done(self):
+        self.stats.add(self)
+
+
+class LatencyStats:
+    """Histogramas por (transporte, etapa). add() se llama desde los hilos de los enlaces."""
+
+    def __init__(self, keep=5000):
+        self.histograms = {}
+        self.traces = collections.deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def begin(self, transport, cmd, tk_ms=None):
+        return CommandTrace(self, transport, cmd, tk_ms)
+
+    def add(self, trace):
+        stages = trace.stages()
+        with self._lock:
+            for stage, value in stages.items():
+                if value is not None:
+                    key = (trace.transport, stage)
+                    if key not in self.histograms:
+                        self.histograms[key] = Histogram()
+                    self.histograms[key].add(max(0.0, value))
+            self.traces.append((trace.transport, trace.cmd, stages))
+
+    def summary(self):
+        """[(transporte, etapa, n, p50, p95, p99, máx)] para la UI y el CSV."""
+        with self._lock:
+            rows = []
+            for transport in sorted({t for t, _ in self.histograms}):
+                for stage in STAGES:
+                    h = self.histograms.get((transport, stage))
+                    if h is not None:
+                        rows.append((transport, stage, h.count, h.percentile(50), h.percentile(95),
+                                     h.percentile(99), h.max))
+            return rows
+
+    def summary_text(self):
+        rows = self.summary()
+        if not rows:
+            return "Sin comandos medidos"
+        lines = [f"{'etapa':<9}{'n':>5}{'p50':>6}{'p95':>6}{'p99':>6} ms"]
+        current = None
+        for transport, stage, n, p50, p95, p99, _ in rows:
+            if transport != current:
+                lines.append(f"[{transport}]")
+                current = transport
+            lines.append(f"{stage:<9}{n:>5}{p50:>6.1f}{p95:>6.1f}{p99:>6.1f}")
+        return "\n".join(lines)
+
+    def export_csv(self, path):
+        """Resumen por transporte y etapa en `path`; las trazas individuales en <path>-muestras.csv."""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["transporte", "etapa", "n", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+            for row in self.summary():
+                w.writerow([row[0], row[1], row[2]] + [f"{v:.3f}" for v in row[3:]])
+        with self._lock:
+            traces = list(self.traces)
+        root, ext = os.path.splitext(path)
+        samples = f"{root}-muestras{ext or '.csv'}"
+        with open(samples, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["transporte", "comando"] + [f"{s}_ms" for s in STAGES])
+            for transport, cmd, stages in traces:
+                w.writerow([transport, cmd] + ["" if stages[s] is None else f"{stages[s]:.3f}" for s in STAGES])
+        return samples
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.traces.clear()
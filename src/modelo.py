@@ -0,0 +1,473 @@
+"""
+Modelo de programa y motor de ejecución independientes de la interfaz (no importa customtkinter).
+La UI solo mantiene sincronizados los valores de los bloques; compilar, temporizar y ejecutar
+se hace aquí, sin tocar widgets, y puede probarse sin pantalla.
+"""
+import time
+from itertools import islice
+from protocolo import MAX_PROGRAM_STEPS, Step, scale_speed
+from planificador import DeadlineScheduler
+from optimizador import optimize
+
+COMMANDS = {"Adelante": "F", "Reversa": "B", "Izquierda": "L", "Derecha": "R", "Detener": "S"}
+TIMED = ("Adelante", "Reversa", "Esperar")
+TURNS = ("Izquierda", "Derecha")
+# bloques de control de flujo: no envían nada, solo dirigen el intérprete
+FLOW = ("Repetir", "Fin", "Subrutina", "Llamar")
+MAX_REPEAT = 999  # vueltas de un Repetir; fuera de 1..MAX_REPEAT assemble() lo rechaza
+
+
+# ---------- PARÁMETROS ----------
+class ParamSpec:
+    """Parámetro tipado de un bloque: convierte el texto del widget a su valor (o al valor por defecto)."""
+    __slots__ = ("unit", "default", "parse")
+
+    def __init__(self, unit, default, parse):
+        self.unit = unit
+        self.default = default
+        self.parse = parse
+
+    def __call__(self, raw):
+        try:
+            return self.parse(raw)
+        except (TypeError, ValueError):
+            return self.default
+
+
+def _speed_1_9(raw):
+    return min(max(int(raw), 1), 9)
+
+
+def _seconds_1_10(raw):
+    return min(max(int(float(raw)), 1), 10)
+
+
+def _turn_degrees(raw):
+    deg = int(float(raw))
+    return deg if deg in (45, 90, 180, 360) else 90
+
+
+def _times(raw):
+    # sin acotar: un Repetir 1000 no debe dar 999 vueltas en silencio (assemble() lo rechaza)
+    return int(float(raw))
+
+
+def _routine_name(raw):
+    name = str(raw).strip().upper()[:12]
+    if not name:
+        raise ValueError("nombre vacío")
+    return name
+
+
+# control.py: selectores acotados (velocidad 1–9, segundos 1–10, giros 45/90/180/360).
+# Una velocidad inválida no cambia la velocidad actual (default None).
+CONTROL_PARAMS = {
+    "Velocidad": ParamSpec("vel", None, _speed_1_9),
+    "Adelante": ParamSpec("s", 1, _seconds_1_10),
+    "Reversa": ParamSpec("s", 1, _seconds_1_10),
+    "Esperar": ParamSpec("s", 1, _seconds_1_10),
+    "Izquierda": ParamSpec("°", 90, _turn_degrees),
+    "Derecha": ParamSpec("°", 90, _turn_degrees),
+    "Repetir": ParamSpec("×", 2, _times),
+    "Subrutina": ParamSpec("", "A", _routine_name),
+    "Llamar": ParamSpec("", "A", _routine_name),
+}
+
+# main.py: entradas libres en segundos/grados; vacío o inválido vale 1.
+CONTAINER_PARAMS = {
+    "Adelante": ParamSpec("s", 1, float),
+    "Reversa": ParamSpec("s", 1, float),
+    "Esperar": ParamSpec("s", 1, float),
+    "Izquierda": ParamSpec("°", 1, float),
+    "Derecha": ParamSpec("°", 1, float),
+    "Repetir": ParamSpec("×", 2, _times),
+    "Subrutina": ParamSpec("", "A", _routine_name),
+    "Llamar": ParamSpec("", "A", _routine_name),
+}
+
+
+# ---------- BLOQUES Y SECUENCIAS ----------
+class Block:
+    """Un bloque del programa. `view` es lo que la UI asocia (frame, widget del parámetro...)."""
+    __slots__ = ("kind", "value", "spec", "view")
+
+    def __init__(self, kind, raw=None, params=CONTROL_PARAMS, view=None):
+        self.kind = kind
+        self.spec = params.get(kind)
+        self.value = None
+        self.view = view
+        self.set_value(raw)
+
+    def set_value(self, raw):
+        self.value = self.spec(raw) if self.spec else None
+
+    def __repr__(self):
+        return f"Block({self.kind!r}, {self.value!r})"
+
+
+class Sequence:
+    """
+    Lista ordenada de bloques que se ejecuta de corrido (el lienzo de control.py o un contenedor de main.py).
+    initial_speed: velocidad 1–9 de partida (None = el robot usa la suya, sin enviar velocidad);
+    stop_gap_ms: parada "S" intercalada después de cada bloque (main.py usa 200 ms).
+    """
+    __slots__ = ("name", "blocks", "initial_speed", "stop_gap_ms")
+
+    def __init__(self, name="Secuencia", blocks=None, initial_speed=5, stop_gap_ms=0):
+        self.name = name
+        self.blocks = list(blocks) if blocks else []
+        self.initial_speed = initial_speed
+        self.stop_gap_ms = stop_gap_ms
+
+    def steps(self):
+        """
+        Iterador perezoso de protocolo.Step (Interpreter): las repeticiones y subrutinas no se expanden,
+        así la memoria no crece con el número de vueltas. ValueError si Repetir/Subrutina/Fin no casan.
+        """
+        return Interpreter(assemble(self.blocks), self.initial_speed, self.stop_gap_ms)
+
+    def optimized(self, marks=True, limit=None):
+        """
+        steps() pasado por optimizador.optimize: lo que se ejecuta (marks=True) o se sube (marks=False).
+        Con limit solo se optimizan los primeros `limit` pasos (vista previa de programas enormes).
+        """
+        steps = self.steps()
+        return optimize(islice(steps, limit) if limit else steps, marks)
+
+    def upload_steps(self):
+        """
+        optimized(marks=False) como lista para Subir. Deja de leer en cuanto pasa de MAX_PROGRAM_STEPS
+        y da ValueError: un Repetir enorme no se expande entero para fallar al final.
+        """
+        steps = list(islice(self.optimized(marks=False), MAX_PROGRAM_STEPS + 1))
+        if len(steps) > MAX_PROGRAM_STEPS:
+            raise ValueError(f"Programa demasiado largo (más de {MAX_PROGRAM_STEPS} pasos)")
+        return steps
+
+    def compile(self):
+        """Devuelve la lista de protocolo.Step ya expandida (vista previa, recorrido, Subir); solo lee valores ya tipados."""
+        return list(self.steps())
+
+    def duration_ms(self):
+        return sum(st.duration_ms for st in self.steps())
+
+
+class Program:
+    """Árbol del programa: varias secuencias, como los contenedores de main.py."""
+    __slots__ = ("sequences",)
+
+    def __init__(self, sequences=None):
+        self.sequences = list(sequences) if sequences else []
+
+
+# ---------- CONTROL DE FLUJO ----------
+# Código que ejecuta Interpreter: una lista plana de tuplas (operación, argumentos...).
+OP_MOVE, OP_SPEED, OP_LOOP, OP_END, OP_CALL, OP_RET, OP_HALT = range(7)
+
+
+def _split_routines(blocks):
+    """
+    Separa el cuerpo principal de las definiciones "Subrutina nombre ... Fin" (pueden estar en cualquier
+    parte de la secuencia; no se ejecutan donde están, solo al llamarlas).
+    """
+    main, routines = [], {}
+    body, name, depth = main, None, 0
+    for blk in blocks:
+        kind = blk.kind
+        if kind == "Subrutina":
+            if name is not None:
+                raise ValueError(f"Subrutina {blk.value} dentro de la subrutina {name}")
+            if blk.value in routines:
+                raise ValueError(f"Subrutina {blk.value} definida dos veces")
+            name, depth = blk.value, 0
+            body = routines[name] = []
+            continue
+        if kind == "Repetir":
+            depth += 1
+        elif kind == "Fin":
+            if name is not None and depth == 0:
+                body, name = main, None
+                continue
+            depth -= 1
+        body.append(blk)
+    if name is not None:
+        raise ValueError(f"Falta Fin en la subrutina {name}")
+    return main, routines
+
+
+def _emit(blocks, code, calls, owner=None):
+    """
+    Añade el código de `blocks` a `code`. Devuelve (pasos, movimientos) que produce sin contar las llamadas;
+    cada Llamar queda en `calls` como (posición, subrutina, bucles que la rodean, quién llama).
+    """
+    loops = []  # (posición del OP_LOOP, cuentas acumuladas antes del bucle)
+    steps = moves = 0
+    for blk in blocks:
+        kind, value = blk.kind, blk.value
+        if kind == "Repetir":
+            if not 1 <= value <= MAX_REPEAT:
+                raise ValueError(f"Repetir {value}: las vueltas van de 1 a {MAX_REPEAT}")
+            loops.append((len(code), steps, moves))
+            code.append((OP_LOOP, value))
+            steps = moves = 0
+        elif kind == "Fin":
+            if not loops:
+                raise ValueError("Fin sin Repetir")
+            start, steps_before, moves_before = loops.pop()
+            code.append((OP_END, start + 1))
+            times = code[start][1]
+            steps, moves = steps_before + steps * times, moves_before + moves * times
+        elif kind == "Llamar":
+            # el destino se resuelve cuando todas las subrutinas tienen su posición
+            calls.append((len(code), value, [start for start, _, _ in loops], owner))
+            code.append((OP_CALL, value))
+        elif kind == "Velocidad":
+            code.append((OP_SPEED, value, blk))
+            steps += 1
+        else:
+            if kind in TIMED:
+                delay = int(value * 1000)
+            elif kind in TURNS:
+                delay = int((value / 90) * 1000)
+            else:
+                delay = 700
+            code.append((OP_MOVE, COMMANDS.get(kind, "S"), delay, blk))
+            steps += 1
+            moves += 1
+    if loops:
+        raise ValueError("Falta Fin en un Repetir")
+    return steps, moves
+
+
+def assemble(blocks):
+    """
+    Traduce los bloques a código para Interpreter: el principal termina en OP_HALT y cada subrutina
+    va detrás terminada en OP_RET. Detecta bucles sin cerrar, Fin sueltos, subrutinas desconocidas
+    y subrutinas que se llaman a sí mismas (directa o indirectamente). Devuelve Code.
+    """
+    main, routines = _split_routines(blocks)
+    code, calls = [], []
+    counts = {None: _emit(main, code, calls)}
+    code.append((OP_HALT,))
+    entry = {}
+    for name, body in routines.items():
+        entry[name] = len(code)
+        counts[name] = _emit(body, code, calls, name)
+        code.append((OP_RET,))
+    for pos, name, _, _ in calls:
+        if name not in entry:
+            raise ValueError(f"Subrutina {name} no definida")
+        code[pos] = (OP_CALL, entry[name])
+
+    # cada llamada suma lo que produce la subrutina, multiplicado por las vueltas de los bucles que la rodean
+    totals, visiting = {}, set()
+
+    def total(owner):
+        if owner in totals:
+            return totals[owner]
+        if owner in visiting:
+            raise ValueError(f"La subrutina {owner} se llama a sí misma")
+        visiting.add(owner)
+        steps, moves = counts[owner]
+        for _, name, around, caller in calls:
+            if caller == owner:
+                times = 1
+                for start in around:
+                    times *= code[start][1]
+                sub_steps, sub_moves = total(name)
+                steps, moves = steps + sub_steps * times, moves + sub_moves * times
+        visiting.discard(owner)
+        totals[owner] = steps, moves
+        return totals[owner]
+
+    for name in routines:
+        total(name)
+    return Code(code, *total(None))
+
+
+class Code:
+    """Código ensamblado y cuántos pasos y movimientos produce (para "paso 3/800" sin expandir)."""
+    __slots__ = ("ops", "steps", "moves")
+
+    def __init__(self, ops, steps, moves):
+        self.ops = ops
+        self.steps = steps
+        self.moves = moves
+
+
+class Interpreter:
+    """
+    Recorre Code con un contador de programa y una pila explícita (vueltas que faltan de cada Repetir,
+    retorno de cada Llamar) y entrega los protocolo.Step de uno en uno, sin recursión ni pasos expandidos:
+    la memoria depende del anidamiento, no de las repeticiones. El anidamiento se comprueba al ensamblar,
+    así que al llegar a un OP_END lo que hay arriba de la pila es siempre su contador.
+    La velocidad es un registro: un Velocidad dentro de un Repetir vale para las vueltas siguientes.
+    Los Step son inmutables y se reutilizan de una vuelta a otra (uno por bloque y velocidad).
+    """
+    __slots__ = ("code", "pc", "stack", "vel", "gap", "_steps", "_pending_gap")
+
+    def __init__(self, code, initial_speed=None, stop_gap_ms=0):
+        self.code = code
+        self.pc = 0
+        self.stack = []
+        self.vel = initial_speed
+        self.gap = Step("S", None, stop_gap_ms, None) if stop_gap_ms else None
+        self._steps = {}
+        self._pending_gap = False
+
+    def __len__(self):
+        """Pasos totales del programa (con las paradas intercaladas), no los que faltan."""
+        return self.code.steps + (self.code.moves if self.gap else 0)
+
+    def __iter__(self):
+        return self
+
+    def _step(self, cmd, duration_ms, blk):
+        key = (self.pc, self.vel)
+        step = self._steps.get(key)
+        if step is None:
+            step = self._steps[key] = Step(cmd, scale_speed(self.vel) if self.vel is not None else None,
+                                           duration_ms, blk)
+        return step
+
+    def __next__(self):
+        if self._pending_gap:
+            self._pending_gap = False
+            return self.gap
+        ops, stack = self.code.ops, self.stack
+        while True:
+            op = ops[self.pc]
+            kind = op[0]
+            self.pc += 1
+            if kind == OP_MOVE:
+                self._pending_gap = self.gap is not None
+                return self._step(op[1], op[2], op[3])
+            if kind == OP_SPEED:
+                if op[1] is not None:
+                    self.vel = op[1]
+                return self._step(None, 400, op[2])
+            if kind == OP_LOOP:
+                stack.append(op[1])  # vueltas que faltan
+            elif kind == OP_END:
+                if stack[-1] > 1:
+                    stack[-1] -= 1
+                    self.pc = op[1]  # inicio del cuerpo
+                else:
+                    stack.pop()
+            elif kind == OP_CALL:
+                stack.append(self.pc)  # retorno
+                self.pc = op[1]
+            elif kind == OP_RET:
+                self.pc = stack.pop()
+            else:  # OP_HALT
+                self.pc -= 1
+                raise StopIteration
+
+
+# ---------- MOTOR ----------
+class Transport:
+    """Interfaz mínima de un enlace: SerialWriter, BleLink o las propias apps la implementan."""
+
+    def send_command(self, cmd, speed=None, duration_ms=0):
+        raise NotImplementedError
+
+
+class Engine:
+    """
+    Ejecuta una Sequence contra un Transport con DeadlineScheduler.
+    on_step(index, step) / on_done(scheduler) son ganchos opcionales (la UI resalta bloques con ellos).
+    """
+
+    def __init__(self, transport, after, clock=time.monotonic):
+        self.transport = transport
+        self.after = after
+        self.clock = clock
+        self.scheduler = None
+        self.motion = None  # último paso con comando enviado (para reanudar tras una pausa)
+        self.motion_until = None  # cuándo termina ese comando, con lo que sigue en pasos sin comando (hold_ms)
+        # retraso del plazo del paso que se está enviando (lo leen los transports para metricas); None fuera del envío
+        self.lateness_ms = None
+
+    @property
+    def running(self):
+        return bool(self.scheduler and self.scheduler.running)
+
+    def run(self, sequence, on_step=None, on_done=None):
+        return self.run_steps(sequence.optimized(), on_step, on_done)
+
+    def run_steps(self, steps, on_step=None, on_done=None):
+        """`steps`: lista de protocolo.Step o cualquier iterable (el Interpreter de Sequence.steps())."""
+        self.cancel()
+        self.motion = None
+
+        def fire(index, step):
+            if step.cmd is not None:
+                duration_ms = step.duration_ms + step.hold_ms
+                self.motion = step
+                self.motion_until = self.scheduler.deadline + duration_ms / 1000
+                self.lateness_ms = self.scheduler.lateness_ms[-1]
+                self.transport.send_command(step.cmd, step.speed, duration_ms)
+                self.lateness_ms = None
+            if on_step:
+                on_step(index, step)
+
+        def done(scheduler):
+            self.lateness_ms = scheduler.lateness_ms[-1]
+            self.transport.send_command("S")
+            self.lateness_ms = None
+            if on_done:
+                on_done(scheduler)
+
+        self.scheduler = DeadlineScheduler(self.after, steps, fire, done, clock=self.clock)
+        self.scheduler.start()
+        return self.scheduler
+
+    def cancel(self):
+        """
+        Detiene el plan. Si quedaba un movimiento en curso envía "S": en texto el robot sigue con el último
+        comando hasta recibir otro (con tramas lo pararía el plazo, pero no antes).
+        """
+        if self.scheduler:
+            moving = self.scheduler.running and self.motion is not None and self.motion.cmd != "S"
+            self.scheduler.cancel()
+            self.motion = None
+            if moving:
+                self.transport.send_command("S")
+
+    # ---------- PAUSA (enlace caído) ----------
+    @property
+    def paused(self):
+        return bool(self.scheduler and self.scheduler.paused)
+
+    def pause(self):
+        if self.running:
+            self.scheduler.pause()
+
+    def resume(self):
+        """
+        Reenvía el movimiento interrumpido con el tiempo que le faltaba y sigue con el plan.
+        `motion` es el último paso con comando (un paso de velocidad mantiene el movimiento anterior;
+        un comando unido por el optimizador sigue durante sus pasos sin comando, hasta motion_until).
+        """
+        sch = self.scheduler
+        if not sch or not sch.paused:
+            return
+        remaining = sch.remaining_ms()
+        if self.motion is not None:
+            remaining = max(remaining, (self.motion_until - sch.paused_at) * 1000)
+            self.motion_until += self.clock() - sch.paused_at
+            if remaining > 0:
+                self.transport.send_command(self.motion.cmd, self.motion.speed, int(remaining))
+        sch.resume()
+
+
+def run_blocking(transport, sequence, sleep=time.sleep, clock=time.monotonic):
+    """Ejecuta sin bucle de eventos (scripts, pruebas): espera cada plazo con `sleep`."""
+    pending = []
+    engine = Engine(transport, lambda ms, fn, *args: pending.append((ms, fn, args)), clock=clock)
+    scheduler = engine.run(sequence)
+    while pending:
+        ms, fn, args = pending.pop(0)
+        sleep(ms / 1000)
+        fn(*args)
+    return scheduler
@@ -0,0 +1,144 @@
+"""
+Optimización de mirilla (peephole) sobre la corriente de pasos, antes de ejecutar o subir:
+
+    - movimientos seguidos en la misma dirección y velocidad se envían como un solo comando,
+      sin la parada intercalada entre ellos (main.py pone "S" 200 ms detrás de cada bloque);
+    - paradas seguidas (Esperar + Esperar, Detener + parada intercalada...) se envían como una sola "S":
+      la segunda sería un "S" con el robot ya parado;
+    - un Velocidad no envía nada (la velocidad ya va en cada movimiento): durante su pausa de 400 ms el robot
+      sigue con el comando anterior. Con el robot parado (al empezar, tras una "S") la pausa se quita; con el
+      robot en marcha se suma al movimiento en curso (alarga su hold_ms: avanza lo mismo que sin optimizar);
+    - la parada intercalada del final sobra: el motor envía "S" al terminar.
+
+Los tiempos de lo que se mueve no cambian. Con marks=True (ejecución) el comando unido lleva en hold_ms
+lo que dura de más y cada bloque unido después del primero queda como un paso sin comando con su propia
+duración: el motor no envía nada en ellos pero la UI resalta cada bloque original en su momento.
+Con marks=False (Subir) cada grupo es un solo paso con la duración total.
+Lee los pasos de uno en uno (sirve para el Interpreter de Sequence.steps()); len() del resultado es la
+de los pasos sin optimizar, para mostrar "paso 3/800" sin expandir el programa.
+"""
+from protocolo import Step
+
+MOVES = ("F", "B", "L", "R")
+MAX_MERGE_MS = 0xFFFF  # la duración viaja como u16 en las tramas y en el programa
+MAX_MERGE_BLOCKS = 64  # y cada grupo se guarda entero hasta enviarlo
+
+
+class _Peephole:
+    """Estado del pase: el grupo pendiente de enviar y la parada intercalada detrás de él."""
+
+    def __init__(self, marks):
+        self.marks = marks
+        self.cmd = self.speed = None  # comando del grupo pendiente
+        self.pieces = []  # (ms, bloque) de cada paso unido al grupo
+        self.total_ms = 0
+        self.gap = None  # parada intercalada detrás de un movimiento: sobra si el movimiento sigue
+        self.moving = False  # el último comando recibido es un movimiento
+
+    def feed(self, st):
+        """Pasos listos para emitir al recibir `st` (que no es un Velocidad)."""
+        self.moving = st.cmd in MOVES
+        if self.moving:
+            if self.pieces and st.cmd == self.cmd and st.speed == self.speed and self._fits(st):
+                self.gap = None
+                self._add(st)
+                return
+            yield from self.flush()
+        elif st.block is None and self.cmd in MOVES and self.gap is None:
+            self.gap = st
+            return
+        elif self.cmd == "S" and self._fits(st):
+            self._add(st)
+            return
+        else:
+            gap = self.gap
+            self.gap = None
+            yield from self._group()
+            if gap is not None:
+                self._start(gap)
+                if self._fits(st):
+                    self._add(st)
+                    return
+                yield from self._group()
+        self._start(st)
+
+    def pause(self, st):
+        """Un Velocidad: el robot sigue con el comando anterior durante `st`.duration_ms."""
+        if not self.moving:
+            return  # parado: la pausa no cambia nada
+        if self.cmd in MOVES and self.gap is None and self._fits(st):
+            self._add(st)  # sin unir con el movimiento siguiente si cambia la velocidad: lo decide feed()
+            return
+        yield from self.flush()
+        yield st
+
+    def flush(self):
+        """Emite el grupo pendiente y su parada intercalada."""
+        yield from self._group()
+        if self.gap is not None:
+            yield self.gap
+            self.gap = None
+
+    def finish(self):
+        """Emite el grupo pendiente; la parada intercalada final sobra (el motor envía "S" al terminar)."""
+        yield from self._group()
+        self.gap = None
+
+    def _start(self, st):
+        self.cmd, self.speed = st.cmd, st.speed
+        self.pieces = [(st.duration_ms, st.block)]
+        self.total_ms = st.duration_ms
+
+    def _fits(self, st):
+        return self.total_ms + st.duration_ms <= MAX_MERGE_MS and len(self.pieces) < MAX_MERGE_BLOCKS
+
+    def _add(self, st):
+        self.total_ms += st.duration_ms
+        if st.block is None:
+            # una parada intercalada no tiene bloque que resaltar: alarga el anterior
+            ms, blk = self.pieces[-1]
+            self.pieces[-1] = (ms + st.duration_ms, blk)
+        else:
+            self.pieces.append((st.duration_ms, st.block))
+
+    def _group(self):
+        if not self.pieces:
+            return
+        first_ms, first_blk = self.pieces[0]
+        if self.marks:
+            yield Step(self.cmd, self.speed, first_ms, first_blk, self.total_ms - first_ms)
+            for ms, blk in self.pieces[1:]:
+                yield Step(None, self.speed, ms, blk)
+        else:
+            yield Step(self.cmd, self.speed, self.total_ms, first_blk)
+        self.pieces = []
+        self.cmd = self.speed = None
+
+
+class Optimized:
+    """
+    Iterable de optimize(). len() es la de los pasos de entrada (el Interpreter la sabe sin expandir):
+    con marks=True cada bloque sigue siendo un paso, así que solo sobra lo que se quitó (pausas con el
+    robot parado, paradas intercaladas unidas). Sin len() en la entrada no tiene len().
+    """
+
+    def __init__(self, steps, marks=True):
+        self.steps = steps
+        self.marks = marks
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        pass_ = _Peephole(self.marks)
+        for st in self.steps:
+            if st.cmd is None:
+                yield from pass_.pause(st)
+            else:
+                yield from pass_.feed(st)
+        yield from pass_.finish()
+
+
+def optimize(steps, marks=True):
+    """Pasos equivalentes con menos comandos y sin pausas inútiles (ver el docstring del módulo)."""
+    return Optimized(steps, marks) if hasattr(steps, "__len__") else iter(Optimized(steps, marks))
@@ -0,0 +1,83 @@
+import customtkinter as ctk
+import math, tkinter as tk
+from telemetria import FIELDS, UNITS
+
+LABELS = {"bateria": "🔋 Batería", "distancia": "📏 Distancia", "enc_izq": "⚙ Encoder izq.", "enc_der": "⚙ Encoder der."}
+COLORS = {"bateria": "#38b000", "distancia": "#0077b6", "enc_izq": "#7209b7", "enc_der": "#f77f00"}
+
+
+class TelemetryPanel(ctk.CTkFrame):
+    """
+    Valores actuales y una gráfica por campo de un TelemetryBuffer. No recibe eventos: lee el anillo
+    a lo sumo `max_hz` veces por segundo y solo redibuja si llegaron muestras nuevas (las líneas del
+    lienzo se crean una vez y se les cambian las coordenadas).
+    """
+
+    def __init__(self, master, buffer=None, fields=FIELDS, max_hz=4, points=120, width=230, row_height=34, **kw):
+        super().__init__(master, fg_color="transparent", **kw)
+        self.buffer = buffer
+        self.fields = fields
+        self.period_ms = int(1000 / max_hz)
+        self.points = points
+        self.width = width
+        self.row_height = row_height
+        self._drawn = None
+        self.title = ctk.CTkLabel(self, text="Telemetría: sin robot", text_color="gray")
+        self.title.pack()
+        self.values = {}
+        for f in fields:
+            self.values[f] = ctk.CTkLabel(self, text=f"{LABELS[f]}: –", anchor="w", text_color=COLORS[f])
+            self.values[f].pack(fill="x", padx=6)
+        self.plot = tk.Canvas(self, width=width, height=row_height * len(fields), bg="white", highlightthickness=0)
+        self.plot.pack(padx=6, pady=4)
+        self.lines = {}
+        for k, f in enumerate(fields):
+            y = (k + 1) * row_height
+            self.plot.create_line(0, y, width, y, fill="#e9ecef")
+            self.lines[f] = self.plot.create_line(0, y, 0, y, fill=COLORS[f], width=2)
+        self.after(self.period_ms, self._tick)
+
+    def show(self, buffer, title=None):
+        self.buffer = buffer
+        self._drawn = None
+        if buffer is None:
+            self.title.configure(text="Telemetría: sin robot", text_color="gray")
+            for k, f in enumerate(self.fields):
+                self.values[f].configure(text=f"{LABELS[f]}: –")
+                self.plot.coords(self.lines[f], 0, 0, 0, 0)
+            return
+        self.title.configure(text=f"Telemetría: {title}" if title else "Telemetría", text_color="#0077b6")
+        self._redraw()
+
+    def _tick(self):
+        if not self.winfo_exists():
+            return
+        if self.buffer is not None and self.buffer.version != self._drawn and self.winfo_ismapped():
+            self._redraw()
+        self.after(self.period_ms, self._tick)
+
+    def _redraw(self):
+        if self.buffer is None:
+            return
+        self._drawn = self.buffer.version
+        latest = self.buffer.latest()
+        for k, f in enumerate(self.fields):
+            value = latest[f]
+            text = "–" if math.isnan(value) else f"{value:g} {UNITS[f]}".strip()
+            self.values[f].configure(text=f"{LABELS[f]}: {text}")
+            self.plot.coords(self.lines[f], *self._points(f, k))
+
+    def _points(self, field, row):
+        """Últimas `points` muestras escaladas a su franja del lienzo (cada campo con su propio rango)."""
+        _, values = self.buffer.series(field, self.points)
+        values = [v for v in values if not math.isnan(v)]
+        top, bottom = row * self.row_height + 3, (row + 1) * self.row_height - 3
+        if len(values) < 2:
+            return (0, bottom, 0, bottom)
+        lo, hi = min(values), max(values)
+        span = (hi - lo) or 1.0
+        step = self.width / (len(values) - 1)
+        coords = []
+        for i, v in enumerate(values):
+            coords += (i * step, bottom - (v - lo) / span * (bottom - top))
+        return coords
@@ -0,0 +1,199 @@
+"""
+Guardar/abrir programas y diario de autoguardado.
+
+Formato (.blue): JSON por líneas. La primera es la cabecera
+    {"formato": "interfaz-blue", "version": 1, "app": "control" | "main"}
+y cada línea siguiente es un registro:
+    {"t": "bloque", "id", "tipo", "valor", "x", "y"}                     bloque suelto (centro en el lienzo)
+    {"t": "contenedor", "id", "nombre", "x", "y", "bloques": [{"tipo", "valor"}, ...], "robot"}
+                                                                         robot: puerto atado o null (main)
+Al ser una línea por registro, el archivo se lee en streaming y la UI lo construye por tandas.
+
+El diario (.journal) tiene la misma cabecera y luego operaciones que solo se añaden al final:
+    {"op": "put", "r": registro} | {"op": "del", "id": id} | {"op": "clear"}
+Reproducirlo tras un cierre inesperado da el último estado; una línea cortada al final se ignora.
+"""
+import json, os
+
+FORMAT = "interfaz-blue"
+FORMAT_VERSION = 1
+EXTENSION = ".blue"
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "interfaz-blue")
+
+
+def _header(app):
+    return {"formato": FORMAT, "version": FORMAT_VERSION, "app": app}
+
+
+def _check_header(line, app):
+    try:
+        head = json.loads(line)
+    except ValueError:
+        head = None
+    if not isinstance(head, dict) or head.get("formato") != FORMAT:
+        raise ValueError("No es un programa de INTERFAZ-BLUE")
+    if head.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Versión de archivo {head.get('version')} no soportada (máximo {FORMAT_VERSION})")
+    if head.get("app") != app:
+        raise ValueError(f"El programa es de {head.get('app')}.py, no de {app}.py")
+
+
+def _dump(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# ---------- ARCHIVO DE PROGRAMA ----------
+def save_program(path, app, records):
+    """Escribe en un temporal y lo renombra: un corte a mitad no deja el archivo anterior a medias."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(_dump(_header(app)))
+        for rec in records:
+            f.write(_dump(rec))
+    os.replace(tmp, path)
+
+
+def iter_program(path, app):
+    """
+    Registros del archivo, leídos de a una línea. El archivo se abre y la cabecera se comprueba ya
+    al llamar (OSError, o ValueError si el formato, la app o la versión no sirven), antes de que la UI
+    borre nada; una línea corrupta más adelante da ValueError al leerla.
+    """
+    f = open(path, encoding="utf-8")
+    try:
+        _check_header(f.readline(), app)
+    except ValueError:
+        f.close()
+        raise
+    return _records(f)
+
+
+def _records(f):
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_chunked(after, records, apply, on_done=None, chunk=40):
+    """
+    Aplica `apply(registro)` por tandas de `chunk` y devuelve el control a Tk entre tandas,
+    así la ventana sigue respondiendo mientras se construye un programa grande.
+    on_done(n, error) se llama al final (error es None o la excepción que cortó la carga).
+    """
+    it = iter(records)
+    count = [0]
+
+    def step():
+        try:
+            for _ in range(chunk):
+                rec = next(it, None)
+                if rec is None:
+                    if on_done:
+                        on_done(count[0], None)
+                    return
+                apply(rec)
+                count[0] += 1
+        except Exception as e:
+            if on_done:
+                on_done(count[0], e)
+            return
+        after(1, step)
+
+    step()
+
+
+# ---------- DIARIO DE AUTOGUARDADO ----------
+class Journal:
+    """
+    Diario de ediciones de una app. Cada cambio añade una línea (y hace flush), en vez de reescribir
+    todo el programa; cuando pasa de `compact_after` líneas se reescribe con `snapshot()` (los registros actuales).
+    """
+
+    def __init__(self, app, snapshot, path=None, compact_after=500):
+        self.app = app
+        self.snapshot = snapshot
+        self.path = path or os.path.join(DATA_DIR, f"{app}.journal")
+        self.compact_after = compact_after
+        self._file = None
+        self._lines = 0
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            torn = False
+            if size:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            if not size:
+                self._file.write(_dump(_header(self.app)))
+            elif torn:
+                self._file.write("\n")  # no pegar la primera operación a una línea cortada
+        return self._file
+
+    def _append(self, entry):
+        try:
+            f = self._open()
+            f.write(_dump(entry))
+            f.flush()
+        except OSError:
+            return  # sin diario: la app sigue funcionando igual
+        self._lines += 1
+        if self._lines >= self.compact_after:
+            self.compact()
+
+    def put(self, record):
+        self._append({"op": "put", "r": record})
+
+    def delete(self, rec_id):
+        self._append({"op": "del", "id": rec_id})
+
+    def clear(self):
+        self._append({"op": "clear"})
+
+    def compact(self):
+        self.close()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            save_program(self.path, self.app, ({"op": "put", "r": rec} for rec in self.snapshot()))
+        except OSError:
+            pass
+        self._lines = 0
+
+    def replay(self):
+        """Estado que deja el diario: lista de registros en orden de creación ([] si no hay diario)."""
+        state = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                _check_header(f.readline(), self.app)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # línea cortada por el cierre inesperado
+                    op = entry.get("op")
+                    if op == "put":
+                        state[entry["r"]["id"]] = entry["r"]
+                    elif op == "del":
+                        state.pop(entry["id"], None)
+                    elif op == "clear":
+                        state.clear()
+        except (OSError, ValueError):
+            return []
+        return list(state.values())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Cierre normal: el diario ya no hace falta."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,136 @@
+import time
+from collections import deque
+
+LATENESS_WINDOW = 1024  # retrasos guardados para percentiles (los últimos); el máximo se lleva aparte
+
+
+class DeadlineScheduler:
+    """
+    Ejecuta pasos (protocolo.Step) con plazos absolutos de time.monotonic(): el plazo de cada paso
+    es el del anterior más su duración, así el retraso de Tk o de la escritura en un paso no se acumula
+    en los siguientes, y la duración total es la programada.
+
+    `steps` puede ser una lista o un iterable perezoso (modelo.Interpreter): se pide un paso cada vez
+    y solo se guarda el plazo del siguiente, así la memoria no crece con la longitud del programa.
+    `after(ms, fn, *args)` es la función de temporizado (en la UI, el after() de Tk);
+    `on_step(index, step)` envía el comando del paso y `on_done(scheduler)` se llama al terminar.
+    pause()/resume() congelan el plan (p. ej. mientras se reconecta el enlace): al reanudar,
+    el paso interrumpido dura lo que le faltaba y los plazos siguientes se corren lo mismo que la pausa.
+    """
+
+    def __init__(self, after, steps, on_step, on_done=None, clock=time.monotonic):
+        self.after = after
+        self.steps = steps
+        self.total = len(steps) if hasattr(steps, "__len__") else None
+        self.on_step = on_step
+        self.on_done = on_done
+        self.clock = clock
+        self.lateness_ms = deque(maxlen=LATENESS_WINDOW)
+        self.max_lateness_ms = 0
+        self.running = False
+        self.started_at = None
+        self.finished_at = None
+        self.current = None  # índice del último paso disparado
+        self.step = None  # último paso disparado
+        self.deadline = None  # plazo en que tocaba el último paso disparado
+        self.paused_at = None
+        self.paused_ms = 0
+        self.programmed_ms = 0  # suma de las duraciones de los pasos ya disparados
+        self._iter = None
+        self._next = None  # próximo paso (None: el final)
+        self._deadline = None  # plazo del próximo paso o del final
+        self._gen = 0  # invalida los after() pendientes al pausar o cancelar
+
+    def start(self):
+        self.started_at = self._deadline = self.clock()
+        self._iter = iter(self.steps)
+        self._next = next(self._iter, None)
+        self.lateness_ms.clear()
+        self.max_lateness_ms = 0
+        self.programmed_ms = 0
+        self.running = True
+        self._fire(0, self._gen)
+
+    def cancel(self):
+        self.running = False
+        self.paused_at = None
+        self._gen += 1
+
+    @property
+    def paused(self):
+        return self.paused_at is not None
+
+    def pause(self):
+        if self.running and not self.paused:
+            self.paused_at = self.clock()
+            self._gen += 1
+
+    def remaining_ms(self):
+        """Lo que le faltaba al paso en curso cuando se pausó (0 si no está en pausa)."""
+        if not self.paused or self.current is None:
+            return 0
+        return max(0, (self._deadline - self.paused_at) * 1000)
+
+    def resume(self):
+        if not self.running or not self.paused:
+            return
+        shift = self.clock() - self.paused_at
+        self.paused_at = None
+        self.paused_ms += shift * 1000
+        if self.deadline is not None:
+            self.deadline += shift
+        self._deadline += shift
+        self._wait(self.current + 1 if self.current is not None else 0)
+
+    def _fire(self, index, gen):
+        if not self.running or gen != self._gen:
+            return
+        now = self.clock()
+        if now < self._deadline - 0.001:
+            # after() despertó antes de tiempo: esperar lo que falta
+            self._wait(index)
+            return
+        late = (now - self._deadline) * 1000
+        self.lateness_ms.append(late)
+        if late > self.max_lateness_ms:
+            self.max_lateness_ms = late
+        step = self._next
+        if step is None:
+            self.running = False
+            self.finished_at = now
+            if self.on_done:
+                try:
+                    self.on_done(self)
+                except Exception as e:
+                    print("Error al terminar la secuencia:", e)
+            return
+        self.current, self.step, self.deadline = index, step, self._deadline
+        self.programmed_ms += step.duration_ms
+        self._deadline += step.duration_ms / 1000
+        self._next = next(self._iter, None)
+        try:
+            self.on_step(index, step)
+        except Exception as e:
+            # un fallo del gancho (p. ej. resaltar un bloque borrado) no debe dejar el plan a medias, sin "S" final
+            print(f"Error en el paso {index + 1}:", e)
+        if self.running and not self.paused:
+            self._wait(index + 1)
+
+    def _wait(self, index):
+        remaining = self._deadline - self.clock()
+        # redondeado, no truncado: 1.0999999 s no debe despertar 1 ms antes (con un reloj virtual, el plazo exacto).
+        # Método y argumentos, sin crear un cierre por paso.
+        self.after(max(0, round(remaining * 1000)), self._fire, index, self._gen)
+
+    # ---------- MÉTRICAS ----------
+    @property
+    def runtime_ms(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at) * 1000
+
+    def summary(self):
+        text = f"{self.runtime_ms or 0:.0f}/{self.programmed_ms:.0f} ms, desfase máx {self.max_lateness_ms:.1f} ms"
+        if self.paused_ms:
+            text += f", en pausa {self.paused_ms:.0f} ms"
+        return text
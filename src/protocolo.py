@@ -0,0 +1,137 @@
+import struct
+from collections import namedtuple
+
+# Un paso de ejecución ya resuelto: comando ("F", "B", "L", "R", "S" o None si no envía nada),
+# velocidad real 0-255 (None = la del robot), duración en ms y bloque de origen (para resaltarlo).
+# hold_ms: lo que el comando sigue después del paso, cubierto por pasos sin comando (optimizador.optimize).
+Step = namedtuple("Step", "cmd speed duration_ms block hold_ms", defaults=(0,))
+
+BAUD_DEFAULT = 9600
+FAST_BAUDS = (115200, 57600)
+
+# ---------- PROGRAMA COMPLETO (subir y ejecutar) ----------
+# Formato: b"P" + u16 longitud del cuerpo + pasos de 4 bytes (opcode, velocidad, u16 ms) + crc8 del cuerpo.
+# El robot lo guarda y arranca al recibir START_CMD; el opcode 0 mantiene el movimiento actual.
+OPCODES = {None: 0, "F": 1, "B": 2, "L": 3, "R": 4, "S": 5}
+PROGRAM_HEADER = b"P"
+START_CMD = b"G\n"
+STEP_SIZE = 4
+MAX_PROGRAM_STEPS = 0xFFFF // STEP_SIZE
+
+
+def scale_speed(vel):
+    """Escala la velocidad de la interfaz (1–9) a PWM (28–255) como espera el Arduino."""
+    return int((vel - 1) / 8 * 227 + 28)
+
+
+def crc8(data, poly=0x07):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def compile_program(steps):
+    """Compila una lista de Step en un único programa binario con prefijo de longitud."""
+    if len(steps) > MAX_PROGRAM_STEPS:
+        raise ValueError(f"Programa demasiado largo (más de {MAX_PROGRAM_STEPS} pasos)")
+    body = bytearray()
+    for st in steps:
+        duration = min(max(int(st.duration_ms), 0), 0xFFFF)
+        body += struct.pack(">BBH", OPCODES[st.cmd], st.speed or 0, duration)
+    return PROGRAM_HEADER + struct.pack(">H", len(body)) + bytes(body) + bytes([crc8(body)])
+
+
+def program_duration_ms(steps):
+    return sum(int(st.duration_ms) for st in steps)
+
+
+# ---------- TRAMAS BINARIAS (opcional) ----------
+# Trama fija de 6 bytes: (0xA0 | opcode), velocidad, u16 duración ms, secuencia, crc8 de los 5 anteriores.
+# El robot responde ACK + secuencia. La duración deja que el robot se detenga solo si se pierde el enlace.
+FRAME_SYNC = 0xA0
+FRAME_SIZE = 6
+ACK = 0x06
+# Saludo: el host envía HELLO a 9600; un firmware con tramas responde "BIN <baudios máx>\n".
+HELLO = b"?\n"
+
+
+def encode_frame(cmd, speed, duration_ms, seq):
+    duration = min(max(int(duration_ms), 0), 0xFFFF)
+    head = struct.pack(">BBHB", FRAME_SYNC | OPCODES[cmd], speed or 0, duration, seq & 0xFF)
+    return head + bytes([crc8(head)])
+
+
+def decode_frame(frame):
+    """Inversa de encode_frame; devuelve (cmd, velocidad, duración, secuencia) o None si la trama es inválida."""
+    if len(frame) != FRAME_SIZE or frame[0] & 0xF0 != FRAME_SYNC or crc8(frame[:5]) != frame[5]:
+        return None
+    op, speed, duration, seq = struct.unpack(">BBHB", frame[:5])
+    cmd = {v: k for k, v in OPCODES.items()}.get(op & 0x0F, "S")
+    return cmd, speed, duration, seq
+
+
+def parse_hello(line):
+    """b"BIN 115200" -> 115200; None si el firmware no anuncia el protocolo binario."""
+    parts = line.decode(errors="ignore").strip().split()
+    if len(parts) == 2 and parts[0] == "BIN" and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+# ---------- TELEMETRÍA (robot -> host) ----------
+# Trama fija de 10 bytes: 0xB0, u16 batería mV, u16 distancia mm, i16 encoder izq., i16 encoder der., crc8 de los 9 anteriores.
+# También se aceptan líneas de texto "T bat=7.4 dist=23 encl=120 encr=118\n" (ver telemetria.parse_line).
+TELEMETRY_SYNC = 0xB0
+TELEMETRY_SIZE = 10
+
+
+def _wrap16(value):
+    """Los encoders cuentan sin fin: en la trama viajan como i16 que da la vuelta."""
+    return ((int(value) + 0x8000) & 0xFFFF) - 0x8000
+
+
+def encode_telemetry(battery_v, distance_cm, enc_left, enc_right):
+    body = struct.pack(">BHHhh", TELEMETRY_SYNC, int(battery_v * 1000) & 0xFFFF, int(distance_cm * 10) & 0xFFFF,
+                       _wrap16(enc_left), _wrap16(enc_right))
+    return body + bytes([crc8(body)])
+
+
+def decode_telemetry(frame):
+    """Inversa de encode_telemetry; devuelve un dict con los campos de telemetria.FIELDS o None si la trama es inválida."""
+    if len(frame) != TELEMETRY_SIZE or frame[0] != TELEMETRY_SYNC or crc8(frame[:9]) != frame[9]:
+        return None
+    _, mv, mm, left, right = struct.unpack(">BHHhh", frame[:9])
+    return {"bateria": mv / 1000, "distancia": mm / 10, "enc_izq": left, "enc_der": right}
+
+
+def pick_baud(advertised):
+    for baud in FAST_BAUDS:
+        if baud <= advertised:
+            return baud
+    return None
+
+
+class TextCodec:
+    """Comandos ASCII de siempre: "F255\n" (control.py) o solo la letra (main.py, newline=False)."""
+    binary = False
+
+    def __init__(self, newline=True):
+        self.newline = newline
+
+    def encode(self, cmd, speed=None, duration_ms=0):
+        msg = cmd + (str(speed) if speed is not None else "")
+        return (msg + "\n" if self.newline else msg).encode()
+
+
+class BinaryCodec:
+    binary = True
+
+    def __init__(self):
+        self.seq = 0
+
+    def encode(self, cmd, speed=None, duration_ms=0):
+        self.seq = (self.seq + 1) & 0xFF
+        return encode_frame(cmd, speed, duration_ms, self.seq)
@@ -0,0 +1,93 @@
+class LinkSupervisor:
+    """
+    Recupera el enlace cuando se cae (HC-05 fuera de alcance, BLE desconectado) sin reiniciar la ejecución.
+
+    link_lost() pausa el Engine y programa intentos de reconexión con espera exponencial acotada
+    (base, base*factor, ... hasta `limit` s, como mucho `attempts` intentos). `reconnect()` lo da la app:
+    inicia un intento y la app avisa el resultado con link_ok() o attempt_failed().
+    Al volver el enlace el Engine reenvía el paso interrumpido con el tiempo restante y sigue.
+    La cuenta de intentos no vuelve a cero al abrirse el enlace sino con link_confirmed() (una escritura
+    o un ACK que salió bien): un puerto que abre pero falla al escribir agota los intentos igual.
+    `on_status(texto, color)` informa a la UI; `on_give_up()` se llama al agotar los intentos.
+    """
+
+    def __init__(self, after, engine, reconnect, on_status=None, base=0.5, factor=2.0, limit=8.0, attempts=6,
+                 on_give_up=None):
+        self.after = after
+        self.engine = engine
+        self.reconnect = reconnect
+        self.on_status = on_status
+        self.on_give_up = on_give_up
+        self.base = base
+        self.factor = factor
+        self.limit = limit
+        self.attempts = attempts
+        self.recovering = False
+        self.attempt = 0
+
+    def delay_s(self, attempt):
+        return min(self.limit, self.base * self.factor ** attempt)
+
+    def link_lost(self, reason=""):
+        if self.recovering:
+            return
+        self.recovering = True
+        self.engine.pause()
+        if self.attempt >= self.attempts:
+            self._give_up()
+            return
+        self._status(f"⚠ Enlace perdido{': ' + str(reason) if reason else ''}; reconectando...", "orange")
+        self._schedule()
+
+    def _schedule(self):
+        self.after(int(self.delay_s(self.attempt) * 1000), self._try)
+
+    def _try(self):
+        if not self.recovering:
+            return
+        self.attempt += 1
+        self._status(f"Reconectando (intento {self.attempt}/{self.attempts})...", "orange")
+        try:
+            self.reconnect()
+        except Exception:
+            self.attempt_failed()
+
+    def attempt_failed(self):
+        if not self.recovering:
+            return
+        if self.attempt >= self.attempts:
+            self._give_up()
+            return
+        self._schedule()
+
+    def _give_up(self):
+        self.recovering = False
+        self.attempt = 0  # una conexión pedida a mano empieza de nuevo
+        self.engine.cancel()
+        self._status("Sin enlace: ejecución detenida", "red")
+        if self.on_give_up:
+            self.on_give_up()
+
+    def link_ok(self):
+        if not self.recovering:
+            return
+        self.recovering = False
+        resumed = self.engine.paused
+        self.engine.resume()
+        self._status("Enlace recuperado" + (", continuando la secuencia" if resumed else ""), "green")
+
+    def link_confirmed(self):
+        """Una escritura o un ACK salió bien: el enlace funciona de verdad y los intentos vuelven a cero."""
+        if not self.recovering:
+            self.attempt = 0
+
+    def stop(self):
+        """Desconexión pedida por el usuario: no reintentar ni dejar la ejecución en pausa."""
+        self.recovering = False
+        self.attempt = 0
+        if self.engine.paused:
+            self.engine.cancel()
+
+    def _status(self, text, color):
+        if self.on_status:
+            self.on_status(text, color)
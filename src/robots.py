@@ -0,0 +1,188 @@
+"""
+Varios robots conectados a la vez (HC-05/06 por puerto serie y BLE), cada uno con su enlace,
+su cola de eventos, su Engine (planificador propio) y su LinkSupervisor: un contenedor atado a un robot
+se ejecuta en paralelo con los de los demás sin compartir estado.
+"""
+import queue
+from enlace_serial import SerialWriter
+from enlace_ble import BleLink, LoopThread
+from modelo import Engine
+from reconexion import LinkSupervisor
+from telemetria import TelemetryBuffer
+
+
+class Robot:
+    """Un robot del pool. Es el Transport de su propio Engine."""
+
+    def __init__(self, pool, address, transport, name=None, serial_options=None):
+        self.pool = pool
+        self.address = address
+        self.transport = transport  # "HC" o "BLE"
+        self.name = name or address
+        self.serial_options = {**pool.serial_options, **(serial_options or {})}
+        self.status = ("", "gray")
+        self.events = queue.Queue()
+        self.telemetry = TelemetryBuffer()  # sobrevive a las reconexiones: el enlace nuevo sigue llenándolo
+        self.link = None
+        self.connected = False
+        self.engine = Engine(self, pool.after)
+        self.supervisor = LinkSupervisor(pool.after, self.engine, self.reopen,
+                                         on_status=lambda text, color: pool.set_status(self, text, color),
+                                         on_give_up=self._gave_up)
+
+    def open(self, write_char=None):
+        """El resultado llega luego como ("connected", nombre) o ("error", ("connected", exc)) (ver handle)."""
+        if self.transport == "HC":
+            # SerialWriter abre el puerto en su hilo: la UI no espera al SPP
+            if self.link is not None:
+                self.link.close()  # el de antes de que el supervisor se rindiera
+            self.link = SerialWriter(self.address, self.events, telemetry=self.telemetry, **self.serial_options)
+            self.pool.set_status(self, "Conectando...", "blue")
+        else:
+            if self.link is None:
+                self.link = BleLink(self.pool.ble_loop(), self.events, telemetry=self.telemetry)
+            self.pool.set_status(self, "Conectando...", "blue")
+            self.link.connect(self.address, timeout=10.0, write_char=write_char)
+
+    def link_lost(self, reason=""):
+        """Enlace caído: deja de contar como conectado (no recibe envíos) mientras el supervisor reconecta."""
+        self.connected = False
+        self.supervisor.link_lost(reason)
+
+    def _gave_up(self):
+        self.connected = False
+        self.events.put(("gave_up", self.address))  # la app lo ve en pool.poll() y actualiza su panel
+
+    def reopen(self):
+        """Un intento del LinkSupervisor: mismo dispositivo, sin escanear."""
+        if self.transport == "HC":
+            self.link.close()
+            self.open()
+        else:
+            self.link.connect(self.address, timeout=5.0, write_char=self.link.write_char)
+
+    def close(self):
+        self.supervisor.stop()
+        self.engine.cancel()  # envía "S" si el robot seguía en marcha
+        if self.link is not None:
+            if self.transport == "HC":
+                self.link.close(drain=True)
+            elif self.link.is_connected:
+                self.link.disconnect()
+        self.connected = False
+
+    # ---------- TRANSPORT ----------
+    def send_command(self, cmd, speed=None, duration_ms=0):
+        if self.connected:
+            trace = self.pool.stats.begin(self.transport, cmd, self.engine.lateness_ms) if self.pool.stats else None
+            self.link.send_command(cmd, speed, duration_ms, trace=trace)
+
+    def send(self, data):
+        """Bytes crudos (programa compilado). False si no salen (sin conexión o cola llena)."""
+        if not self.connected:
+            return False
+        if self.transport == "HC":
+            return self.link.send(data)
+        self.link.write(data, chunk_size=20)
+        return True
+
+    # ---------- EVENTOS ----------
+    def handle(self, kind, info):
+        """Estado de conexión y reconexión; el resto de eventos los muestra la app."""
+        if kind == "connected":
+            self.connected = True
+            self.name = info if self.name == self.address else self.name
+            self.pool.set_status(self, f"Conectado: {self.name}", "green")
+            self.supervisor.link_ok()
+        elif kind == "link_lost":
+            self.link_lost()
+        elif kind in ("serial_write", "ack", "write"):
+            self.supervisor.link_confirmed()
+        elif kind == "error" and info[0] == "connected":
+            if self.supervisor.recovering:
+                self.supervisor.attempt_failed()
+            else:
+                self.connected = False
+                self.pool.set_status(self, f"Error: {info[1]}", "red")
+
+
+class RobotPool:
+    """
+    Conexiones simultáneas, indexadas por dirección (puerto o MAC BLE). Todos los robots BLE comparten
+    el mismo LoopThread (el de la app o uno propio).
+    on_status(robot, texto, color) se llama en el hilo de Tk (desde poll()).
+    Con un metricas.LatencyStats en `stats` se mide cada comando de todos los robots (por transporte).
+    """
+
+    def __init__(self, after, on_status=None, loop_thread=None, serial_options=None, stats=None):
+        self.after = after
+        self.on_status = on_status
+        self.loop_thread = loop_thread
+        self._own_loop = False
+        self.serial_options = serial_options or {}
+        self.stats = stats
+        self.robots = {}
+
+    def ble_loop(self):
+        """Un único loop de asyncio para todos los robots BLE; se crea con el primero."""
+        if self.loop_thread is None:
+            self.loop_thread = LoopThread()
+            self._own_loop = True
+        return self.loop_thread
+
+    def __iter__(self):
+        return iter(self.robots.values())
+
+    def __len__(self):
+        return len(self.robots)
+
+    def get(self, address):
+        return self.robots.get(address)
+
+    def connected(self):
+        return [r for r in self.robots.values() if r.connected]
+
+    def connect(self, address, transport, name=None, write_char=None, **serial_options):
+        """serial_options (binary, newline...) se suman a los del pool solo para este robot."""
+        robot = self.robots.get(address)
+        if robot is None:
+            robot = self.robots[address] = Robot(self, address, transport, name, serial_options)
+        elif robot.connected or robot.supervisor.recovering:
+            return robot  # ya conectado o reconectándose solo
+        try:
+            robot.open(write_char)
+        except Exception:
+            del self.robots[address]
+            raise
+        return robot
+
+    def disconnect(self, address):
+        robot = self.robots.pop(address, None)
+        if robot is not None:
+            robot.close()
+            self.set_status(robot, "Desconectado", "red")
+
+    def close_all(self):
+        for address in list(self.robots):
+            self.robots.pop(address).close()
+        if self._own_loop:
+            self.loop_thread.stop()
+            self.loop_thread, self._own_loop = None, False
+
+    def set_status(self, robot, text, color):
+        robot.status = (text, color)
+        if self.on_status:
+            self.on_status(robot, text, color)
+
+    def poll(self):
+        """Vacía las colas de todos los robots: devuelve [(robot, tipo, datos)] en el orden en que llegaron."""
+        out = []
+        for robot in list(self.robots.values()):
+            try:
+                while True:
+                    kind, info = robot.events.get_nowait()
+                    robot.handle(kind, info)
+                    out.append((robot, kind, info))
+            except queue.Empty:
+                pass
+        return out
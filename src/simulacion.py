@@ -0,0 +1,99 @@
+"""
+Ejecución en seco: el mismo Engine/DeadlineScheduler, con un reloj inyectado y un transport que solo anota.
+
+    VirtualClock     reloj virtual: sus after() se atienden al instante avanzando el tiempo hasta cada plazo,
+                     así un programa de 10 minutos se recorre en milisegundos (pruebas, vista previa).
+    ScaledClock      reloj a N× sobre el after() real (Tk): la ejecución se ve, pero N veces más rápido.
+    RecordingTransport  guarda cada comando con su instante (ms desde el inicio) en vez de enviarlo.
+"""
+import heapq, time
+from collections import namedtuple
+from modelo import Engine
+
+# Un comando de la ejecución en seco: instante en ms desde el inicio, comando, velocidad y duración pedidas.
+Sent = namedtuple("Sent", "t_ms cmd speed duration_ms")
+
+
+class VirtualClock:
+    """Reloj en ms enteros (sin deriva de coma flotante). Se usa como clock= y su after() como after=."""
+
+    def __init__(self):
+        self.now_ms = 0
+        self._heap = []
+        self._n = 0
+
+    def __call__(self):
+        return self.now_ms / 1000
+
+    def after(self, ms, fn, *args):
+        self._n += 1
+        heapq.heappush(self._heap, (self.now_ms + max(0, int(ms)), self._n, fn, args))
+        return self._n
+
+    def run(self, until=None):
+        """Atiende los after() pendientes en orden de plazo hasta vaciarlos (o hasta que until() sea cierto)."""
+        while self._heap and not (until and until()):
+            self.now_ms, _, fn, args = heapq.heappop(self._heap)
+            fn(*args)
+
+
+class ScaledClock:
+    """Tiempo que corre `factor` veces más rápido que `base`; after(ms) espera ms/factor reales."""
+
+    def __init__(self, after, factor, base=time.monotonic):
+        self._after = after
+        self.factor = factor
+        self.base = base
+        self.t0 = base()
+
+    def __call__(self):
+        return self.t0 + (self.base() - self.t0) * self.factor
+
+    def after(self, ms, fn, *args):
+        return self._after(max(0, round(ms / self.factor)), fn, *args)
+
+
+class RecordingTransport:
+    def __init__(self, clock):
+        self.clock = clock
+        self.start = clock()
+        self.commands = []
+
+    def send_command(self, cmd, speed=None, duration_ms=0):
+        self.commands.append(Sent(round((self.clock() - self.start) * 1000, 3), cmd, speed, duration_ms))
+
+
+def dry_run(steps, on_step=None, max_commands=None):
+    """
+    Ejecuta los pasos (protocolo.Step) al instante con un VirtualClock.
+    Devuelve (comandos, scheduler): la lista de Sent y el DeadlineScheduler terminado (summary(), lateness_ms...).
+    Con max_commands el reloj se detiene tras ese número de comandos (el scheduler queda sin terminar).
+    """
+    clock = VirtualClock()
+    recorder = RecordingTransport(clock)
+    engine = Engine(recorder, clock.after, clock=clock)
+    scheduler = engine.run_steps(steps, on_step)
+    clock.run(until=max_commands and (lambda: len(recorder.commands) >= max_commands))
+    return recorder.commands, scheduler
+
+
+def fast_forward(steps, after, factor, on_step=None, on_done=None):
+    """
+    Ejecuta los pasos a `factor`× sobre el after() real sin enviar nada al robot.
+    on_done(comandos, scheduler) al terminar; devuelve el Engine (para cancel()).
+    """
+    clock = ScaledClock(after, factor)
+    recorder = RecordingTransport(clock)
+    engine = Engine(recorder, clock.after, clock=clock)
+    engine.run_steps(steps, on_step, lambda scheduler: on_done and on_done(recorder.commands, scheduler))
+    return engine
+
+
+def format_commands(commands):
+    """Una línea por comando: "  12.400 s  F 155  (1000 ms)"."""
+    lines = []
+    for sent in commands:
+        speed = "" if sent.speed is None else f" {sent.speed}"
+        duration = f"  ({sent.duration_ms} ms)" if sent.duration_ms else ""
+        lines.append(f"{sent.t_ms / 1000:>9.3f} s  {sent.cmd}{speed}{duration}")
+    return "\n".join(lines)
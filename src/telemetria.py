@@ -0,0 +1,134 @@
+"""
+Telemetría que envía el robot: batería, sensor de distancia y encoders.
+
+Los enlaces (hilo lector de SerialWriter, notificaciones BLE de BleLink) pasan los bytes recibidos a un
+TelemetryParser y guardan cada muestra en un TelemetryBuffer: un anillo de tamaño fijo de floats, así la
+memoria no crece con la sesión y la UI no recibe un evento por muestra (el panel lee el anillo a su ritmo).
+"""
+import math, threading, time
+from array import array
+from protocolo import TELEMETRY_SYNC, TELEMETRY_SIZE, decode_telemetry
+
+FIELDS = ("bateria", "distancia", "enc_izq", "enc_der")
+UNITS = {"bateria": "V", "distancia": "cm", "enc_izq": "", "enc_der": ""}
+# nombres que usan los firmwares en las líneas de texto
+ALIASES = {
+    "bat": "bateria", "batt": "bateria", "battery": "bateria", "bateria": "bateria", "v": "bateria",
+    "dist": "distancia", "distance": "distancia", "distancia": "distancia", "cm": "distancia", "us": "distancia",
+    "enc": "enc_izq", "encl": "enc_izq", "enc_l": "enc_izq", "el": "enc_izq", "enc_izq": "enc_izq",
+    "encr": "enc_der", "enc_r": "enc_der", "er": "enc_der", "enc_der": "enc_der",
+}
+MAX_LINE = 128
+
+
+def parse_line(line):
+    """
+    b"T bat=7.4 dist=23 encl=120" o "BAT:7.4,DIST:23" -> {"bateria": 7.4, "distancia": 23.0, ...}.
+    Las claves desconocidas se ignoran; None si la línea no trae ningún campo.
+    """
+    if isinstance(line, (bytes, bytearray)):
+        line = line.decode(errors="ignore")
+    sample = {}
+    for token in line.replace(",", " ").replace(";", " ").split():
+        key, sep, value = token.partition("=")
+        if not sep:
+            key, sep, value = token.partition(":")
+        field = ALIASES.get(key.strip().lower())
+        if field is None:
+            continue
+        try:
+            sample[field] = float(value)
+        except ValueError:
+            continue
+    return sample or None
+
+
+class TelemetryParser:
+    """Separa el flujo de bytes en tramas binarias (TELEMETRY_SYNC) y líneas de texto; devuelve las muestras."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.bad = 0
+
+    def feed(self, data):
+        self.buf += data
+        samples = []
+        buf = self.buf
+        while buf:
+            if buf[0] == TELEMETRY_SYNC:
+                if len(buf) < TELEMETRY_SIZE:
+                    break
+                sample = decode_telemetry(bytes(buf[:TELEMETRY_SIZE]))
+                if sample is None:
+                    self.bad += 1
+                    del buf[0]  # sincronizar de nuevo con el byte siguiente
+                    continue
+                samples.append(sample)
+                del buf[:TELEMETRY_SIZE]
+                continue
+            end = buf.find(b"\n")
+            sync = buf.find(bytes([TELEMETRY_SYNC]))
+            if end < 0 or 0 <= sync < end:
+                if sync > 0:
+                    del buf[:sync]  # basura o ACK antes de una trama
+                    continue
+                if len(buf) > MAX_LINE:
+                    self.bad += 1
+                    buf.clear()
+                break
+            sample = parse_line(bytes(buf[:end]))
+            if sample:
+                samples.append(sample)
+            del buf[:end + 1]
+        return samples
+
+
+class TelemetryBuffer:
+    """
+    Anillo de `capacity` muestras con un array("d") por campo. append() es seguro desde cualquier hilo;
+    un campo que no llega en una muestra conserva su último valor. `version` cambia con cada muestra.
+    """
+
+    def __init__(self, capacity=512, fields=FIELDS, clock=time.monotonic):
+        self.capacity = capacity
+        self.fields = fields
+        self.clock = clock
+        self.times = array("d", [0.0]) * capacity
+        self.data = {f: array("d", [math.nan]) * capacity for f in fields}
+        self.version = 0  # muestras recibidas desde el inicio
+        self._last = {f: math.nan for f in fields}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.version, self.capacity)
+
+    def append(self, sample, t=None):
+        with self._lock:
+            i = self.version % self.capacity
+            self.times[i] = self.clock() if t is None else t
+            for f in self.fields:
+                value = sample.get(f)
+                if value is not None:
+                    self._last[f] = float(value)
+                self.data[f][i] = self._last[f]
+            self.version += 1
+
+    def latest(self):
+        """Último valor de cada campo (NaN si todavía no llegó)."""
+        with self._lock:
+            return dict(self._last)
+
+    def series(self, field, n=None):
+        """(tiempos, valores) de las últimas `n` muestras (todas las guardadas si n es None), de la más vieja a la más nueva."""
+        with self._lock:
+            size = len(self)
+            n = size if n is None else min(n, size)
+            start = (self.version - n) % self.capacity
+            idx = [(start + k) % self.capacity for k in range(n)]
+            column = self.data[field]
+            return [self.times[i] for i in idx], [column[i] for i in idx]
+
+    def clear(self):
+        with self._lock:
+            self.version = 0
+            self._last = {f: math.nan for f in self.fields}
@@ -0,0 +1,161 @@
+"""
+Recorrido estimado del robot (navegación por estima) a partir de los pasos compilados de una secuencia,
+con NumPy: rumbo y posición son sumas acumuladas sobre todos los pasos a la vez.
+
+Modelo, el mismo que supone Sequence.compile():
+    - avance/reversa a una velocidad lineal proporcional al PWM del paso (scale_speed: (vel-1)/8*227+28),
+      MAX_SPEED_CM_S a PWM 255; sin velocidad (main.py) se usa la de DEFAULT_SPEED;
+    - giro en el sitio a TURN_DEG_S (90° por cada 1000 ms, como calcula el retardo de Izquierda/Derecha);
+    - Esperar, Detener y las paradas intercaladas no mueven el robot;
+    - un paso sin comando (Velocidad, marcas del optimizador) no envía nada: el robot sigue con el anterior.
+
+Se integran a lo sumo MAX_STEPS pasos: un Repetir 99 dentro de otro daría un millón de pasos por tecla;
+más allá el recorrido se corta y el recuadro lo indica.
+"""
+from itertools import islice
+import numpy as np
+from protocolo import scale_speed
+
+MAX_SPEED_CM_S = 40.0
+TURN_DEG_S = 90.0
+DEFAULT_SPEED = 5
+MAX_STEPS = 20000
+CODES = {"F": 1, "B": 2, "L": 3, "R": 4, None: -1}  # "S" vale 0: quieto; None sigue con el paso anterior
+
+
+def step_arrays(steps):
+    """(código, pwm, duración en s) de cada paso como arrays."""
+    n = len(steps)
+    codes = np.fromiter((CODES.get(st.cmd, 0) for st in steps), dtype=np.int8, count=n)
+    default = scale_speed(DEFAULT_SPEED)
+    pwm = np.fromiter((default if st.speed is None else st.speed for st in steps), dtype=np.float64, count=n)
+    secs = np.fromiter((st.duration_ms for st in steps), dtype=np.float64, count=n) / 1000
+    # los pasos sin comando copian código y pwm del último que lo tiene (quieto si no hay ninguno antes)
+    held = codes >= 0
+    last = np.maximum.accumulate(np.where(held, np.arange(n), 0))
+    codes, pwm = np.where(held[last], codes[last], 0).astype(np.int8), pwm[last]
+    return codes, pwm, secs
+
+
+def integrate(codes, pwm, secs, start=(0.0, 0.0, 0.0)):
+    """
+    Posición (cm) y rumbo (radianes, 0 = hacia arriba en el lienzo, positivo a la izquierda) al final de cada paso,
+    partiendo de start = (x, y, rumbo). Devuelve (x, y, rumbo), arrays del largo de los pasos.
+    """
+    x0, y0, h0 = start
+    turn = np.radians(TURN_DEG_S) * secs * ((codes == 3).astype(np.float64) - (codes == 4))
+    heading = h0 + np.cumsum(turn)
+    dist = pwm / 255 * MAX_SPEED_CM_S * secs * ((codes == 1).astype(np.float64) - (codes == 2))
+    # en un paso de avance el rumbo no cambia: el acumulado hasta ese paso es el de la marcha.
+    # En el lienzo la y crece hacia abajo.
+    x = x0 - np.cumsum(dist * np.sin(heading))
+    y = y0 - np.cumsum(dist * np.cos(heading))
+    return x, y, heading
+
+
+class Trajectory:
+    """
+    Recorrido de una secuencia con recálculo incremental: update(steps) compara los pasos nuevos con los
+    anteriores (vectorizado) y solo integra desde el primero que cambió, partiendo del estado ya calculado.
+    steps puede ser un iterador perezoso (Sequence.steps()): solo se leen los primeros `limit` pasos y
+    `truncated` indica si quedaban más.
+    """
+
+    def __init__(self, limit=MAX_STEPS):
+        self.limit = limit
+        self.truncated = False
+        self.codes = np.zeros(0, dtype=np.int8)
+        self.pwm = np.zeros(0)
+        self.secs = np.zeros(0)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.heading = np.zeros(0)
+        self.recomputed_from = 0  # primer paso recalculado en el último update (para medir)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def update(self, steps):
+        steps = list(islice(steps, self.limit + 1))
+        self.truncated = len(steps) > self.limit
+        codes, pwm, secs = step_arrays(steps[:self.limit])
+        n = min(len(codes), len(self.codes))
+        same = (codes[:n] == self.codes[:n]) & (pwm[:n] == self.pwm[:n]) & (secs[:n] == self.secs[:n])
+        first = n if same.all() else int(np.argmin(same))
+        self.recomputed_from = first
+        if first == len(codes) == len(self.codes):
+            return False
+        start = (self.x[first - 1], self.y[first - 1], self.heading[first - 1]) if first else (0.0, 0.0, 0.0)
+        x, y, heading = integrate(codes[first:], pwm[first:], secs[first:], start)
+        self.x = np.concatenate((self.x[:first], x))
+        self.y = np.concatenate((self.y[:first], y))
+        self.heading = np.concatenate((self.heading[:first], heading))
+        self.codes, self.pwm, self.secs = codes, pwm, secs
+        return True
+
+    def points(self):
+        """Vértices del recorrido desde el origen, como array (n+1, 2), sin los pasos que no mueven."""
+        moving = (self.codes == 1) | (self.codes == 2)
+        xy = np.column_stack((self.x[moving], self.y[moving]))
+        return np.vstack(([[0.0, 0.0]], xy))
+
+    def fit(self, box, margin=12):
+        """Coordenadas planas para canvas.coords() ajustadas (escala uniforme) dentro de box = (x1, y1, x2, y2)."""
+        pts = self.points()
+        x1, y1, x2, y2 = box
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        span = np.maximum(hi - lo, 1.0)
+        scale = min((x2 - x1 - 2 * margin) / span[0], (y2 - y1 - 2 * margin) / span[1], 3.0)
+        center = np.array(((x1 + x2) / 2, (y1 + y2) / 2)) - (lo + hi) / 2 * scale
+        return (pts * scale + center).ravel().tolist()
+
+
+class PathOverlay:
+    """
+    Recorrido dibujado en una esquina de un lienzo: un recuadro, una línea y el punto de partida,
+    creados una vez; cada show() solo cambia coordenadas. hide() lo oculta.
+    """
+
+    def __init__(self, canvas, size=(260, 200), tag="trayectoria"):
+        self.canvas = canvas
+        self.size = size
+        self.tag = tag
+        self.items = None
+
+    def _create(self):
+        c, t = self.canvas, self.tag
+        self.items = {
+            "box": c.create_rectangle(0, 0, 0, 0, fill="#ffffff", outline="#7209b7", width=2, stipple="gray50", tags=t),
+            "title": c.create_text(0, 0, anchor="nw", text="Recorrido estimado", fill="#7209b7",
+                                   font=("Arial Rounded MT Bold", 10), tags=t),
+            "line": c.create_line(0, 0, 0, 0, fill="#f77f00", width=3, arrow="last", capstyle="round", tags=t),
+            "start": c.create_oval(0, 0, 0, 0, fill="#38b000", outline="", tags=t),
+        }
+
+    def show(self, trajectory, label=None):
+        if self.items is None:
+            self._create()
+        c = self.canvas
+        # esquina superior derecha de la zona visible del lienzo
+        right = c.canvasx(c.winfo_width()) - 10
+        top = c.canvasy(0) + 10
+        w, h = self.size
+        box = (right - w, top, right, top + h)
+        c.coords(self.items["box"], *box)
+        c.coords(self.items["title"], box[0] + 6, box[1] + 4)
+        title = f"Recorrido estimado{': ' + label if label else ''}"
+        if trajectory.truncated:
+            title += f" (primeros {trajectory.limit} pasos)"
+        c.itemconfigure(self.items["title"], text=title)
+        coords = trajectory.fit((box[0], box[1] + 18, box[2], box[3]))
+        if len(coords) < 4:
+            coords = coords * 2  # sin movimiento: un punto
+        c.coords(self.items["line"], *coords)
+        sx, sy = coords[0], coords[1]
+        c.coords(self.items["start"], sx - 4, sy - 4, sx + 4, sy + 4)
+        c.itemconfigure(self.tag, state="normal")
+        c.tag_raise(self.tag)
+
+    def hide(self):
+        if self.items is not None:
+            self.canvas.itemconfigure(self.tag, state="hidden")
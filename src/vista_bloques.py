@@ -0,0 +1,234 @@
+"""
+Vistas de los bloques del lienzo de control.py.
+WidgetBlockView es la vista clásica (CTkFrame + selector + botón); CanvasBlockView dibuja el bloque
+con ítems ligeros del lienzo (imagen compartida + texto) y solo crea el selector real mientras se edita.
+Ambas exponen la misma interfaz: rect(), move(), show_value(), highlight(), unhighlight(), materialize(), destroy().
+"""
+import itertools
+import customtkinter as ctk
+
+_block_ids = itertools.count(1)
+
+BORDER = "#adb5bd"
+BLOCK_W, BLOCK_H = 150, 64
+
+
+def new_block_id():
+    return next(_block_ids)
+
+
+# --- segundos entre 1 y 10, giros en 45/90/180/360 --- (valores, valor inicial, ancho)
+PARAM_CHOICES = {
+    # escala 1..9 - interfaz muestra 1..9
+    "Velocidad": ([str(i) for i in range(1, 10)], "5", 60),
+    # segundos 1..10
+    "Adelante": ([str(i) for i in range(1, 11)], "1", 60),
+    "Reversa": ([str(i) for i in range(1, 11)], "1", 60),
+    "Esperar": ([str(i) for i in range(1, 11)], "1", 60),
+    # grados limitados a 45,90,180,360
+    "Izquierda": (["45", "90", "180", "360"], "90", 80),
+    "Derecha": (["45", "90", "180", "360"], "90", 80),
+    # vueltas 1..999 (modelo.MAX_REPEAT); nombres de subrutina libres (se sugieren A..D)
+    "Repetir": (["2", "3", "4", "5", "10", "20", "50", "100", "999"], "2", 60),
+    "Subrutina": (["A", "B", "C", "D"], "A", 70),
+    "Llamar": (["A", "B", "C", "D"], "A", 70),
+}
+
+
+def make_param_editor(parent, action):
+    """Selector del parámetro según el tipo de bloque (None si el bloque no tiene parámetro)."""
+    if action not in PARAM_CHOICES:
+        return None
+    values, default, width = PARAM_CHOICES[action]
+    entry = ctk.CTkComboBox(parent, values=values, width=width)
+    entry.set(default)
+    return entry
+
+
+class WidgetBlockView:
+    light = False
+
+    def __init__(self, app, blk, x, y):
+        self.app = app
+        self.canvas = app.seq_area
+        self.frame = ctk.CTkFrame(self.canvas, fg_color="#ffffff", corner_radius=10, border_width=2,
+                                  border_color=BORDER)
+        lbl = ctk.CTkLabel(self.frame, image=app.icons[blk["type"]], text="")
+        lbl.pack(side="left", padx=3)
+        self.entry = make_param_editor(self.frame, blk["type"])
+        if self.entry:
+            self.entry.pack(side="left", padx=2)
+        btn_del = ctk.CTkButton(self.frame, text="✖", width=20, fg_color="#c62828", hover_color="#a71d2a",
+                                command=lambda: app._delete_block(blk))
+        btn_del.pack(side="right", padx=2)
+
+        self.window_id = self.canvas.create_window(x, y, window=self.frame)
+        self.frame.bind("<B1-Motion>", lambda ev: app._drag_block(ev, blk))
+        self.frame.bind("<ButtonRelease-1>", lambda ev: app._drop_block(blk))
+
+    def initial_value(self):
+        return self.entry.get() if self.entry else None
+
+    def bind_model(self, model):
+        if self.entry:
+            self.app._bind_param(self.entry, model)
+
+    def show_value(self, value):
+        if self.entry and value is not None:
+            self.entry.set(str(value))
+
+    def rect(self):
+        # el tamaño real del frame se conoce tras el primer layout
+        return self.canvas.bbox(self.window_id)
+
+    def move(self, dx, dy):
+        self.canvas.move(self.window_id, dx, dy)
+
+    def highlight(self, color):
+        self.frame.configure(border_color=color, border_width=3)
+
+    def unhighlight(self):
+        self.frame.configure(border_color=BORDER, border_width=2)
+
+    def materialize(self):
+        pass
+
+    def dematerialize(self):
+        pass
+
+    def destroy(self):
+        self.canvas.delete(self.window_id)
+        self.frame.destroy()
+
+
+class CanvasBlockView:
+    """
+    Bloque dibujado con un rectángulo, la PhotoImage compartida del icono y un texto con el parámetro.
+    Fuera de la zona visible no existe ningún ítem (dematerialize); el selector se crea con doble clic
+    sobre el parámetro y se destruye al terminar la edición.
+    """
+    light = True
+
+    def __init__(self, app, blk, x, y):
+        self.app = app
+        self.canvas = app.seq_area
+        self.blk = blk
+        self.tag = f"blk{blk['id']}"
+        self.x1, self.y1 = x - BLOCK_W / 2, y - BLOCK_H / 2
+        self.outline = (BORDER, 2)
+        self.rect_item = None
+        self.text_item = None
+        self.editor = None
+        self._last = None
+
+    def initial_value(self):
+        choice = PARAM_CHOICES.get(self.blk["type"])
+        return choice[1] if choice else None
+
+    def bind_model(self, model):
+        pass  # el valor se copia al modelo al cerrar el selector
+
+    def show_value(self, value):
+        if self.text_item is not None:
+            self.canvas.itemconfigure(self.text_item, text=self._param_text())
+
+    def rect(self):
+        return (self.x1, self.y1, self.x1 + BLOCK_W, self.y1 + BLOCK_H)
+
+    def _param_text(self):
+        model = self.blk.get("model")
+        if model is None or model.spec is None:
+            return ""
+        value = "?" if model.value is None else model.value
+        return f"{value} {model.spec.unit}"
+
+    def materialize(self):
+        if self.rect_item is not None:
+            return
+        c, tag = self.canvas, self.tag
+        x1, y1, x2, y2 = self.rect()
+        color, width = self.outline
+        self.rect_item = c.create_rectangle(x1, y1, x2, y2, fill="#ffffff", outline=color, width=width, tags=(tag,))
+        c.create_image(x1 + 34, y1 + BLOCK_H / 2, image=self.app.icons.photo(self.blk["type"]), tags=(tag,))
+        self.text_item = c.create_text(x1 + 95, y1 + BLOCK_H / 2, text=self._param_text(),
+                                       font=("Arial Rounded MT Bold", 12), tags=(tag, tag + "p"))
+        c.create_text(x2 - 9, y1 + 9, text="✖", fill="#c62828", tags=(tag, tag + "x"))
+        c.tag_bind(tag, "<ButtonPress-1>", self._on_press)
+        c.tag_bind(tag, "<B1-Motion>", self._on_drag)
+        c.tag_bind(tag, "<ButtonRelease-1>", self._on_release)
+        c.tag_bind(tag + "p", "<Double-Button-1>", lambda ev: self.open_editor())
+        c.tag_bind(tag + "x", "<ButtonRelease-1>", lambda ev: self.app._delete_block(self.blk))
+
+    def dematerialize(self):
+        if self.rect_item is None or self.editor is not None:
+            return
+        self.canvas.delete(self.tag)
+        self.rect_item = self.text_item = None
+
+    def _on_press(self, ev):
+        self._last = (ev.x, ev.y)
+
+    def _on_drag(self, ev):
+        if self._last is None:
+            return
+        dx, dy = ev.x - self._last[0], ev.y - self._last[1]
+        self._last = (ev.x, ev.y)
+        self.app._move_block(self.blk, dx, dy, reorder=False)
+
+    def _on_release(self, ev):
+        if self._last is not None:
+            self._last = None
+            self.app._drop_block(self.blk)
+
+    def move(self, dx, dy):
+        self.x1 += dx
+        self.y1 += dy
+        if self.rect_item is not None:
+            self.canvas.move(self.tag, dx, dy)
+
+    def highlight(self, color):
+        self.outline = (color, 3)
+        if self.rect_item is not None:
+            self.canvas.itemconfigure(self.rect_item, outline=color, width=3)
+
+    def unhighlight(self):
+        self.outline = (BORDER, 2)
+        if self.rect_item is not None:
+            self.canvas.itemconfigure(self.rect_item, outline=BORDER, width=2)
+
+    # ---------- EDICIÓN ----------
+    def open_editor(self):
+        if self.editor is not None or self.rect_item is None:
+            return
+        self.app._close_editor()
+        entry = make_param_editor(self.canvas, self.blk["type"])
+        if entry is None:
+            return
+        model = self.blk["model"]
+        if model.value is not None:
+            entry.set(str(model.value))
+        entry.configure(command=lambda value: self.close_editor())
+        entry.bind("<Return>", lambda ev: self.close_editor())
+        x1, y1, x2, y2 = self.rect()
+        self._editor_window = self.canvas.create_window(x1 + 95, y1 + BLOCK_H / 2, window=entry,
+                                                       tags=(self.tag,))
+        self.editor = entry
+        self.app.editing = self
+
+    def close_editor(self):
+        if self.editor is None:
+            return
+        self.app._set_param(self.blk["model"], self.editor.get())
+        self.canvas.delete(self._editor_window)
+        self.editor.destroy()
+        self.editor = None
+        if self.app.editing is self:
+            self.app.editing = None
+        if self.text_item is not None:
+            self.canvas.itemconfigure(self.text_item, text=self._param_text())
+
+    def destroy(self):
+        if self.editor is not None:
+            self.close_editor()
+        self.canvas.delete(self.tag)
+        self.rect_item = self.text_item = None
@@ -0,0 +1,42 @@
+from itertools import islice
+import customtkinter as ctk
+from protocolo import compile_program
+from simulacion import dry_run, format_commands
+
+MAX_STEPS = 20000  # pasos que se simulan; un Repetir 999 dentro de otro daría millones en el hilo de Tk
+
+
+def show_preview(master, title, sequence):
+    """
+    Vista previa: ejecuta la secuencia (ya optimizada, como la ejecuta el motor) en seco con reloj virtual,
+    al instante y sin robot, y muestra la secuencia exacta de comandos con su instante, la duración total,
+    lo que ahorra el optimizador y si cabe para "Subir". Devuelve el texto de resumen para la barra de estado.
+    Con más de MAX_STEPS pasos (cuenta estática del intérprete) solo se simulan los primeros.
+    ValueError si Repetir/Subrutina/Fin no casan.
+    """
+    total = len(sequence.steps())
+    limit = MAX_STEPS if total > MAX_STEPS else None
+    commands, scheduler = dry_run(sequence.optimized(limit=limit), max_commands=MAX_STEPS)
+    total_s = scheduler.programmed_ms / 1000
+    saved_s = sum(st.duration_ms for st in islice(sequence.steps(), MAX_STEPS)) / 1000 - total_s
+    try:
+        upload = f"programa de {len(compile_program(sequence.upload_steps()))} bytes"
+    except ValueError as e:
+        upload = f"no se puede subir: {e}"
+    summary = f"👁 {len(commands)} comandos, {int(total_s // 60)}:{total_s % 60:04.1f} min"
+    if limit:
+        summary = f"👁 primeros {MAX_STEPS} de {total} pasos: {len(commands)} comandos, " \
+                  f"{int(total_s // 60)}:{total_s % 60:04.1f} min"
+    elif saved_s > 0:
+        summary += f" ({saved_s:.1f} s menos optimizado)"
+    summary += f", {upload}"
+
+    win = ctk.CTkToplevel(master)
+    win.title(f"Vista previa - {title}")
+    win.geometry("420x520")
+    ctk.CTkLabel(win, text=summary, wraplength=400, text_color="#0077b6").pack(pady=8)
+    box = ctk.CTkTextbox(win, font=("Courier", 12))
+    box.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+    box.insert("end", format_commands(commands) or "Sin comandos")
+    box.configure(state="disabled")
+    return summary